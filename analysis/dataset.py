@@ -6,7 +6,7 @@
     每一行 = 沿剥离方向每 1 mm 的一个力值采样点（单位 N）。
 
 本模块只依赖标准库 + numpy，提供：
-    - load_sample(path)         读取单个 CSV 为二维 ndarray [position, strip]
+    - load_sample(path)         读取单个 CSV 为二维 ndarray [position, strip]（纯数值文件向量化解析）
     - iter_samples(root)        惰性遍历全部试样
     - sample_metrics(matrix)    单试样的逐条带与整体统计
     - dataset_metrics(root)     全数据集统计（复现论文表 5-4）
@@ -16,7 +16,9 @@
 from __future__ import annotations
 
 import csv
+import io
 import os
+import re
 from dataclasses import dataclass, field
 from typing import Iterator
 
@@ -49,24 +51,58 @@ def _sample_kind(name: str) -> str:
     return "other"
 
 
+# 快速路径前提：仅含数字 / 分隔符 / nan / inf 字符（其余内容交给逐单元格解析）
+_FAST_CHARS = re.compile(r"[0-9eE+\-.,\r\n \tnaifNAIFtyTY]*")
+
+
 def load_sample(path: str) -> np.ndarray:
-    """读取单个 CSV 为二维数组 matrix[position_index, strip_index]（单位 N）。"""
+    """读取单个 CSV 为二维数组 matrix[position_index, strip_index]（单位 N）。
+
+    口径：跳过空行，忽略空单元格与非数值单元格，各行截断到最短行宽。
+    纯数值文件（可含行尾空单元格）整文件交由 numpy 的 C 解析器一次解析；
+    含引号、表头、中间空单元格等其它内容时回退逐单元格解析，两条路径结果一致。
+    """
+    with open(path, "rb") as f:
+        text = f.read().decode("utf-8-sig")
+    matrix = _parse_fast(text)
+    return matrix if matrix is not None else _parse_cells(text)
+
+
+def _parse_fast(text: str) -> np.ndarray | None:
+    """向量化解析；不满足快速路径前提时返回 None。"""
+    if not _FAST_CHARS.fullmatch(text):
+        return None
+    # 去掉行尾空单元格与空行（导出工具常见的行尾逗号）
+    lines = [s for s in (line.rstrip(" \t,") for line in text.splitlines()) if s]
+    if not lines:
+        return np.empty((0, 0), dtype=float)
+    widths = [s.count(",") + 1 for s in lines]
+    width = min(widths)
+    try:
+        # 空单元格 / 非数值单元格由 loadtxt 抛 ValueError，不会被静默解析
+        return np.loadtxt(lines, dtype=float, delimiter=",", comments=None, ndmin=2,
+                          usecols=None if width == max(widths) else range(width))
+    except ValueError:
+        return None
+
+
+def _parse_cells(text: str) -> np.ndarray:
+    """逐单元格解析（csv 模块 + float()），处理引号、表头、空单元格等一般情况。"""
     rows: list[list[float]] = []
-    with open(path, encoding="utf-8-sig", newline="") as f:
-        for raw in csv.reader(f):
-            if not raw or not any(c.strip() for c in raw):
+    for raw in csv.reader(io.StringIO(text, newline="")):
+        if not raw or not any(c.strip() for c in raw):
+            continue
+        vals: list[float] = []
+        for c in raw:
+            c = c.strip()
+            if c == "":
                 continue
-            vals: list[float] = []
-            for c in raw:
-                c = c.strip()
-                if c == "":
-                    continue
-                try:
-                    vals.append(float(c))
-                except ValueError:
-                    pass
-            if vals:
-                rows.append(vals)
+            try:
+                vals.append(float(c))
+            except ValueError:
+                pass
+        if vals:
+            rows.append(vals)
     if not rows:
         return np.empty((0, 0), dtype=float)
     width = min(len(r) for r in rows)
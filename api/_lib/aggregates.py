@@ -0,0 +1,204 @@
+"""逐条带运行聚合（strip_stats 表）。
+
+reveal 插入数据点时在同一语句内累加每条带的 计数 / 力值和 / 平方和 / 最小 / 最大 /
+合格点数 / 最大位移，停止试验与分析、报告接口据此直接得到统计量（O(条带数)），
+无需再对 data_points 做全量 MAX / AVG / STDDEV 扫描。
+
+合格点数 pass_count 按 PASS_THRESHOLD 累计；条带均值判定可使用任意阈值。
+其它阈值下的采样点合格数由 test_rollup 的 0.1 N 细粒度直方图后缀和得到，
+同样无需重新扫描原始数据点。
+
+生效阈值：请求参数 threshold > settings 表 pass_threshold > PASS_THRESHOLD。
+"""
+import math
+import threading
+import time
+
+from .db import query
+
+PASS_THRESHOLD = 70.0
+FINE_HIST_MAX = 200.0      # 细粒度直方图上限 N（超出计入溢出桶）
+FINE_HIST_BINS = 2000      # 0.1 N 分辨率
+SETTINGS_TTL = 30.0        # settings 表阈值的进程内缓存时间(s)
+
+_settings = {'at': None, 'threshold': PASS_THRESHOLD}
+_settings_lock = threading.Lock()
+
+
+def configured_threshold():
+    """settings 表 pass_threshold（进程内缓存 SETTINGS_TTL 秒；缺失或非法时取默认）。"""
+    with _settings_lock:
+        if _settings['at'] is not None and time.monotonic() - _settings['at'] < SETTINGS_TTL:
+            return _settings['threshold']
+    try:
+        row = query("SELECT setting_value FROM settings WHERE setting_key = 'pass_threshold'",
+                    fetchone=True)
+        value = float(row['setting_value']) if row else PASS_THRESHOLD
+        if not 0 < value <= 1000:
+            value = PASS_THRESHOLD
+    except (TypeError, ValueError):
+        value = PASS_THRESHOLD
+    with _settings_lock:
+        _settings.update(at=time.monotonic(), threshold=value)
+    return value
+
+
+def reset_configured_threshold():
+    with _settings_lock:
+        _settings['at'] = None
+
+
+def get_threshold(value=None):
+    """请求参数优先，否则取系统设置；非法请求值抛 ValueError。"""
+    if value in (None, ''):
+        return configured_threshold()
+    threshold = float(value)
+    if not 0 < threshold <= 1000:
+        raise ValueError('合格阈值须在 (0, 1000] N 内')
+    return threshold
+
+
+def threshold_bucket(threshold):
+    """阈值在细直方图上的桶号下标 k（force >= threshold ⇔ 桶号 >= k+1）；不在 0.1 N 网格上时为 None。"""
+    step = FINE_HIST_MAX / FINE_HIST_BINS
+    k = round(threshold / step)
+    if not 0 <= k <= FINE_HIST_BINS or abs(k * step - threshold) > 1e-9:
+        return None
+    return k
+
+
+def validate_threshold_setting(value):
+    """系统设置 pass_threshold 的校验：须在 (0, FINE_HIST_MAX] N 内且为 0.1 N 的整数倍，
+    使跨试验视图始终可由细直方图作答；非法时抛 ValueError。"""
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('合格阈值须为数值')
+    if not 0 < threshold <= FINE_HIST_MAX or threshold_bucket(threshold) is None:
+        raise ValueError(f'合格阈值须在 (0, {FINE_HIST_MAX:g}] N 内且为 0.1 N 的整数倍')
+    return threshold
+
+
+def pass_points(test_id, threshold):
+    """任意阈值下的采样点合格数：优先 test_rollup 细直方图后缀和，无汇总行时回退扫描。"""
+    k = threshold_bucket(threshold)
+    if k is not None:
+        # 数组下标从 1 开始，桶号 b 位于 fine_hist[b + 1]
+        row = query(
+            """SELECT (SELECT COALESCE(SUM(x), 0) FROM unnest(fine_hist[%s:]) AS x) AS pass_pts
+               FROM test_rollup WHERE test_id = %s AND fine_hist IS NOT NULL""",
+            (k + 2, test_id), fetchone=True)
+        if row:
+            return int(row['pass_pts'])
+    row = query(
+        "SELECT COUNT(*) AS pass_pts FROM data_points WHERE test_id = %s AND force_value >= %s",
+        (test_id, threshold), fetchone=True)
+    return int(row['pass_pts']) if row else 0
+
+
+def _std(n, s, ss):
+    """样本标准差（与 SQL STDDEV 一致，n<2 时为 None）。"""
+    if n < 2:
+        return None
+    return math.sqrt(max(0.0, (ss - s * s / n) / (n - 1)))
+
+
+def _r(x):
+    return round(x, 2) if x is not None else None
+
+
+STRIP_STATS_COLUMNS = """strip_number, n, sum_force, sum_sq, min_force, max_force,
+                  pass_count, max_position"""
+
+
+def test_summary(test_id, threshold=PASS_THRESHOLD):
+    """返回 (逐条带统计列表, 整体统计)，均由 strip_stats 汇总。"""
+    rows = query(
+        f"""SELECT {STRIP_STATS_COLUMNS}
+           FROM strip_stats WHERE test_id = %s ORDER BY strip_number""",
+        (test_id,), fetchall=True
+    ) or []
+    return summarize(rows, threshold, test_pass_points(test_id, threshold))
+
+
+def test_summaries(test_ids, threshold=PASS_THRESHOLD):
+    """批量版 test_summary：一次读取多个试验的 strip_stats -> {test_id: (逐条带统计, 整体统计)}。"""
+    ids = [int(t) for t in test_ids]
+    rows = query(
+        f"""SELECT test_id, {STRIP_STATS_COLUMNS}
+           FROM strip_stats WHERE test_id = ANY(%s) ORDER BY test_id, strip_number""",
+        (ids,), fetchall=True
+    ) or []
+    by_test = {t: [] for t in ids}
+    for r in rows:
+        by_test[int(r['test_id'])].append(r)
+    pts = pass_points_many(ids, threshold)
+    return {t: summarize(by_test[t], threshold, pts.get(t)) for t in ids}
+
+
+def pass_points_many(test_ids, threshold):
+    """批量合格点数 {test_id: n}；默认阈值返回空字典（由 pass_count 求和）。"""
+    if float(threshold) == PASS_THRESHOLD:
+        return {}
+    found = {}
+    k = threshold_bucket(threshold)
+    if k is not None:
+        rows = query(
+            """SELECT test_id, (SELECT COALESCE(SUM(x), 0) FROM unnest(fine_hist[%s:]) AS x) AS pass_pts
+               FROM test_rollup WHERE test_id = ANY(%s) AND fine_hist IS NOT NULL""",
+            (k + 2, list(test_ids)), fetchall=True) or []
+        found = {int(r['test_id']): int(r['pass_pts']) for r in rows}
+    for t in test_ids:
+        if t not in found:
+            found[t] = pass_points(t, threshold)
+    return found
+
+
+def test_pass_points(test_id, threshold):
+    """默认阈值返回 None（由 strip_stats.pass_count 求和），其它阈值查细直方图。"""
+    return None if float(threshold) == PASS_THRESHOLD else pass_points(test_id, threshold)
+
+
+def summarize(rows, threshold=PASS_THRESHOLD, pass_pts=None):
+    """strip_stats 行（按条带号升序）-> (逐条带统计列表, 整体统计)。
+
+    pass_pts 为该阈值下的采样点合格数；None 时取各条带 pass_count（默认阈值）之和。
+    """
+    strips = []
+    n_all = 0
+    s_all = ss_all = 0.0
+    pass_all = 0
+    mins, maxs = [], []
+    for r in rows:
+        n = int(r['n'])
+        s, ss = float(r['sum_force']), float(r['sum_sq'])
+        avg = s / n if n else 0.0
+        strips.append({
+            'strip_number': r['strip_number'],
+            'avg_force': _r(avg),
+            'max_force': _r(float(r['max_force'])),
+            'min_force': _r(float(r['min_force'])),
+            'std_force': _r(_std(n, s, ss)),
+            'total_displacement': _r(float(r['max_position'])),
+            'pass_fail': avg >= threshold,
+            'data_points': n,
+        })
+        n_all += n
+        s_all += s
+        ss_all += ss
+        pass_all += int(r['pass_count'])
+        mins.append(float(r['min_force']))
+        maxs.append(float(r['max_force']))
+
+    if pass_pts is not None:
+        pass_all = pass_pts
+    overall = {
+        'avg_force': _r(s_all / n_all) if n_all else None,
+        'max_force': _r(max(maxs)) if maxs else None,
+        'min_force': _r(min(mins)) if mins else None,
+        'std_force': _r(_std(n_all, s_all, ss_all)),
+        'total_points': n_all,
+        'strips_tested': len(strips),
+        'pass_rate': _r(100.0 * pass_all / n_all) if n_all else None,
+    }
+    return strips, overall
@@ -0,0 +1,68 @@
+"""单试验分析结果（data?action=analysis）：一条语句取回逐条带累加量与力值直方图。
+
+    - 逐条带 / 整体统计由 strip_stats 运行聚合还原（O(条带数)）；
+    - 直方图 width_bucket 分桶是唯一一次 data_points 扫描，累积分布由直方图累加；
+    - 两者在同一语句内以 json_agg 子查询返回，一次往返；
+    - 已完成试验的结果经 result_cache 两级缓存，重复访问不再读取 data_points。
+"""
+from .aggregates import PASS_THRESHOLD, STRIP_STATS_COLUMNS, summarize, test_pass_points
+from .db import query
+from .result_cache import cached
+
+HIST_MAX = 120.0
+HIST_BINS = 24
+
+
+def build_histogram(buckets):
+    """[(bucket, count)] -> (直方图, 累积分布)；越界桶（0 与 HIST_BINS+1）仅计入总数。"""
+    bin_w = HIST_MAX / HIST_BINS
+    counts = [0] * (HIST_BINS + 2)
+    for b, c in buckets:
+        b = int(b) if b is not None else 0
+        if 0 <= b < len(counts):
+            counts[b] += int(c)
+    histogram = []
+    cumulative = []
+    total = sum(counts) or 1
+    running = 0
+    for b in range(1, HIST_BINS + 1):
+        lo = round((b - 1) * bin_w, 1)
+        hi = round(b * bin_w, 1)
+        c = counts[b]
+        running += c
+        histogram.append({'range_min': lo, 'range_max': hi, 'count': c})
+        cumulative.append({'force': hi, 'cum_pct': round(100.0 * running / total, 2)})
+    return histogram, cumulative
+
+
+def compute_analysis(test_id, threshold=PASS_THRESHOLD):
+    row = query(
+        f"""SELECT
+              (SELECT COALESCE(json_agg(s ORDER BY s.strip_number), '[]'::json)
+                 FROM (SELECT {STRIP_STATS_COLUMNS} FROM strip_stats WHERE test_id = %s) s
+              ) AS strips,
+              (SELECT COALESCE(json_agg(json_build_array(h.bucket, h.count)), '[]'::json)
+                 FROM (SELECT width_bucket(force_value, 0, %s, %s) AS bucket, COUNT(*) AS count
+                       FROM data_points WHERE test_id = %s GROUP BY bucket) h
+              ) AS hist""",
+        (test_id, HIST_MAX, HIST_BINS, test_id), fetchone=True)
+
+    strip_stats, summary = summarize(row['strips'], threshold, test_pass_points(test_id, threshold))
+    histogram, cumulative = build_histogram(row['hist'])
+    pass_strips = len([s for s in strip_stats if s['pass_fail']])
+    return {
+        'strip_stats': strip_stats,
+        'histogram': histogram, 'cumulative': cumulative,
+        'overall_stats': {'overall_avg': summary['avg_force'], 'overall_max': summary['max_force'],
+                          'overall_min': summary['min_force'], 'overall_std': summary['std_force'],
+                          'total_points': summary['total_points'],
+                          'strips_tested': summary['strips_tested'],
+                          'pass_rate': summary['pass_rate']},
+        'pass_pie': {'pass': pass_strips, 'fail': len(strip_stats) - pass_strips},
+        'threshold': threshold,
+    }
+
+
+def test_analysis(test, threshold=PASS_THRESHOLD):
+    """test 为 tests 行；已完成试验经 result_cache 缓存。"""
+    return cached('analysis', test, threshold, lambda: compute_analysis(test['id'], threshold))
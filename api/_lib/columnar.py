@@ -0,0 +1,147 @@
+"""力-位数据列式导出：[position, strip] 矩阵（与 analysis/dataset.load_sample 同形）。
+
+    - npz：NumPy 归档，标准库直接写 .npy（无需 numpy），``np.load`` 即得 ndarray；
+    - parquet / arrow：宽表 position_mm + strip_<n> 列，依赖可选的 pyarrow，
+      未安装时 ArrowUnavailable。
+
+矩阵行 = 位置（各条带位置并集，升序），列 = 条带号（升序），缺失点为 NaN。
+"""
+import io
+import math
+import struct
+import sys
+import zipfile
+from array import array
+
+from .db import iter_query
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+
+class ArrowUnavailable(RuntimeError):
+    pass
+
+
+def load_matrix(test_id):
+    """服务端游标按 (strip_number, position_mm) 索引顺序读取，组装为行主序矩阵。
+
+    返回 {'position_mm': array('d'), 'strip_number': array('q'), 'force': array('d')}，
+    force 长度 = 位置数 × 条带数。
+    """
+    per_strip = {}
+    for rows in iter_query(
+            """SELECT strip_number, position_mm, force_value
+               FROM data_points WHERE test_id = %s
+               ORDER BY strip_number, position_mm, id""", (test_id,)):
+        for r in rows:
+            col = per_strip.setdefault(int(r['strip_number']), {})
+            col[float(r['position_mm'])] = float(r['force_value'])   # 同位置取最新
+
+    strips = sorted(per_strip)
+    positions = sorted({p for col in per_strip.values() for p in col})
+    row_of = {p: i for i, p in enumerate(positions)}
+    n_strip = len(strips)
+    force = array('d', [math.nan]) * (len(positions) * n_strip)
+    for j, s in enumerate(strips):
+        for p, f in per_strip[s].items():
+            force[row_of[p] * n_strip + j] = f
+    return {'position_mm': array('d', positions), 'strip_number': array('q', strips),
+            'force': force}
+
+
+def _le_bytes(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def npy_bytes(values, shape):
+    """将 array('d'/'q') 编码为 .npy（格式 1.0，C 顺序，小端）。"""
+    descr = {'d': '<f8', 'q': '<i8'}[values.typecode]
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': %r, }" % (descr, tuple(shape))
+    # 头部（含魔数与长度字段）按 64 字节对齐，以换行结尾
+    pad = -(len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+    header = (header + ' ' * pad + '\n').encode('latin1')
+    return NPY_MAGIC + struct.pack('<H', len(header)) + header + _le_bytes(values)
+
+
+def _shape(m, key):
+    if key == 'force':
+        return (len(m['position_mm']), len(m['strip_number']))
+    return (len(m[key]),)
+
+
+def write_npz(fileobj, matrices):
+    """matrices: [(test_id, matrix)]。单试验键为 force / position_mm / strip_number，
+    多试验加前缀 test_<id>_ 并附 test_ids。"""
+    single = len(matrices) == 1
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for test_id, m in matrices:
+            prefix = '' if single else f'test_{test_id}_'
+            for key in ('force', 'position_mm', 'strip_number'):
+                zf.writestr(f'{prefix}{key}.npy', npy_bytes(m[key], _shape(m, key)))
+        if not single:
+            ids = array('q', [int(t) for t, _ in matrices])
+            zf.writestr('test_ids.npy', npy_bytes(ids, (len(ids),)))
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ArrowUnavailable('服务端未安装 pyarrow，请改用 format=npz') from e
+    return pa
+
+
+def arrow_table(matrices):
+    """宽表：[test_id,] position_mm, strip_<n>...；多试验按条带号并集补空列。"""
+    pa = _pyarrow()
+    single = len(matrices) == 1
+    all_strips = sorted({int(s) for _, m in matrices for s in m['strip_number']})
+    cols = {name: [] for name in (([] if single else ['test_id']) + ['position_mm'] +
+                                  [f'strip_{s}' for s in all_strips])}
+    for test_id, m in matrices:
+        n_pos, n_strip = _shape(m, 'force')
+        force = m['force']
+        col_of = {int(s): j for j, s in enumerate(m['strip_number'])}
+        if not single:
+            cols['test_id'].extend([int(test_id)] * n_pos)
+        cols['position_mm'].extend(m['position_mm'])
+        for s in all_strips:
+            j = col_of.get(s)
+            out = cols[f'strip_{s}']
+            if j is None:
+                out.extend([None] * n_pos)
+            else:
+                out.extend(None if math.isnan(v) else v for v in force[j::n_strip])
+    fields = ([pa.field('test_id', pa.int64())] if not single else []) + \
+        [pa.field(name, pa.float64()) for name in cols if name != 'test_id']
+    return pa.Table.from_pydict(cols, schema=pa.schema(fields))
+
+
+def write_parquet(fileobj, matrices):
+    _pyarrow()
+    import pyarrow.parquet as pq
+    pq.write_table(arrow_table(matrices), fileobj, compression='zstd')
+
+
+def write_arrow(fileobj, matrices):
+    pa = _pyarrow()
+    table = arrow_table(matrices)
+    with pa.ipc.new_file(fileobj, table.schema) as writer:
+        writer.write_table(table)
+
+
+WRITERS = {
+    'npz': (write_npz, 'application/octet-stream', 'npz'),
+    'parquet': (write_parquet, 'application/vnd.apache.parquet', 'parquet'),
+    'arrow': (write_arrow, 'application/vnd.apache.arrow.file', 'arrow'),
+}
+
+
+def export_bytes(fmt, matrices):
+    writer, ctype, ext = WRITERS[fmt]
+    buf = io.BytesIO()
+    writer(buf, matrices)
+    return buf.getvalue(), ctype, ext
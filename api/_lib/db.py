@@ -1,77 +1,240 @@
+import itertools
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
 
+# 进程级连接池：Serverless 实例热启动期间复用连接，避免每条语句一次 TLS 握手
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '240'))    # 空闲超过即关闭(s)
+POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '20'))       # 空闲超过即先 SELECT 1(s)
+POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '10'))     # 池满时等待(s)
+STREAM_CHUNK_ROWS = 5000                                                   # 服务端游标每批行数
+
 
 def get_connection():
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
         raise Exception('DATABASE_URL environment variable is not set')
-    conn = psycopg2.connect(database_url, sslmode='require')
+    conn = psycopg2.connect(database_url, sslmode='require',
+                            keepalives=1, keepalives_idle=30, connect_timeout=10)
     return conn
 
 
-def query(sql, params=None, fetchone=False, fetchall=False):
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(sql, params)
-            if fetchone:
-                result = cur.fetchone()
-            elif fetchall:
-                result = cur.fetchall()
-            else:
-                result = None
-            conn.commit()
-            return result
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+class ConnectionPool:
+    """带健康检查、容量上限、空闲淘汰与断线重连的线程安全连接池。"""
 
+    def __init__(self, connect=None, max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, check_after=POOL_CHECK_AFTER,
+                 wait_timeout=POOL_WAIT_TIMEOUT):
+        self._connect = connect
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []      # [(conn, last_used)]，尾部为最近归还（LIFO 保持热连接）
+        self._size = 0       # 已建立的连接数（空闲 + 借出）
 
-def execute(sql, params=None):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            conn.commit()
+    def _evict_idle(self, now):
+        """在持锁状态下关闭超出空闲时限的连接，返回待关闭列表。"""
+        expired = [c for c, t in self._idle if now - t > self.idle_timeout]
+        if expired:
+            self._idle = [(c, t) for c, t in self._idle if now - t <= self.idle_timeout]
+            self._size -= len(expired)
+        return expired
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                expired = self._evict_idle(now)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    conn = last_used = None
+                elif now >= deadline:
+                    raise Exception('Database connection pool exhausted')
+                else:
+                    self._cond.wait(deadline - now)
+                    continue
+            for c in expired:
+                self._close_quietly(c)
+
+            if conn is None:
+                return self._open()
+            # 复用连接：久置后先做健康检查，失效则关闭并沿用其名额重连
+            if not conn.closed and (now - last_used < self.check_after or self._is_alive(conn)):
+                return conn
+            self._close_quietly(conn)
+            return self._open()
+
+    def _open(self):
+        try:
+            return (self._connect or get_connection)()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
             try:
-                return cur.rowcount
+                status = conn.get_transaction_status()
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
             except Exception:
-                return 0
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+                discard = True
+        if discard or conn.closed:
+            self._close_quietly(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
 
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for c, _ in idle:
+            self._close_quietly(c)
 
-def execute_many(sql, params_list):
-    conn = get_connection()
+
+_pool = ConnectionPool()
+
+
+@contextmanager
+def connection():
+    """从连接池借出连接；出现连接级错误时丢弃该连接，下次借出自动重连。"""
+    conn = _pool.getconn()
+    broken = False
     try:
-        with conn.cursor() as cur:
-            cur.executemany(sql, params_list)
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        _pool.putconn(conn, discard=broken or bool(conn.closed))
+
+
+_local = threading.local()
+
+
+@contextmanager
+def transaction():
+    """工作单元：块内 query/execute 等共用同一连接，退出时一次提交，异常则整体回滚。
+
+    可嵌套，内层直接并入最外层事务。
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+    with connection() as conn:
+        _local.conn = conn
+        try:
+            yield conn
             conn.commit()
+        finally:
+            _local.conn = None
+
+
+@contextmanager
+def _cursor(cursor_factory=None):
+    """事务内复用当前连接且不单独提交；事务外借出连接并逐条提交。"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        with conn.cursor(cursor_factory=cursor_factory) as cur:
+            yield cur
+        return
+    with connection() as conn:
+        with conn.cursor(cursor_factory=cursor_factory) as cur:
+            yield cur
+        conn.commit()
+
+
+def query(sql, params=None, fetchone=False, fetchall=False):
+    with _cursor(psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(sql, params)
+        if fetchone:
+            return cur.fetchone()
+        if fetchall:
+            return cur.fetchall()
+        return None
+
+
+_stream_ids = itertools.count(1)
+
+
+def iter_query(sql, params=None, chunk_size=STREAM_CHUNK_ROWS):
+    """服务端命名游标分批读取，逐批产出行列表；内存占用与结果集大小无关。
+
+    命名游标须在事务内使用：生成器运行期间独占一条连接（不写入线程本地的当前事务，
+    调用方在两批之间执行的 query/execute 与并行打开的其它流互不干扰），
+    读完即结束只读事务，中途关闭生成器则回滚并归还连接。
+    """
+    with connection() as conn:
+        name = f'pcs_stream_{next(_stream_ids)}'
+        with conn.cursor(name=name, cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.itersize = chunk_size
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        conn.commit()
+
+
+def execute(sql, params=None):
+    with _cursor() as cur:
+        cur.execute(sql, params)
+        try:
             return cur.rowcount
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        except Exception:
+            return 0
+
+
+def execute_many(sql, params_list):
+    with _cursor() as cur:
+        cur.executemany(sql, params_list)
+        return cur.rowcount
 
 
 def execute_returning(sql, params=None):
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(sql, params)
-            result = cur.fetchone()
-            conn.commit()
-            return result
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    with _cursor(psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(sql, params)
+        return cur.fetchone()
@@ -0,0 +1,109 @@
+"""条带 × 位置 力值热力图网格（对应 analysis/figures.fig_heatmap），由力值金字塔聚合得到。
+
+    - 概览：给定位置区间与最大列数，按 pyramid.choose_level 选层，一次读取区间内全部条带的桶；
+    - 瓦片：固定层级 level_mm 下第 tile 块（每块 TILE_BINS 列），大矩阵分块按需加载；
+    - 聚合：mean / min / max 取自金字塔桶，无需逐请求扫描 data_points
+      （未构建金字塔的运行中试验按同一分桶即时聚合）。
+
+网格为行主序 [strip, bin]，缺失单元为 NaN；二进制编码：
+    f32：float32 小端，NaN 表示缺失；
+    u16：uint16 小端，力值 / FORCE_SCALE_N × U16_MAX 量化，U16_MISSING 表示缺失。
+"""
+import math
+import struct
+
+from .db import query
+from .pyramid import LEVELS_MM, choose_level
+
+AGGREGATES = {'mean': 'mean_force', 'min': 'min_force', 'max': 'max_force'}
+LIVE_AGGREGATES = {'mean': 'AVG', 'min': 'MIN', 'max': 'MAX'}
+TILE_BINS = 256
+DEFAULT_MAX_BINS = 512
+FORCE_SCALE_N = 1000.0    # u16 量化满量程（S 型传感器 0–1000 N）
+U16_MAX = 65534
+U16_MISSING = 65535
+
+
+def _extent(test_id):
+    rows = query(
+        "SELECT strip_number, max_position FROM strip_stats WHERE test_id = %s ORDER BY strip_number",
+        (test_id,), fetchall=True) or []
+    strips = [int(r['strip_number']) for r in rows]
+    stroke = max((float(r['max_position'] or 0) for r in rows), default=0.0)
+    return strips, stroke
+
+
+def _grid(test_id, strips, level, b_lo, b_hi, agg):
+    col = AGGREGATES[agg]
+    rows = query(
+        f"""SELECT strip_number, bucket, {col} AS v FROM force_pyramid
+            WHERE test_id = %s AND level_mm = %s AND bucket BETWEEN %s AND %s""",
+        (test_id, level, b_lo, b_hi), fetchall=True)
+    source = 'pyramid'
+    if not rows and not query("SELECT 1 FROM force_pyramid WHERE test_id = %s LIMIT 1",
+                              (test_id,), fetchone=True):
+        rows = query(
+            f"""SELECT strip_number, FLOOR(position_mm / %s)::int AS bucket,
+                       {LIVE_AGGREGATES[agg]}(force_value) AS v
+                FROM data_points
+                WHERE test_id = %s AND position_mm >= %s AND position_mm < %s
+                GROUP BY strip_number, bucket""",
+            (level, test_id, b_lo * level, (b_hi + 1) * level), fetchall=True)
+        source = 'live'
+
+    n_bins = b_hi - b_lo + 1
+    row_of = {s: i for i, s in enumerate(strips)}
+    grid = [math.nan] * (len(strips) * n_bins)
+    for r in rows:
+        i = row_of.get(int(r['strip_number']))
+        if i is not None:
+            grid[i * n_bins + int(r['bucket']) - b_lo] = float(r['v'])
+    return grid, source
+
+
+def heatmap(test_id, agg='mean', pos_from=None, pos_to=None, max_bins=DEFAULT_MAX_BINS,
+            level_mm=None, tile=None):
+    """返回网格与元数据；试验无数据时返回 None。
+
+    tile 给定时按 (level_mm, tile) 取固定瓦片（level_mm 缺省为 1 mm，非 LEVELS_MM 层级抛 ValueError），
+    否则按区间与 max_bins 取概览。
+    """
+    if tile is not None and level_mm is not None and level_mm not in LEVELS_MM:
+        raise ValueError(f"level_mm 须为 {'/'.join(map(str, LEVELS_MM))} 之一")
+    strips, stroke = _extent(test_id)
+    if not strips:
+        return None
+    if tile is not None:
+        level = int(level_mm) if level_mm is not None else LEVELS_MM[0]
+        b_lo = int(tile) * TILE_BINS
+        b_hi = b_lo + TILE_BINS - 1
+    else:
+        lo = max(0.0, float(pos_from)) if pos_from is not None else 0.0
+        hi = min(stroke, float(pos_to)) if pos_to is not None else stroke
+        hi = max(hi, lo)
+        level = choose_level(hi - lo, max(1, int(max_bins)))
+        b_lo, b_hi = int(lo // level), int(hi // level)
+
+    grid, source = _grid(test_id, strips, level, b_lo, b_hi, agg)
+    return {
+        'agg': agg,
+        'level_mm': level,
+        'pos_from': b_lo * level,
+        'pos_to': (b_hi + 1) * level,
+        'stroke': stroke,
+        'tile': tile,
+        'tile_count': int(stroke // (level * TILE_BINS)) + 1,
+        'strips': strips,
+        'shape': [len(strips), b_hi - b_lo + 1],
+        'source': source,
+        'grid': grid,
+    }
+
+
+def encode(grid, fmt):
+    """网格二进制编码（f32 / u16，小端）。"""
+    if fmt == 'f32':
+        return struct.pack(f'<{len(grid)}f', *grid)
+    q = [U16_MISSING if math.isnan(v) else
+         min(U16_MAX, max(0, int(round(v / FORCE_SCALE_N * U16_MAX)))) for v in grid]
+    return struct.pack(f'<{len(q)}H', *q)
@@ -0,0 +1,32 @@
+"""键集（keyset）分页游标。
+
+游标是上一页最后一行排序键的不透明编码（base64url(JSON)），下一页以
+``(键...) > (游标...)`` 续取，命中复合索引直接定位，翻页代价与深度无关（不使用 OFFSET）。
+DECIMAL 键按字符串编码，避免浮点往返误差。
+"""
+import base64
+import binascii
+import json
+from decimal import Decimal
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(v) if isinstance(v, Decimal) else v for v in values],
+                     separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """解码为长度为 size 的键列表；格式非法抛 InvalidCursor。"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor('无效的分页游标') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('无效的分页游标')
+    return values
@@ -0,0 +1,160 @@
+"""回放调度器：按墙钟与剥离速度推进运行中试验，与客户端轮询解耦。
+
+    - 每个运行中试验一个 tick 循环（守护线程），周期 TICK_SECONDS；
+    - 目标位置只取决于数据库时钟下的已运行时长与 peel_speed，与观看者数量、
+      轮询频率无关；漏掉的 tick 会在下一次一并补齐；
+    - 推进在 ``SELECT ... FOR UPDATE SKIP LOCKED`` 行锁内完成：同一试验同时只有一个推进者，
+      其余直接跳过（由持锁者补齐），不会重复写入 data_points；
+    - 行锁只覆盖揭示与位置更新；完成时的金字塔 / 汇总行 / 试验汇总在提交后构建，
+      停止 / 中止不会被长时间阻塞；
+    - 常驻进程（本地 / 普通服务器）：realtime_poll / realtime_stream 只读，仅确保本实例已有
+      该试验的 tick 循环；
+    - Vercel 等响应后即冻结实例的平台（检测 VERCEL 环境变量）：不启动 tick 线程，
+      realtime_poll 每次请求前 catch_up 一次按墙钟补齐；无人观看时试验在下次有人轮询
+      （或运行下述常驻进程）时补齐并完成。
+
+独立运行（扫描全部运行中试验并持续推进，无人观看时试验同样按时完成）：
+    python -m api._lib.playback
+"""
+import os
+import threading
+import time
+
+from .db import query, execute, transaction
+from .pyramid import build_pyramid
+from .rollup import build_rollup
+from .simulator import PLAYBACK_POLLS, compute_test_summary, get_replay_template, reveal
+
+TICK_SECONDS = 0.2                 # 推进周期，与前端刷新间隔一致
+STANDARD_PEEL_SPEED = 10.0         # 标准剥离速度 mm/min，对应完整回放 PLAYBACK_SECONDS
+PLAYBACK_SECONDS = PLAYBACK_POLLS * TICK_SECONDS
+WORKER_SCAN_SECONDS = 1.0
+INLINE_PLAYBACK = bool(os.environ.get('VERCEL'))   # 实例在响应后冻结，不能依赖后台线程
+
+
+def target_position(total_mm, peel_speed, elapsed_s):
+    """墙钟目标位置：标准速度下 PLAYBACK_SECONDS 走完全程，按 peel_speed 等比例缩放。"""
+    speed = float(peel_speed or STANDARD_PEEL_SPEED)
+    rate = float(total_mm) / PLAYBACK_SECONDS * (speed / STANDARD_PEEL_SPEED)
+    return min(float(total_mm), max(0.0, float(elapsed_s)) * rate)
+
+
+def advance(test_id):
+    """推进一次至墙钟目标位置；返回 False 表示试验已不在运行。
+
+    试验行被其它推进者锁住时跳过本次（由持锁者补齐）。
+    """
+    with transaction():
+        test = query(
+            """SELECT id, is_running, current_position, total_positions, peel_speed, start_time,
+                      EXTRACT(EPOCH FROM NOW() - start_time) AS elapsed
+               FROM tests WHERE id = %s FOR UPDATE SKIP LOCKED""",
+            (test_id,), fetchone=True
+        )
+        if not test:
+            row = query("SELECT is_running FROM tests WHERE id = %s", (test_id,), fetchone=True)
+            return bool(row and row['is_running'])
+        if not test['is_running']:
+            return False
+
+        template = get_replay_template(int(test_id), test['start_time'])
+        total_mm = float(test['total_positions'] or 0) or (
+            float(template['max_pos']) if template and template.get('max_pos') else 600.0)
+        current = float(test['current_position'] or 0)
+
+        if not template or 'replay' not in template:
+            # 缺少真实回放模板，直接结束以避免空跑
+            execute("""UPDATE tests SET is_running=FALSE, status='completed',
+                       end_time=NOW() WHERE id=%s""", (test_id,))
+            return False
+        completed = current >= total_mm
+        if completed:
+            execute("""UPDATE tests SET is_running=FALSE, status='completed',
+                       end_time=NOW() WHERE id=%s""", (test_id,))
+        else:
+            new_pos = target_position(total_mm, test['peel_speed'], test['elapsed'] or 0)
+            if new_pos > current:
+                reveal(int(test_id), template, current, new_pos)
+                execute("UPDATE tests SET current_position=%s WHERE id=%s", (new_pos, test_id))
+            return True
+
+    # 行锁已释放：完成后的聚合构建各自成事务
+    build_pyramid(int(test_id))
+    build_rollup(int(test_id))
+    compute_test_summary(int(test_id))
+    return False
+
+
+def catch_up(test_id):
+    """请求路径上的补齐（仅 INLINE_PLAYBACK 平台）；失败留待下次请求按墙钟补齐。"""
+    if not INLINE_PLAYBACK:
+        return
+    try:
+        advance(test_id)
+    except Exception as e:
+        print('playback catch-up:', e)
+
+
+class PlaybackScheduler:
+    """进程内调度器：每个运行中试验至多一个 tick 循环。"""
+
+    def __init__(self, tick=TICK_SECONDS, enabled=True):
+        self.tick = tick
+        self.enabled = enabled   # 冻结实例的平台上不启动 tick 线程（改由 catch_up 推进）
+        self._loops = {}     # test_id -> threading.Event（置位即停止）
+        self._lock = threading.Lock()
+
+    def ensure(self, test_id):
+        """确保本实例已在推进该试验（幂等）。"""
+        if not self.enabled:
+            return
+        tid = int(test_id)
+        with self._lock:
+            if tid in self._loops:
+                return
+            stop = threading.Event()
+            self._loops[tid] = stop
+        threading.Thread(target=self._run, args=(tid, stop), daemon=True).start()
+
+    def stop(self, test_id):
+        with self._lock:
+            stop = self._loops.pop(int(test_id), None)
+        if stop:
+            stop.set()
+
+    def running(self):
+        with self._lock:
+            return sorted(self._loops)
+
+    def _run(self, test_id, stop):
+        try:
+            while not stop.wait(self.tick):
+                try:
+                    if not advance(test_id):
+                        break
+                except Exception:
+                    # 瞬时数据库错误：下一 tick 按墙钟补齐，无需重放本次
+                    continue
+        finally:
+            with self._lock:
+                if self._loops.get(test_id) is stop:
+                    del self._loops[test_id]
+
+
+scheduler = PlaybackScheduler(enabled=not INLINE_PLAYBACK)
+
+
+def run_worker():
+    """常驻推进进程：周期扫描运行中试验并为其启动 tick 循环。"""
+    scheduler.enabled = True    # 常驻进程本身即可承载 tick 线程
+    while True:
+        try:
+            for row in query("SELECT id FROM tests WHERE is_running", fetchall=True) or []:
+                scheduler.ensure(row['id'])
+        except Exception as e:
+            print('playback worker:', e)
+        time.sleep(WORKER_SCAN_SECONDS)
+
+
+if __name__ == '__main__':
+    run_worker()
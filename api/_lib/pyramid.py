@@ -0,0 +1,92 @@
+"""逐条带多分辨率力值金字塔（force_pyramid 表），供长行程曲线缩放浏览。
+
+每层按固定位置桶宽（LEVELS_MM）聚合 最小 / 最大 / 均值 / 点数，试验完成或种子入库时
+一次构建。区间查询按 (区间长度 / 目标点数) 选取最细的可用层，只读取区间内的桶，
+返回点数不超过目标点数，缩放代价与试验总长度无关。
+"""
+from .db import execute, query, transaction
+
+LEVELS_MM = (1, 4, 16, 64, 256, 1024)
+DEFAULT_MAX_POINTS = 800
+
+# 全部层级一次扫描聚合（init_db 回填亦复用）
+PYRAMID_INSERT = f"""INSERT INTO force_pyramid
+    (test_id, strip_number, level_mm, bucket, min_force, max_force, mean_force, n)
+SELECT test_id, strip_number, lv.level, FLOOR(position_mm / lv.level)::int AS bucket,
+       MIN(force_value), MAX(force_value), AVG(force_value), COUNT(*)
+FROM data_points CROSS JOIN unnest(ARRAY[{','.join(map(str, LEVELS_MM))}]) AS lv(level)"""
+
+
+def build_pyramid(test_id):
+    """（重新）构建单个试验的全部层级。"""
+    with transaction():
+        execute("DELETE FROM force_pyramid WHERE test_id = %s", (test_id,))
+        return execute(
+            f"""{PYRAMID_INSERT}
+                WHERE test_id = %s
+                GROUP BY test_id, strip_number, lv.level, bucket""",
+            (test_id,))
+
+
+def choose_level(span_mm, max_points):
+    """区间内桶数不超过 max_points 的最细层；区间过长时取最粗层。"""
+    for level in LEVELS_MM:
+        if span_mm / level <= max_points:
+            return level
+    return LEVELS_MM[-1]
+
+
+def pyramid_range(test_id, strip_number, pos_from=None, pos_to=None,
+                  max_points=DEFAULT_MAX_POINTS):
+    """区间查询；条带无数据时返回 None。
+
+    未构建金字塔（运行中/历史试验）时按同一分桶规则对 data_points 区间即时聚合；
+    已构建但区间内无桶时返回空桶列表。
+    """
+    extent = query(
+        "SELECT max_position FROM strip_stats WHERE test_id = %s AND strip_number = %s",
+        (test_id, strip_number), fetchone=True)
+    if not extent or extent['max_position'] is None:
+        return None
+    stroke = float(extent['max_position'])
+    lo = max(0.0, float(pos_from)) if pos_from is not None else 0.0
+    hi = min(stroke, float(pos_to)) if pos_to is not None else stroke
+    hi = max(hi, lo)
+    level = choose_level(hi - lo, max(1, int(max_points)))
+    b_lo, b_hi = int(lo // level), int(hi // level)
+
+    rows = query(
+        """SELECT bucket, min_force, max_force, mean_force, n FROM force_pyramid
+           WHERE test_id = %s AND strip_number = %s AND level_mm = %s
+             AND bucket BETWEEN %s AND %s
+           ORDER BY bucket""",
+        (test_id, strip_number, level, b_lo, b_hi), fetchall=True)
+    source = 'pyramid'
+    # 区间内无桶但金字塔已构建（区间越过数据末端等）时直接返回空结果，不回退扫描 data_points
+    if not rows and not query(
+            "SELECT 1 FROM force_pyramid WHERE test_id = %s AND strip_number = %s LIMIT 1",
+            (test_id, strip_number), fetchone=True):
+        rows = query(
+            """SELECT FLOOR(position_mm / %s)::int AS bucket,
+                      MIN(force_value) AS min_force, MAX(force_value) AS max_force,
+                      AVG(force_value) AS mean_force, COUNT(*) AS n
+               FROM data_points
+               WHERE test_id = %s AND strip_number = %s
+                 AND position_mm >= %s AND position_mm < %s
+               GROUP BY bucket ORDER BY bucket""",
+            (level, test_id, strip_number, b_lo * level, (b_hi + 1) * level), fetchall=True)
+        source = 'live'
+
+    return {
+        'strip_number': int(strip_number),
+        'level_mm': level,
+        'pos_from': lo,
+        'pos_to': hi,
+        'extent': [0.0, stroke],
+        'source': source,
+        'buckets': [{'position_mm': r['bucket'] * level,
+                     'min_force': round(float(r['min_force']), 4),
+                     'max_force': round(float(r['max_force']), 4),
+                     'mean_force': round(float(r['mean_force']), 4),
+                     'n': int(r['n'])} for r in rows],
+    }
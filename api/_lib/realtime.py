@@ -0,0 +1,141 @@
+"""实时力-位数据帧：realtime_poll（短轮询）与 realtime_stream（SSE）共用。
+
+一帧 = 试验状态 + 各条带最新值 + 最近数据点 + 汇总统计，附带 cursor（最新数据点 id）。
+客户端回传 cursor（since_id / Last-Event-ID）时仅返回其后新揭示的点（增量帧），
+首帧、cursor 已失效（试验被重启）或积压过多时回退全量快照。
+"""
+import collections
+import threading
+
+from .db import query, transaction
+from .playback import scheduler
+from .simulator import get_replay_template
+
+# 实时帧所需的 tests 列（不含体积较大的 profiles 回放模板，模板走进程内缓存）
+TEST_COLUMNS = """id, project_id, test_number, sample_name, operator, peel_speed, status,
+    ambient_temp, pipe_temp, humidity, notes, n_strips, total_positions,
+    current_position, max_force, pass_rate, is_running, start_time, end_time,
+    created_by, created_at"""
+
+HISTORY_LIMIT = 600   # 全量快照回传的最近数据点数（亦为增量上限，超出则回退全量）
+
+
+def parse_cursor(value):
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+def build_frame(test_id, since_id=None):
+    """组装一帧（只读）；试验不存在时返回 None。
+
+    回放推进由 playback 调度器按墙钟完成，此处仅确保本实例已为运行中试验启动 tick 循环
+    （无常驻进程的平台上为空操作，由 realtime_poll 先行 catch_up），观看者数量不影响推进速度。
+    """
+    # 全部读取共用一条连接
+    with transaction():
+        test = query(f"SELECT {TEST_COLUMNS} FROM tests WHERE id = %s", (test_id,), fetchone=True)
+        if not test:
+            return None
+        if test['is_running']:
+            scheduler.ensure(test_id)
+
+        total_mm = float(test['total_positions'] or 0)
+        if not total_mm:
+            template = get_replay_template(int(test_id), test['start_time'])
+            total_mm = float(template['max_pos']) if template and template.get('max_pos') else 600.0
+
+        # 各条带最新值（reveal 维护的 strip_latest，O(条带数)）
+        latest = query(
+            """SELECT data_point_id AS id, strip_number, position_mm, force_value, speed, timestamp
+               FROM strip_latest WHERE test_id = %s
+               ORDER BY strip_number""",
+            (test_id,), fetchall=True
+        )
+
+        delta = None
+        if since_id is not None and query(
+                "SELECT 1 FROM data_points WHERE id = %s AND test_id = %s",
+                (since_id, test_id), fetchone=True):
+            # cursor 所指数据点仍存在（试验未被重启）才可增量；积压过多则回退全量
+            delta = query(
+                """SELECT id, strip_number, position_mm, force_value, timestamp
+                   FROM data_points WHERE test_id = %s AND id > %s
+                   ORDER BY id DESC LIMIT %s""",
+                (test_id, since_id, HISTORY_LIMIT + 1), fetchall=True
+            )
+            if len(delta) > HISTORY_LIMIT:
+                delta = None
+
+        if delta is None:
+            recent_history = query(
+                """SELECT id, strip_number, position_mm, force_value, timestamp
+                   FROM data_points WHERE test_id = %s
+                   ORDER BY id DESC LIMIT %s""",
+                (test_id, HISTORY_LIMIT), fetchall=True
+            )
+
+    cur_pos = float(test['current_position'] or 0)
+    progress = min(100.0, cur_pos / total_mm * 100.0) if total_mm else 0.0
+    forces = [float(d['force_value']) for d in latest] if latest else []
+    total_force = sum(forces)
+    avg_force = total_force / len(forces) if forces else 0
+    max_force = max(forces, default=0)
+    cursor = max((int(d['id']) for d in latest or []), default=None)
+
+    if delta is None:
+        frame = {'delta': False, 'latest_data': latest, 'recent_history': recent_history}
+    else:
+        # 增量帧：仅回传 cursor 之后的新点，及其所在条带的最新值
+        changed = {d['strip_number'] for d in delta}
+        frame = {'delta': True,
+                 'latest_data': [d for d in latest if d['strip_number'] in changed],
+                 'recent_history': delta}
+        cursor = cursor or since_id
+
+    return {
+        'test': test,
+        'is_running': bool(test['is_running']),
+        'current_position': cur_pos,
+        'total_mm': total_mm,
+        'progress': round(progress, 2),
+        'cursor': cursor,
+        **frame,
+        'stats': {
+            'total_force': round(total_force, 2),
+            'avg_force': round(avg_force, 2),
+            'max_force': round(max_force, 2),
+            'active_strips': len([f for f in forces if f > 0]),
+        }
+    }
+
+
+class FrameBuffer:
+    """单个流式客户端的有界帧缓冲。
+
+    慢消费者导致缓冲写满时不阻塞生产者：丢弃全部积压的增量帧并返回 False，
+    由生产者改发一帧全量快照重新同步（增量帧不可跳过，全量帧可覆盖一切积压）。
+    """
+
+    def __init__(self, maxlen):
+        self.maxlen = max(1, int(maxlen))
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxlen:
+                self._items.clear()
+                return False
+            self._items.append(item)
+            self._cond.notify()
+            return True
+
+    def get(self, timeout):
+        """取出一帧；超时返回 None（调用方据此发送心跳）。"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
@@ -0,0 +1,69 @@
+"""已完成试验 Word 报告的内容寻址缓存（report_cache 表，BYTEA）。
+
+键 = sha256(报告模板版本 + 数据版本（试验 end_time）+ 合格阈值 + 报告所列试验/项目信息 REPORT_META_KEYS)：
+任一输入变化即换键，旧条目不再命中并随 LRU 淘汰；总字节数超过 REPORT_CACHE_MAX_MB 时
+按最近使用时间淘汰。运行中/未完成试验不缓存。
+"""
+import hashlib
+import json
+import os
+
+from .db import execute, query
+from .response import CustomEncoder
+from .result_cache import data_version
+
+# 报告正文渲染的试验/项目信息列；只对这些列取哈希，不序列化其余（如 profiles 回放模板）
+REPORT_META_KEYS = ('id', 'project_id', 'test_number', 'sample_name', 'operator', 'peel_speed',
+                    'status', 'n_strips', 'project_name', 'pipe_diameter', 'layer_width',
+                    'layer_thickness', 'location')
+
+CACHE_MAX_BYTES = int(float(os.environ.get('REPORT_CACHE_MAX_MB', '256')) * 1024 * 1024)
+
+# 保留最近使用的条目直至累计字节数达到上限，其余删除
+EVICT_SQL = """DELETE FROM report_cache WHERE cache_key IN (
+    SELECT cache_key FROM (
+        SELECT cache_key, SUM(size_bytes) OVER (ORDER BY last_used DESC, cache_key) AS running
+        FROM report_cache) r
+    WHERE r.running > %s)"""
+
+
+def report_key(test, threshold, template_version):
+    """test 为 tests ⋈ projects 行；未完成试验返回 None。"""
+    version = data_version(test)
+    if version is None:
+        return None
+    meta = json.dumps([test.get(k) for k in REPORT_META_KEYS], cls=CustomEncoder, ensure_ascii=False)
+    raw = f'{template_version}\n{version}\n{float(threshold)!r}\n{meta}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def load_report(key):
+    """命中返回 (字节流, 文件名) 并刷新最近使用时间，否则 None。"""
+    row = query(
+        """UPDATE report_cache SET last_used = NOW() WHERE cache_key = %s
+           RETURNING content, filename""", (key,), fetchone=True)
+    return (bytes(row['content']), row['filename']) if row else None
+
+
+def cached_keys(keys):
+    """批量探测：返回已缓存的键集合（不读取内容）。"""
+    keys = [k for k in keys if k]
+    if not keys:
+        return set()
+    rows = query("SELECT cache_key FROM report_cache WHERE cache_key = ANY(%s)",
+                 (keys,), fetchall=True) or []
+    return {r['cache_key'] for r in rows}
+
+
+def store_report(key, test_id, content, filename):
+    execute(
+        """INSERT INTO report_cache (cache_key, test_id, filename, content, size_bytes)
+           VALUES (%s, %s, %s, %s, %s)
+           ON CONFLICT (cache_key) DO UPDATE SET last_used = NOW()""",
+        (key, int(test_id), filename, content, len(content)))
+    execute(EVICT_SQL, (CACHE_MAX_BYTES,))
+
+
+def invalidate(test_id):
+    """清除某试验的全部报告缓存（重启试验时调用）。"""
+    execute("DELETE FROM report_cache WHERE test_id = %s", (int(test_id),))
@@ -0,0 +1,355 @@
+"""Word 报告内嵌图：剥离力-位移曲线、条带 × 位置热力图、力值分布直方图（对应 analysis/figures.py）。
+
+取数与绘图分离：
+    chart_data(test_id, strips)   主进程经数据库取降采样数据（可 pickle 的列表/字典）：
+                                  曲线取自力值金字塔（最弱条带，≤ CURVE_POINTS 桶），
+                                  热力图取自 heatmap 概览（≤ HEATMAP_BINS 列），
+                                  直方图由 test_rollup 细直方图合并为 HIST_BIN_N 宽的桶；
+    chart_data_many(items)        批量版：一批试验共 4 次查询，未构建金字塔/汇总的试验回退单份取数；
+    render_charts(data, threshold) 绘图，可在报告渲染进程中执行 -> [(标题, PNG 字节流)]。
+
+绘图复用进程内预设样式的 Figure（Agg 画布，不经 pyplot）：样式、字体与坐标轴在首次使用时
+一次建好，之后每次只更新数据，不再重复解析 rcParams / 字体，也不重建画布。
+matplotlib 为可选依赖：未安装时 AVAILABLE 为 False，报告不含图。
+
+字体：FONT_DIR 下的 .ttf/.otf（可放入随部署打包的中文字体子集）优先注册，其次查找系统中文字体；
+均不可用时（如 Vercel 镜像）图内文字改用英文，避免渲染为方框。FONT_TAG 计入报告模板版本，
+字体可用性变化时报告缓存随之换键。
+"""
+import glob
+import io
+import os
+import threading
+
+from .aggregates import FINE_HIST_BINS, FINE_HIST_MAX
+from .db import query
+from .heatmap import heatmap
+from .pyramid import choose_level, pyramid_range
+
+try:
+    import matplotlib
+    import numpy as np
+    from matplotlib import font_manager
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.colors import LinearSegmentedColormap
+    from matplotlib.figure import Figure
+    AVAILABLE = True
+except ImportError:
+    AVAILABLE = False
+
+CURVE_POINTS = 600
+HEATMAP_BINS = 300
+HIST_BIN_N = 2.0
+DPI = 110
+
+# 报告为白底打印版式，配色沿用 analysis/figures.py
+GRID = '#c8d6e5'
+TEXT = '#1f2d3d'
+CYAN = '#0891b2'
+BLUE = '#3b82f6'
+GREEN = '#059669'
+RED = '#dc2626'
+
+_figures = {}     # 图类型 -> (Figure, 可更新的图元)
+_lock = threading.Lock()
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+CJK_FAMILIES = ['Microsoft YaHei', 'SimHei', 'Noto Sans CJK SC', 'Noto Sans SC',
+                'Source Han Sans SC', 'WenQuanYi Micro Hei']
+
+# 图内文字：中文字体可用时用中文，否则用英文
+LABELS = {
+    'cjk': {
+        'position': '剥离位移 / mm', 'force': '剥离力 / N', 'strip': '条带编号', 'count': '采样点频数',
+        'curve_title': '最弱条带 #{strip} 剥离力-位移曲线（阴影为区间最小/最大，虚线为阈值 {threshold:g} N）',
+        'heatmap_title': '剥离力空间分布热力图（{rows} 条带，条带 × 位置均值）',
+        'hist_title': '剥离力幅值分布直方图（{bin:g} N 分桶，≥{threshold:g} N 约占 {pct:.1f}%）',
+    },
+    'ascii': {
+        'position': 'Peel displacement / mm', 'force': 'Peel force / N', 'strip': 'Strip no.',
+        'count': 'Samples',
+        'curve_title': 'Weakest strip #{strip} force vs displacement '
+                       '(band: bucket min/max, dotted: threshold {threshold:g} N)',
+        'heatmap_title': 'Peel force heatmap ({rows} strips, mean per strip x position)',
+        'hist_title': 'Peel force distribution ({bin:g} N bins, >= {threshold:g} N: {pct:.1f}%)',
+    },
+}
+
+
+def _cjk_font():
+    """注册 FONT_DIR 中的字体并返回首个可用的中文字体族名；无可用字体返回 None。"""
+    families = list(CJK_FAMILIES)
+    for path in sorted(glob.glob(os.path.join(FONT_DIR, '*.[ot]tf'))):
+        font_manager.fontManager.addfont(path)
+        families.insert(0, font_manager.FontProperties(fname=path).get_name())
+    for family in families:
+        try:
+            font_manager.findfont(font_manager.FontProperties(family=family), fallback_to_default=False)
+            return family
+        except ValueError:
+            continue
+    return None
+
+
+CJK_FONT = None
+if AVAILABLE:
+    CJK_FONT = _cjk_font()
+    if CJK_FONT:
+        matplotlib.rcParams['font.sans-serif'] = [CJK_FONT, 'DejaVu Sans']
+    else:
+        print('report charts: 未找到中文字体，图内文字使用英文（可将字体放入 api/_lib/fonts/）')
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    CMAP = LinearSegmentedColormap.from_list(
+        'peeling', ['#05192e', '#0e3a5f', '#1f7a8c', '#22d3ee', '#bdf3ff'])
+FONT_TAG = 'cjk' if CJK_FONT else 'ascii'
+L = LABELS[FONT_TAG]
+
+
+def _hist_counts(test_id):
+    """0.1 N 细直方图合并为 HIST_BIN_N 宽的桶；无汇总行时按同一分桶即时统计。"""
+    row = query("SELECT fine_hist FROM test_rollup WHERE test_id = %s AND fine_hist IS NOT NULL",
+                (test_id,), fetchone=True)
+    if row:
+        return _merge_hist(row['fine_hist'])
+    fine = [0] * (FINE_HIST_BINS + 2)
+    for r in query(
+            """SELECT width_bucket(force_value, 0, %s, %s) AS bucket, COUNT(*) AS count
+               FROM data_points WHERE test_id = %s GROUP BY bucket""",
+            (FINE_HIST_MAX, FINE_HIST_BINS, test_id), fetchall=True) or []:
+        fine[int(r['bucket'])] += int(r['count'])
+    return _merge_hist(fine)
+
+
+def _merge_hist(fine):
+    fine = [int(c) for c in fine]
+    per = round(HIST_BIN_N * FINE_HIST_BINS / FINE_HIST_MAX)
+    counts = [sum(fine[1 + i:1 + i + per]) for i in range(0, FINE_HIST_BINS, per)]
+    counts[0] += fine[0]
+    counts[-1] += fine[FINE_HIST_BINS + 1]
+    return counts
+
+
+def chart_data(test_id, strips):
+    """strips 为 summarize 的逐条带统计；无数据或未安装 matplotlib 时返回 None。"""
+    if not AVAILABLE or not strips:
+        return None
+    weakest = _weakest(strips)
+    curve = pyramid_range(test_id, weakest['strip_number'], max_points=CURVE_POINTS)
+    grid = heatmap(test_id, 'mean', max_bins=HEATMAP_BINS)
+    return {
+        'strip_number': weakest['strip_number'],
+        'curve': [(b['position_mm'], b['min_force'], b['mean_force'], b['max_force'])
+                  for b in curve['buckets']] if curve else None,
+        'heatmap': {k: grid[k] for k in ('grid', 'shape', 'pos_from', 'pos_to', 'strips')}
+        if grid else None,
+        'hist': _hist_counts(test_id),
+    }
+
+
+def _weakest(strips):
+    return min(strips, key=lambda s: s['avg_force'] if s['avg_force'] is not None else 0)
+
+
+def chart_data_many(items):
+    """items 为 [(test_id, strips)] -> {test_id: chart_data 结果}，与逐份 chart_data 同形。
+
+    条带行程、热力图桶、最弱条带曲线桶与细直方图各一次查询（按 unnest 参数数组连接 force_pyramid），
+    取全行程概览，选层规则与 pyramid_range / heatmap 相同。
+    """
+    items = [(int(t), strips) for t, strips in items if strips]
+    if not AVAILABLE or not items:
+        return {}
+    ids = [t for t, _ in items]
+    extents = {t: {} for t in ids}
+    for r in query("""SELECT test_id, strip_number, max_position FROM strip_stats
+                      WHERE test_id = ANY(%s) ORDER BY test_id, strip_number""",
+                   (ids,), fetchall=True) or []:
+        extents[int(r['test_id'])][int(r['strip_number'])] = r['max_position']
+
+    plan = {}
+    for t, strips in items:
+        ext = extents[t]
+        stroke = max((float(v or 0) for v in ext.values()), default=0.0)
+        weakest = _weakest(strips)['strip_number']
+        strip_stroke = ext.get(int(weakest))
+        h_level = choose_level(stroke, HEATMAP_BINS)
+        c_level = choose_level(float(strip_stroke), CURVE_POINTS) if strip_stroke is not None else None
+        plan[t] = {'strips': list(ext), 'weakest': weakest, 'h_level': h_level,
+                   'h_hi': int(stroke // h_level), 'c_level': c_level,
+                   'c_hi': int(float(strip_stroke) // c_level) if c_level else None}
+
+    grid_rows = {t: [] for t in ids}
+    for r in query(
+            """SELECT p.test_id, p.strip_number, p.bucket, p.mean_force AS v
+               FROM force_pyramid p
+               JOIN unnest(%s::int[], %s::int[], %s::int[]) AS q(test_id, level_mm, b_hi)
+                 ON p.test_id = q.test_id AND p.level_mm = q.level_mm AND p.bucket BETWEEN 0 AND q.b_hi""",
+            (ids, [plan[t]['h_level'] for t in ids], [plan[t]['h_hi'] for t in ids]),
+            fetchall=True) or []:
+        grid_rows[int(r['test_id'])].append(r)
+
+    curved = [t for t in ids if plan[t]['c_level'] and grid_rows[t]]
+    curve_rows = {t: [] for t in curved}
+    if curved:
+        for r in query(
+                """SELECT p.test_id, p.bucket, p.min_force, p.max_force, p.mean_force
+                   FROM force_pyramid p
+                   JOIN unnest(%s::int[], %s::int[], %s::int[], %s::int[])
+                        AS q(test_id, strip_number, level_mm, b_hi)
+                     ON p.test_id = q.test_id AND p.strip_number = q.strip_number
+                    AND p.level_mm = q.level_mm AND p.bucket BETWEEN 0 AND q.b_hi
+                   ORDER BY p.test_id, p.bucket""",
+                (curved, [int(plan[t]['weakest']) for t in curved],
+                 [plan[t]['c_level'] for t in curved], [plan[t]['c_hi'] for t in curved]),
+                fetchall=True) or []:
+            curve_rows[int(r['test_id'])].append(r)
+
+    hists = {int(r['test_id']): _merge_hist(r['fine_hist']) for r in query(
+        "SELECT test_id, fine_hist FROM test_rollup WHERE test_id = ANY(%s) AND fine_hist IS NOT NULL",
+        (ids,), fetchall=True) or []}
+
+    out = {}
+    for t, strips in items:
+        p = plan[t]
+        if not grid_rows[t]:
+            # 未构建金字塔（运行中/历史试验）：逐份即时聚合
+            out[t] = chart_data(t, strips)
+            continue
+        n_bins = p['h_hi'] + 1
+        row_of = {s: i for i, s in enumerate(p['strips'])}
+        grid = [float('nan')] * (len(p['strips']) * n_bins)
+        for r in grid_rows[t]:
+            i = row_of.get(int(r['strip_number']))
+            if i is not None:
+                grid[i * n_bins + int(r['bucket'])] = float(r['v'])
+        out[t] = {
+            'strip_number': p['weakest'],
+            'curve': [(r['bucket'] * p['c_level'], round(float(r['min_force']), 4),
+                       round(float(r['mean_force']), 4), round(float(r['max_force']), 4))
+                      for r in curve_rows[t]] if p['c_level'] else None,
+            'heatmap': {'grid': grid, 'shape': [len(p['strips']), n_bins], 'pos_from': 0,
+                        'pos_to': n_bins * p['h_level'], 'strips': p['strips']},
+            'hist': hists[t] if t in hists else _hist_counts(t),
+        }
+    return out
+
+
+def _new_figure(size):
+    fig = Figure(figsize=size, dpi=DPI, facecolor='white')
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(left=0.08, right=0.97, bottom=0.16, top=0.88)
+    ax = fig.add_subplot()
+    for spine in ax.spines.values():
+        spine.set_color(GRID)
+    ax.tick_params(colors=TEXT, labelsize=8)
+    ax.grid(True, color=GRID, alpha=0.6, linewidth=0.6)
+    ax.title.set_fontsize(10)
+    return fig, ax
+
+
+def _figure(kind):
+    if kind not in _figures:
+        _figures[kind] = {'curve': _curve_figure, 'heatmap': _heatmap_figure,
+                          'hist': _hist_figure}[kind]()
+    return _figures[kind]
+
+
+def _curve_figure():
+    fig, ax = _new_figure((8, 3.0))
+    ax.set_xlabel(L['position'], color=TEXT, fontsize=9)
+    ax.set_ylabel(L['force'], color=TEXT, fontsize=9)
+    mean, = ax.plot([], [], color=CYAN, lw=1.0)
+    limit = ax.axhline(0, color=RED, ls=':', lw=1)
+    return fig, {'ax': ax, 'mean': mean, 'limit': limit, 'band': None}
+
+
+def _heatmap_figure():
+    fig, ax = _new_figure((8, 3.4))
+    fig.subplots_adjust(right=0.9)
+    ax.grid(False)
+    ax.set_xlabel(L['position'], color=TEXT, fontsize=9)
+    ax.set_ylabel(L['strip'], color=TEXT, fontsize=9)
+    im = ax.imshow(np.zeros((1, 1)), aspect='auto', origin='lower', cmap=CMAP,
+                   interpolation='nearest')
+    cbar = fig.colorbar(im, ax=ax, fraction=0.04, pad=0.02)
+    cbar.set_label(L['force'], color=TEXT, fontsize=9)
+    cbar.ax.tick_params(colors=TEXT, labelsize=8)
+    return fig, {'ax': ax, 'im': im}
+
+
+def _hist_figure():
+    fig, ax = _new_figure((8, 3.0))
+    ax.set_xlabel(L['force'], color=TEXT, fontsize=9)
+    ax.set_ylabel(L['count'], color=TEXT, fontsize=9)
+    bars = ax.stairs([0], [0, 1], fill=True, color=BLUE, alpha=0.85)
+    limit = ax.axvline(0, color=GREEN, ls='--', lw=1.2)
+    return fig, {'ax': ax, 'bars': bars, 'limit': limit}
+
+
+def _draw_curve(points, strip_number, threshold):
+    fig, a = _figure('curve')
+    ax = a['ax']
+    pos = [p[0] for p in points]
+    lo = [p[1] for p in points]
+    hi = [p[3] for p in points]
+    a['mean'].set_data(pos, [p[2] for p in points])
+    if a['band'] is not None:
+        a['band'].remove()
+    a['band'] = ax.fill_between(pos, lo, hi, color=CYAN, alpha=0.18, linewidth=0)
+    a['limit'].set_ydata([threshold, threshold])
+    ax.set_xlim(pos[0], pos[-1] if pos[-1] > pos[0] else pos[0] + 1)
+    ax.set_ylim(0, max(110.0, max(hi) * 1.1, threshold * 1.2))
+    ax.set_title(L['curve_title'].format(strip=strip_number, threshold=threshold), color=TEXT)
+    return fig
+
+
+def _draw_heatmap(h):
+    fig, a = _figure('heatmap')
+    rows, cols = h['shape']
+    data = np.array(h['grid'], dtype=float).reshape(rows, cols)
+    im = a['im']
+    im.set_data(np.ma.masked_invalid(data))
+    strips = h['strips']
+    im.set_extent([h['pos_from'], h['pos_to'], strips[0] - 0.5, strips[-1] + 0.5])
+    finite = data[np.isfinite(data)]
+    im.set_clim(0, max(100.0, float(np.percentile(finite, 99))) if finite.size else 100.0)
+    a['ax'].set_title(L['heatmap_title'].format(rows=rows), color=TEXT)
+    return fig
+
+
+def _draw_hist(counts, threshold):
+    fig, a = _figure('hist')
+    ax = a['ax']
+    edges = [i * HIST_BIN_N for i in range(len(counts) + 1)]
+    a['bars'].set_data(values=counts, edges=edges)
+    a['limit'].set_xdata([threshold, threshold])
+    top = max(i for i, c in enumerate(counts) if c) + 1 if any(counts) else len(counts)
+    ax.set_xlim(0, max(120.0, edges[top], threshold * 1.1))
+    ax.set_ylim(0, max(counts) * 1.08 or 1)
+    total = sum(counts) or 1
+    passed = sum(c for c, e in zip(counts, edges) if e >= threshold)
+    ax.set_title(L['hist_title'].format(bin=HIST_BIN_N, threshold=threshold, pct=100.0 * passed / total),
+                 color=TEXT)
+    return fig
+
+
+def _png(fig):
+    buf = io.BytesIO()
+    # 低压缩级别：PNG 编码耗时约减半，体积仅增约一成
+    fig.savefig(buf, format='png', dpi=DPI, pil_kwargs={'compress_level': 1})
+    return buf.getvalue()
+
+
+def render_charts(data, threshold):
+    """data 为 chart_data 的结果；返回 [(标题, PNG 字节流)]，无数据的图略过。"""
+    if not AVAILABLE or not data:
+        return []
+    out = []
+    with _lock:
+        if data['curve']:
+            out.append(('剥离力-位移曲线', _png(_draw_curve(data['curve'], data['strip_number'], threshold))))
+        if data['heatmap']:
+            out.append(('剥离力空间分布热力图', _png(_draw_heatmap(data['heatmap']))))
+        if data['hist'] and any(data['hist']):
+            out.append(('剥离力幅值分布直方图', _png(_draw_hist(data['hist'], threshold))))
+    return out
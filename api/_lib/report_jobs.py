@@ -0,0 +1,265 @@
+"""报告导出异步任务队列（report_jobs 表）：提交 -> 排队 -> 后台进程构建 -> 轮询进度 -> 下载。
+
+    - 范围：单个试验（.docx）、一个或多个项目、完成日期区间（已完成试验的报告 zip）；
+    - 去重：任务键 = sha256(报告模板 + 阈值 + 产物类型 + 各试验 id 与数据版本)，
+      相同导出共享同一任务与产物；失败任务再次提交时重新排队；有试验重新完成时键随之改变；
+    - 进度：每写入一份报告更新 done / total 与心跳；心跳超过 JOB_STALE_SECONDS 的运行中任务
+      视为工作进程中断，可被重新领取；
+    - 产物构建时写入临时文件，按 JOB_CHUNK_BYTES 分块存于 report_job_chunks，下载时逐块读出，
+      任一环节内存占用不随产物大小增长；结束 JOB_TTL_HOURS 后随任务行级联清理；
+    - 工作进程定期写 report_workers 心跳：无存活工作进程时（如仅部署 Vercel）拒绝提交，
+      前端改走流式直出；排队超过 JOB_QUEUE_TTL_SECONDS 仍无人领取的任务标记为失败，
+      再次提交时重新排队。
+
+常驻工作进程（持续领取排队任务并构建）：
+    python -m api._lib.report_jobs
+"""
+import datetime
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import time
+
+from .db import execute, query, transaction
+from .result_cache import data_version
+
+SCOPES = ('test', 'project', 'range')
+JOB_STALE_SECONDS = 300
+JOB_TTL_HOURS = 24
+JOB_QUEUE_TTL_SECONDS = 600
+WORKER_HEARTBEAT_SECONDS = 15
+WORKER_STALE_SECONDS = 60
+WORKER_POLL_SECONDS = 1.0
+CLEANUP_SECONDS = 600
+JOB_CHUNK_BYTES = 4 * 1024 * 1024    # 产物分块存储的单块上限
+
+_worker = {'id': None, 'beat': 0.0}   # 本进程作为工作进程时的标识与上次心跳时刻
+
+STATUS_COLUMNS = """id, scope, status, done, total, filename, size_bytes, error,
+                    created_at, started_at, finished_at"""
+
+
+def _int_list(raw):
+    values = raw if isinstance(raw, list) else str(raw or '').split(',')
+    try:
+        return [int(v) for v in values if str(v).strip()]
+    except ValueError:
+        raise ValueError('ID 格式错误')
+
+
+def _date(raw, name):
+    try:
+        return datetime.date.fromisoformat(str(raw))
+    except ValueError:
+        raise ValueError(f'{name} 应为 YYYY-MM-DD')
+
+
+def resolve_tests(scope, params):
+    """导出范围 -> (已完成试验行列表, 产物文件名)；参数非法时抛 ValueError。"""
+    if scope == 'test':
+        if not params.get('test_id'):
+            raise ValueError('缺少试验ID')
+        where, args = "t.id = %s", [int(params['test_id'])]
+        filename = f"report_test_{int(params['test_id'])}.docx"
+    elif scope == 'project':
+        project_ids = _int_list(params.get('project_id'))
+        if not project_ids:
+            raise ValueError('缺少项目ID')
+        where, args = "t.project_id = ANY(%s)", [project_ids]
+        filename = f"reports_project_{'_'.join(map(str, project_ids))}.zip"
+    elif scope == 'range':
+        date_from = _date(params.get('date_from'), 'date_from')
+        date_to = _date(params.get('date_to') or date_from, 'date_to')
+        if date_to < date_from:
+            raise ValueError('结束日期早于开始日期')
+        where, args = "t.end_time >= %s AND t.end_time < %s", [date_from, date_to + datetime.timedelta(days=1)]
+        filename = f'reports_{date_from:%Y%m%d}_{date_to:%Y%m%d}.zip'
+        if params.get('project_id'):
+            where += " AND t.project_id = ANY(%s)"
+            args.append(_int_list(params['project_id']))
+    else:
+        raise ValueError(f"未知导出范围: {scope}（{'/'.join(SCOPES)}）")
+    tests = query(
+        f"""SELECT t.id, t.project_id, t.status, t.end_time FROM tests t
+            WHERE t.status = 'completed' AND {where}
+            ORDER BY t.project_id, t.id""",
+        args, fetchall=True) or []
+    return tests, filename
+
+
+def job_key(tests, threshold, template, artifact):
+    parts = [str(template), repr(float(threshold)), artifact] + \
+            [f"{t['id']}@{data_version(t)}" for t in tests]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def submit(scope, params, threshold, template, user_id=None):
+    """提交导出任务；相同导出已排队/进行中/已完成时返回既有任务（created 为 False）。"""
+    tests, filename = resolve_tests(scope, params)
+    expire_queued()
+    if not tests:
+        raise LookupError('没有符合条件的已完成试验')
+    artifact = 'docx' if scope == 'test' else 'zip'
+    job = query(
+        f"""INSERT INTO report_jobs (job_key, scope, params, tests, threshold, total, filename, created_by)
+            VALUES (%s, %s, %s::jsonb, %s::jsonb, %s, %s, %s, %s)
+            ON CONFLICT (job_key) DO UPDATE SET
+                status = CASE WHEN report_jobs.status = 'failed' THEN 'queued' ELSE report_jobs.status END,
+                error = CASE WHEN report_jobs.status = 'failed' THEN NULL ELSE report_jobs.error END,
+                done = CASE WHEN report_jobs.status = 'failed' THEN 0 ELSE report_jobs.done END,
+                created_at = CASE WHEN report_jobs.status = 'failed' THEN NOW() ELSE report_jobs.created_at END
+            RETURNING {STATUS_COLUMNS}, (xmax = 0) AS created""",
+        (job_key(tests, threshold, template, artifact), scope,
+         json.dumps({k: v for k, v in params.items() if k in ('test_id', 'project_id', 'date_from', 'date_to')}),
+         json.dumps([{'id': t['id'], 'project_id': t['project_id']} for t in tests]),
+         float(threshold), len(tests), filename, user_id),
+        fetchone=True)
+    return dict(job)
+
+
+def job_status(job_id):
+    row = query(f"SELECT {STATUS_COLUMNS} FROM report_jobs WHERE id = %s", (int(job_id),), fetchone=True)
+    return dict(row) if row else None
+
+
+def job_artifact(job_id):
+    """已完成任务的 (分块迭代器, 文件名, 字节数)；未完成或不存在返回 None。"""
+    job_id = int(job_id)
+    row = query("SELECT filename, size_bytes FROM report_jobs WHERE id = %s AND status = 'done'",
+                (job_id,), fetchone=True)
+    if not row:
+        return None
+
+    def chunks():
+        seq = 0
+        while True:
+            chunk = query("SELECT data FROM report_job_chunks WHERE job_id = %s AND seq = %s",
+                          (job_id, seq), fetchone=True)
+            if not chunk:
+                return
+            yield bytes(chunk['data'])
+            seq += 1
+
+    return chunks(), row['filename'], int(row['size_bytes'])
+
+
+def claim():
+    """领取一个排队任务（或心跳超时的运行中任务）；多个工作进程并发领取互不重复。"""
+    row = query(
+        """UPDATE report_jobs SET status = 'running', done = 0, started_at = NOW(), heartbeat = NOW()
+           WHERE id = (
+               SELECT id FROM report_jobs
+               WHERE status = 'queued'
+                  OR (status = 'running' AND heartbeat < NOW() - make_interval(secs => %s))
+               ORDER BY id FOR UPDATE SKIP LOCKED LIMIT 1)
+           RETURNING id, scope, tests, threshold, filename""",
+        (JOB_STALE_SECONDS,), fetchone=True)
+    return dict(row) if row else None
+
+
+def _progress(job_id, done):
+    execute("UPDATE report_jobs SET done = %s, heartbeat = NOW() WHERE id = %s", (done, job_id))
+    _beat()
+
+
+def _beat(force=False):
+    """工作进程心跳（每 WORKER_HEARTBEAT_SECONDS 至多写一次）；非工作进程不写。"""
+    if not _worker['id'] or (not force and time.monotonic() - _worker['beat'] < WORKER_HEARTBEAT_SECONDS):
+        return
+    execute(
+        """INSERT INTO report_workers (worker_id, heartbeat) VALUES (%s, NOW())
+           ON CONFLICT (worker_id) DO UPDATE SET heartbeat = NOW()""",
+        (_worker['id'],))
+    _worker['beat'] = time.monotonic()
+
+
+def worker_alive():
+    """是否有心跳未超过 WORKER_STALE_SECONDS 的工作进程。"""
+    row = query(
+        """SELECT EXISTS (SELECT 1 FROM report_workers
+                          WHERE heartbeat > NOW() - make_interval(secs => %s)) AS alive""",
+        (WORKER_STALE_SECONDS,), fetchone=True)
+    return bool(row and row['alive'])
+
+
+def expire_queued():
+    """排队超过 JOB_QUEUE_TTL_SECONDS 仍未被领取的任务标记为失败（再次提交时重新排队）。"""
+    return execute(
+        """UPDATE report_jobs SET status = 'failed', error = '排队超时：无工作进程领取', finished_at = NOW()
+           WHERE status = 'queued' AND created_at < NOW() - make_interval(secs => %s)""",
+        (JOB_QUEUE_TTL_SECONDS,))
+
+
+def run_job(job):
+    """构建任务产物（临时文件）并分块写回；失败时记录错误信息。"""
+    # api.reports（处理器模块）依赖本模块，构建函数延迟导入
+    from api.reports import _build_report, write_project_zip
+    try:
+        threshold = float(job['threshold'])
+        with tempfile.TemporaryFile() as fp:
+            if job['scope'] == 'test':
+                content, filename = _build_report(job['tests'][0]['id'], threshold)
+                if content is None:
+                    raise LookupError('试验不存在')
+                fp.write(content)
+                _progress(job['id'], 1)
+            else:
+                write_project_zip(fp, job['tests'], threshold,
+                                  progress=lambda done: _progress(job['id'], done))
+                filename = job['filename']
+            size = fp.tell()
+            fp.seek(0)
+            # 重新领取的任务先清掉上次未提交完的分块；分块与完成状态同一事务提交
+            with transaction():
+                execute("DELETE FROM report_job_chunks WHERE job_id = %s", (job['id'],))
+                for seq, data in enumerate(iter(lambda: fp.read(JOB_CHUNK_BYTES), b'')):
+                    execute("INSERT INTO report_job_chunks (job_id, seq, data) VALUES (%s, %s, %s)",
+                            (job['id'], seq, data))
+                execute(
+                    """UPDATE report_jobs SET status = 'done', size_bytes = %s, filename = %s,
+                           finished_at = NOW(), heartbeat = NOW()
+                       WHERE id = %s""",
+                    (size, filename, job['id']))
+        return True
+    except Exception as e:
+        execute(
+            """UPDATE report_jobs SET status = 'failed', error = %s, finished_at = NOW()
+               WHERE id = %s""",
+            (str(e), job['id']))
+        return False
+
+
+def cleanup():
+    """清理结束超过 JOB_TTL_HOURS 的任务（产物分块级联删除）、排队超时的任务与失联工作进程的心跳行。"""
+    expire_queued()
+    execute("DELETE FROM report_workers WHERE heartbeat < NOW() - make_interval(hours => %s)",
+            (JOB_TTL_HOURS,))
+    return execute(
+        """DELETE FROM report_jobs WHERE status IN ('done', 'failed')
+           AND finished_at < NOW() - make_interval(hours => %s)""",
+        (JOB_TTL_HOURS,))
+
+
+def run_worker():
+    """常驻工作进程：持续领取并构建排队任务，空闲时每 CLEANUP_SECONDS 清理过期产物。"""
+    _worker['id'] = f'{socket.gethostname()}:{os.getpid()}'
+    last_cleanup = 0.0
+    while True:
+        try:
+            _beat(force=_worker['beat'] == 0.0)
+            job = claim()
+            if job:
+                run_job(job)
+                continue
+            if time.monotonic() - last_cleanup > CLEANUP_SECONDS:
+                cleanup()
+                last_cleanup = time.monotonic()
+        except Exception as e:
+            print('report worker:', e)
+        time.sleep(WORKER_POLL_SECONDS)
+
+
+if __name__ == '__main__':
+    run_worker()
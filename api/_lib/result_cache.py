@@ -0,0 +1,91 @@
+"""已完成试验的分析结果缓存：进程内 LRU/TTL 一级 + result_cache 表二级。
+
+键 = (endpoint, test_id, threshold)，并以 data_version（试验 end_time）校验：
+已完成试验不再变化，重复访问直接返回缓存；试验经 test_ops start 重启时
+invalidate() 清除两级缓存（重启后 end_time 亦改变，漏清的旧条目也不会命中）。
+运行中/未完成试验不缓存。
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .db import execute, query
+from .response import CustomEncoder
+
+CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '128'))
+CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', '600'))    # 一级缓存存活时间(s)
+
+_local = OrderedDict()     # (endpoint, test_id, threshold) -> (data_version, 写入时刻, 结果)
+_lock = threading.Lock()
+
+
+def data_version(test):
+    """已完成试验的数据版本；未完成返回 None（不缓存）。"""
+    if test.get('status') != 'completed' or not test.get('end_time'):
+        return None
+    end = test['end_time']
+    return end.isoformat() if hasattr(end, 'isoformat') else str(end)
+
+
+def _get_local(key, version):
+    with _lock:
+        hit = _local.get(key)
+        if not hit:
+            return None
+        ver, at, value = hit
+        if ver != version or time.monotonic() - at > CACHE_TTL:
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return value
+
+
+def _put_local(key, version, value):
+    with _lock:
+        _local[key] = (version, time.monotonic(), value)
+        _local.move_to_end(key)
+        while len(_local) > CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def cached(endpoint, test, threshold, compute):
+    """按两级缓存返回 compute() 的结果；结果须可 JSON 序列化。
+
+    二级命中返回的是 JSON 往返后的值（Decimal/时间已转为 float/字符串）。
+    """
+    version = data_version(test)
+    if version is None:
+        return compute()
+    key = (endpoint, int(test['id']), float(threshold))
+    value = _get_local(key, version)
+    if value is not None:
+        return value
+
+    row = query(
+        """SELECT payload FROM result_cache
+           WHERE endpoint = %s AND test_id = %s AND threshold = %s AND data_version = %s""",
+        (endpoint, key[1], key[2], version), fetchone=True)
+    if row:
+        value = row['payload']
+    else:
+        value = compute()
+        execute(
+            """INSERT INTO result_cache (endpoint, test_id, threshold, data_version, payload)
+               VALUES (%s, %s, %s, %s, %s::jsonb)
+               ON CONFLICT (endpoint, test_id, threshold) DO UPDATE SET
+                   data_version = EXCLUDED.data_version, payload = EXCLUDED.payload,
+                   created_at = NOW()""",
+            (endpoint, key[1], key[2], version, json.dumps(value, cls=CustomEncoder)))
+    _put_local(key, version, value)
+    return value
+
+
+def invalidate(test_id):
+    """清除某试验的两级缓存（重启试验时调用）。"""
+    tid = int(test_id)
+    with _lock:
+        for key in [k for k in _local if k[1] == tid]:
+            del _local[key]
+    execute("DELETE FROM result_cache WHERE test_id = %s", (tid,))
@@ -0,0 +1,49 @@
+"""逐试验汇总行（test_rollup 表），供跨试验 data?action=dataset 视图使用。
+
+试验完成时写入一次：力值直方图各桶计数（与单试验分析同一 HIST_MAX / HIST_BINS 分桶，
+含越界的 0 与 HIST_BINS+1 桶）、点数与矩（和 / 平方和 / 最小 / 最大）、按默认阈值的合格点数，
+以及 0.1 N 细粒度直方图 fine_hist（任意阈值的合格点数 = 其后缀和）。
+跨试验直方图与合格饼图只需对这些小行求和，不再连接扫描 data_points。
+"""
+from .aggregates import FINE_HIST_BINS, FINE_HIST_MAX
+from .analysis import HIST_BINS, HIST_MAX
+from .db import execute
+
+
+def _hist_array(hist_max, bins):
+    return f"""ARRAY(SELECT COALESCE(h.count, 0)
+             FROM generate_series(0, {bins + 1}) AS g(b)
+             LEFT JOIN (SELECT width_bucket(force_value, 0, {hist_max}, {bins}) AS bucket,
+                               COUNT(*) AS count
+                        FROM data_points WHERE test_id = t.id GROUP BY bucket) h
+                    ON h.bucket = g.b
+             ORDER BY g.b)"""
+
+
+ROLLUP_SQL = f"""INSERT INTO test_rollup
+    (test_id, hist, fine_hist, n, sum_force, sum_sq, min_force, max_force, pass_pts, updated_at)
+SELECT t.id, {_hist_array(HIST_MAX, HIST_BINS)},
+       {_hist_array(FINE_HIST_MAX, FINE_HIST_BINS)},
+       COALESCE(s.n, 0), COALESCE(s.sum_force, 0), COALESCE(s.sum_sq, 0),
+       s.min_force, s.max_force, COALESCE(s.pass_pts, 0), NOW()
+FROM tests t
+LEFT JOIN LATERAL (
+    SELECT SUM(n) AS n, SUM(sum_force) AS sum_force, SUM(sum_sq) AS sum_sq,
+           MIN(min_force) AS min_force, MAX(max_force) AS max_force, SUM(pass_count) AS pass_pts
+    FROM strip_stats WHERE test_id = t.id) s ON TRUE
+WHERE {{where}}
+ON CONFLICT (test_id) DO UPDATE SET
+    hist = EXCLUDED.hist, fine_hist = EXCLUDED.fine_hist, n = EXCLUDED.n,
+    sum_force = EXCLUDED.sum_force,
+    sum_sq = EXCLUDED.sum_sq, min_force = EXCLUDED.min_force, max_force = EXCLUDED.max_force,
+    pass_pts = EXCLUDED.pass_pts, updated_at = EXCLUDED.updated_at"""
+
+# init_db 回填：尚无汇总行（或缺细直方图）的已完成试验
+BACKFILL_ROLLUP_SQL = ROLLUP_SQL.format(
+    where="t.status = 'completed' AND NOT EXISTS "
+          "(SELECT 1 FROM test_rollup r WHERE r.test_id = t.id AND r.fine_hist IS NOT NULL)")
+
+
+def build_rollup(test_id):
+    """（重新）写入单个试验的汇总行（试验完成时调用）。"""
+    return execute(ROLLUP_SQL.format(where='t.id = %s'), (test_id,))
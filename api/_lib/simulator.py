@@ -12,15 +12,26 @@
     - 否则选取数据点最多的真实完成试验作为代表性回放源（如 P1016R-02F）。
 """
 import datetime
+import json
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 
 import psycopg2.extras
 
-from .db import get_connection, query
+from .aggregates import PASS_THRESHOLD, get_threshold, test_summary
+from .db import execute, query, transaction
 
 FORCE_SENSOR_RANGE = 1000.0   # S 型传感器量程 0–1000 N
-PASS_THRESHOLD = 70.0         # 合格阈值
 MAX_STRIPS = 30               # 大屏最多展示 30 条带
 PLAYBACK_POLLS = 100          # 完整回放所需轮询数（200ms × 100 ≈ 20s）
+TEMPLATE_CACHE_SIZE = 16      # 进程内缓存的已解析回放模板数（LRU）
+
+# 已解析回放模板缓存：(test_id, start_time) -> template。
+# 以 start_time 为键的一部分，试验重新启动后旧模板自然失效（跨实例同样成立）。
+_template_cache = OrderedDict()
+_template_lock = threading.Lock()
 
 
 def _fetch_series(test_id):
@@ -86,67 +97,149 @@ def build_replay_template(test_id):
     }
 
 
+def index_replay_template(template):
+    """为模板建立逐条带列式索引，供 reveal 以二分定位揭示窗口。
+
+    索引存于 template['_index']（仅驻留内存，不写回 tests.profiles）：
+    {strip: (pos, force, speed)}，三列均为按位置升序排列的 array('d')。
+    """
+    index = template.get('_index')
+    if index is not None:
+        return index
+    index = {}
+    for s_str, pts in (template.get('replay') or {}).items():
+        try:
+            s = int(s_str)
+        except (TypeError, ValueError):
+            continue
+        pts = sorted(pts, key=lambda p: float(p[0]))
+        index[s] = (array('d', (float(p[0]) for p in pts)),
+                    array('d', (float(p[1]) for p in pts)),
+                    array('d', (float(p[2]) if len(p) > 2 else 10.0 for p in pts)))
+    template['_index'] = dict(sorted(index.items()))
+    return template['_index']
+
+
+def cache_replay_template(test_id, start_time, template):
+    """放入已解析模板（试验启动时预热，省去首次轮询的反序列化与建索引）。"""
+    index_replay_template(template)
+    key = (int(test_id), start_time)
+    with _template_lock:
+        _template_cache[key] = template
+        _template_cache.move_to_end(key)
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+
+
+def invalidate_replay_template(test_id):
+    """丢弃某试验的全部缓存模板（启动/停止/中止时调用）。"""
+    tid = int(test_id)
+    with _template_lock:
+        for key in [k for k in _template_cache if k[0] == tid]:
+            del _template_cache[key]
+
+
+def get_replay_template(test_id, start_time):
+    """按 (test_id, start_time) 取已解析回放模板，未命中时才读取 tests.profiles。"""
+    key = (int(test_id), start_time)
+    with _template_lock:
+        if key in _template_cache:
+            _template_cache.move_to_end(key)
+            return _template_cache[key]
+    row = query("SELECT profiles, start_time FROM tests WHERE id = %s",
+                (test_id,), fetchone=True)
+    template = row['profiles'] if row else None
+    if isinstance(template, str):
+        template = json.loads(template) if template else None
+    if template:
+        # 以库中实际 start_time 入缓存，避免并发重启时把新模板挂到旧键上
+        cache_replay_template(test_id, row['start_time'], template)
+    return template
+
+
 def playback_step(max_pos):
     """每次轮询推进的位置步长（mm）。"""
     return max(1.0, float(max_pos) / PLAYBACK_POLLS)
 
 
 def reveal(test_id, template, old_pos, new_pos):
-    """揭示位置区间 (old_pos, new_pos] 内的真实数据点并写入运行中试验。"""
-    replay = (template or {}).get('replay', {})
+    """揭示位置区间 (old_pos, new_pos] 内的真实数据点并写入运行中试验。
+
+    按条带二分定位窗口边界，每次只访问本次揭示的点，与模板总点数无关。
+    """
+    if not template:
+        return 0
     now = datetime.datetime.utcnow()
     rows = []
-    for s_str, pts in replay.items():
-        try:
-            s = int(s_str)
-        except (TypeError, ValueError):
-            continue
-        for p in pts:
-            pos = float(p[0])
-            force = float(p[1])
-            speed = float(p[2]) if len(p) > 2 else 10.0
-            if old_pos < pos <= new_pos:
-                rows.append((test_id, s, round(pos, 2), round(force, 4),
-                             round(speed, 2), now))
+    for s, (pos, force, speed) in index_replay_template(template).items():
+        lo = bisect_right(pos, old_pos)
+        hi = bisect_right(pos, new_pos)
+        for i in range(lo, hi):
+            rows.append((test_id, s, round(pos[i], 2), round(force[i], 4),
+                         round(speed[i], 2), now))
 
     if not rows:
         return 0
 
-    conn = get_connection()
-    try:
+    # 同一语句内维护 strip_latest（逐条带最新值）与 strip_stats（逐条带运行聚合），
+    # 读取最新值与统计量均无需扫描 data_points
+    with transaction() as conn:
         with conn.cursor() as cur:
             psycopg2.extras.execute_values(
                 cur,
-                """INSERT INTO data_points
-                   (test_id, strip_number, position_mm, force_value, speed, timestamp)
-                   VALUES %s""",
+                f"""WITH ins AS (
+                       INSERT INTO data_points
+                       (test_id, strip_number, position_mm, force_value, speed, timestamp)
+                       VALUES %s
+                       RETURNING id, test_id, strip_number, position_mm, force_value, speed, timestamp
+                   ), latest AS (
+                       INSERT INTO strip_latest
+                       (test_id, strip_number, data_point_id, position_mm, force_value, speed, timestamp)
+                       SELECT DISTINCT ON (strip_number)
+                              test_id, strip_number, id, position_mm, force_value, speed, timestamp
+                       FROM ins ORDER BY strip_number, id DESC
+                       ON CONFLICT (test_id, strip_number) DO UPDATE SET
+                           data_point_id = EXCLUDED.data_point_id,
+                           position_mm = EXCLUDED.position_mm,
+                           force_value = EXCLUDED.force_value,
+                           speed = EXCLUDED.speed,
+                           timestamp = EXCLUDED.timestamp
+                       WHERE strip_latest.data_point_id < EXCLUDED.data_point_id
+                   )
+                   INSERT INTO strip_stats
+                   (test_id, strip_number, n, sum_force, sum_sq, min_force, max_force,
+                    pass_count, max_position)
+                   SELECT test_id, strip_number, COUNT(*), SUM(force_value),
+                          SUM(force_value * force_value), MIN(force_value), MAX(force_value),
+                          SUM(CASE WHEN force_value >= {float(PASS_THRESHOLD)} THEN 1 ELSE 0 END),
+                          MAX(position_mm)
+                   FROM ins GROUP BY test_id, strip_number
+                   ON CONFLICT (test_id, strip_number) DO UPDATE SET
+                       n = strip_stats.n + EXCLUDED.n,
+                       sum_force = strip_stats.sum_force + EXCLUDED.sum_force,
+                       sum_sq = strip_stats.sum_sq + EXCLUDED.sum_sq,
+                       min_force = LEAST(strip_stats.min_force, EXCLUDED.min_force),
+                       max_force = GREATEST(strip_stats.max_force, EXCLUDED.max_force),
+                       pass_count = strip_stats.pass_count + EXCLUDED.pass_count,
+                       max_position = GREATEST(strip_stats.max_position, EXCLUDED.max_position)""",
                 rows
             )
-            conn.commit()
-    finally:
-        conn.close()
     return len(rows)
 
 
-def compute_test_summary(test_id, threshold=PASS_THRESHOLD):
-    """试验结束后回写整体峰值与合格率到 tests 表。"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT MAX(force_value) AS max_force,
-                          AVG(CASE WHEN force_value >= %s THEN 1.0 ELSE 0.0 END) * 100 AS pass_rate
-                   FROM data_points WHERE test_id = %s""",
-                (threshold, test_id)
-            )
-            row = cur.fetchone()
-            max_force = float(row[0]) if row and row[0] is not None else 0.0
-            pass_rate = float(row[1]) if row and row[1] is not None else 0.0
-            cur.execute(
-                "UPDATE tests SET max_force = %s, pass_rate = %s WHERE id = %s",
-                (round(max_force, 2), round(pass_rate, 2), test_id)
-            )
-            conn.commit()
-    finally:
-        conn.close()
+def compute_test_summary(test_id, threshold=None):
+    """试验结束后回写整体峰值与合格率到 tests 表（由 strip_stats 汇总，O(条带数)）。
+
+    阈值缺省取系统设置；非默认阈值的合格点数取 test_rollup 细直方图，故应在 build_rollup 之后调用。
+    """
+    if threshold is None:
+        threshold = get_threshold()
+    with transaction():
+        _, overall = test_summary(test_id, threshold)
+        max_force = float(overall['max_force'] or 0.0)
+        pass_rate = float(overall['pass_rate'] or 0.0)
+        execute(
+            "UPDATE tests SET max_force = %s, pass_rate = %s WHERE id = %s",
+            (round(max_force, 2), round(pass_rate, 2), test_id)
+        )
     return {'max_force': max_force, 'pass_rate': pass_rate}
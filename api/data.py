@@ -1,15 +1,27 @@
 from http.server import BaseHTTPRequestHandler
 import csv
 import io
+import itertools
+import json
+import math
+import traceback
+from decimal import Decimal
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api._lib.db import query
+from api._lib.db import iter_query, query
 from api._lib.response import json_response, error_response, options_response, get_query_params
+from api._lib.aggregates import get_threshold, threshold_bucket
+from api._lib.analysis import HIST_BINS, build_histogram, test_analysis
+from api._lib.columnar import ArrowUnavailable, WRITERS, export_bytes, load_matrix
+from api._lib.downsample import METHODS as DOWNSAMPLE_METHODS, MIN_POINTS as DOWNSAMPLE_MIN_POINTS, downsample
+from api._lib.heatmap import (AGGREGATES as HEATMAP_AGGREGATES, DEFAULT_MAX_BINS as HEATMAP_MAX_BINS,
+                              encode as encode_heatmap, heatmap)
+from api._lib.pyramid import DEFAULT_MAX_POINTS as PYRAMID_MAX_POINTS, LEVELS_MM as HEATMAP_LEVELS, pyramid_range
+from api._lib.pagination import InvalidCursor, decode_cursor, encode_cursor
 
-PASS_THRESHOLD = 70.0
-HIST_MAX = 120.0
-HIST_BINS = 24
+HISTORY_MAX_PER_PAGE = 5000
+DOWNSAMPLE_DEFAULT_POINTS = 800
 
 
 class handler(BaseHTTPRequestHandler):
@@ -21,6 +33,10 @@ class handler(BaseHTTPRequestHandler):
         action = params.get('action', 'history')
         if action == 'history':
             self._history(params)
+        elif action == 'range':
+            self._range(params)
+        elif action == 'heatmap':
+            self._heatmap(params)
         elif action == 'analysis':
             self._analysis(params)
         elif action == 'dataset':
@@ -30,37 +46,193 @@ class handler(BaseHTTPRequestHandler):
         else:
             error_response(self, 'Unknown action')
 
-    # ---- 单试验历史数据点（游客可读） ----
+    # ---- 单试验历史数据点（游客可读；键集分页） ----
     def _history(self, params):
+        """按 (strip_number, position_mm, id) 键集分页。
+
+        cursor：上一页返回的 next_cursor（不透明）；has_more 为 False 时已到末页。
+        total：estimate（默认，仅首页，取 strip_stats 计数 O(条带数)）/ exact（COUNT(*)）/ none。
+        page：兼容旧客户端，未给 cursor 时按 OFFSET 跳页并回传 page 与精确 total
+        （深页代价随页码增长，新客户端应沿 next_cursor 翻页）。
+        """
         try:
             test_id = params.get('test_id')
             if not test_id:
                 error_response(self, '缺少试验ID')
                 return
             strip_number = params.get('strip_number')
-            page = int(params.get('page', '1'))
-            per_page = int(params.get('per_page', '1000'))
-            offset = (page - 1) * per_page
+            if params.get('downsample'):
+                self._history_downsampled(params, test_id, strip_number)
+                return
+            per_page = max(1, min(int(params.get('per_page', '1000')), HISTORY_MAX_PER_PAGE))
+            token = params.get('cursor')
+            page = None
+            if params.get('page') not in (None, '') and not token:
+                try:
+                    page = int(params['page'])
+                except ValueError:
+                    page = 0
+                if page < 1:
+                    error_response(self, '页码须为正整数')
+                    return
+            total_mode = params.get('total', 'none' if token else 'exact' if page else 'estimate')
 
             where = ["test_id = %s"]
             wp = [test_id]
             if strip_number:
                 where.append("strip_number = %s")
                 wp.append(strip_number)
-            where_sql = " AND ".join(where)
+            filter_sql = " AND ".join(where)
+            filter_params = list(wp)
+            if token:
+                try:
+                    strip, pos, last_id = decode_cursor(token, 3)
+                    key = [int(strip), Decimal(pos), int(last_id)]
+                except (InvalidCursor, TypeError, ValueError, ArithmeticError):
+                    error_response(self, '无效的分页游标')
+                    return
+                where.append("(strip_number, position_mm, id) > (%s, %s, %s)")
+                wp.extend(key)
+
+            # 多取一行判断是否还有下一页；命中 idx_data_points_keyset，无需 OFFSET 跳读（旧 page 参数除外）
+            offset_sql = " OFFSET %s" if page else ""
+            rows = query(
+                f"""SELECT id, strip_number, position_mm, force_value, speed, timestamp
+                    FROM data_points WHERE {" AND ".join(where)}
+                    ORDER BY strip_number ASC, position_mm ASC, id ASC
+                    LIMIT %s{offset_sql}""",
+                wp + [per_page + 1] + ([(page - 1) * per_page] if page else []), fetchall=True)
+            has_more = len(rows) > per_page
+            data = rows[:per_page]
+            next_cursor = None
+            if has_more:
+                last = data[-1]
+                next_cursor = encode_cursor([last['strip_number'], last['position_mm'], last['id']])
+
+            result = {'data': data, 'next_cursor': next_cursor, 'has_more': has_more,
+                      'per_page': per_page}
+            if page:
+                result['page'] = page
+            if total_mode == 'exact':
+                result['total'] = query(
+                    f"SELECT COUNT(*) as total FROM data_points WHERE {filter_sql}",
+                    filter_params, fetchone=True)['total']
+            elif total_mode == 'estimate':
+                est = query(
+                    f"SELECT COALESCE(SUM(n), 0) as total FROM strip_stats WHERE {filter_sql}",
+                    filter_params, fetchone=True)
+                result['total'] = int(est['total']) if est else None
+                result['total_estimated'] = True
+            json_response(self, result)
+        except Exception as e:
+            error_response(self, str(e), 500)
 
-            count_result = query(
-                f"SELECT COUNT(*) as total FROM data_points WHERE {where_sql}", wp, fetchone=True)
-            data = query(
-                f"""SELECT strip_number, position_mm, force_value, speed, timestamp
-                    FROM data_points WHERE {where_sql}
-                    ORDER BY strip_number ASC, position_mm ASC
-                    LIMIT %s OFFSET %s""",
-                wp + [per_page, offset], fetchall=True)
-            json_response(self, {'data': data, 'total': count_result['total'], 'page': page})
+    def _history_downsampled(self, params, test_id, strip_number):
+        """单条带整条曲线降采样：downsample=lttb|minmax，points=目标点数。"""
+        method = params.get('downsample')
+        if method not in DOWNSAMPLE_METHODS:
+            error_response(self, '不支持的降采样方法（lttb/minmax）')
+            return
+        if not strip_number:
+            error_response(self, '降采样需指定条带号')
+            return
+        try:
+            points = int(params.get('points') or DOWNSAMPLE_DEFAULT_POINTS)
+        except ValueError:
+            points = None
+        if points is None or not DOWNSAMPLE_MIN_POINTS <= points <= HISTORY_MAX_PER_PAGE:
+            error_response(self, f'降采样点数须为 {DOWNSAMPLE_MIN_POINTS}–{HISTORY_MAX_PER_PAGE} 的整数')
+            return
+        rows = []
+        for chunk in iter_query(
+                """SELECT id, strip_number, position_mm, force_value, speed, timestamp
+                   FROM data_points WHERE test_id = %s AND strip_number = %s
+                   ORDER BY strip_number ASC, position_mm ASC, id ASC""",
+                (test_id, strip_number)):
+            rows.extend(chunk)
+        data = downsample(rows, method, points)
+        json_response(self, {'data': data, 'next_cursor': None, 'has_more': False,
+                             'downsample': {'method': method, 'source_points': len(rows),
+                                            'points': len(data)}})
+
+    # ---- 单条带区间缩放（多分辨率金字塔，代价与试验长度无关） ----
+    def _range(self, params):
+        try:
+            test_id = params.get('test_id')
+            strip_number = params.get('strip_number')
+            if not test_id or not strip_number:
+                error_response(self, '缺少试验ID或条带号')
+                return
+            pos_from = params.get('pos_from')
+            pos_to = params.get('pos_to')
+            result = pyramid_range(
+                int(test_id), int(strip_number),
+                float(pos_from) if pos_from not in (None, '') else None,
+                float(pos_to) if pos_to not in (None, '') else None,
+                min(int(params.get('max_points', PYRAMID_MAX_POINTS)), HISTORY_MAX_PER_PAGE))
+            if result is None:
+                error_response(self, '该条带暂无数据', 404)
+                return
+            json_response(self, result)
+        except ValueError:
+            error_response(self, '区间参数无效')
         except Exception as e:
             error_response(self, str(e), 500)
 
+    # ---- 条带 × 位置 热力图网格（金字塔聚合；JSON 或 f32/u16 二进制，支持瓦片） ----
+    def _heatmap(self, params):
+        try:
+            test_id = params.get('test_id')
+            if not test_id:
+                error_response(self, '缺少试验ID')
+                return
+            agg = params.get('agg', 'mean')
+            fmt = params.get('format', 'json')
+            if agg not in HEATMAP_AGGREGATES or fmt not in ('json', 'f32', 'u16'):
+                error_response(self, '不支持的聚合方式(mean/min/max)或格式(json/f32/u16)')
+                return
+            tile = params.get('tile')
+            level_mm = params.get('level_mm')
+            level_mm = int(level_mm) if level_mm not in (None, '') else None
+            if level_mm is not None and level_mm not in HEATMAP_LEVELS:
+                error_response(self, f"level_mm 须为 {'/'.join(map(str, HEATMAP_LEVELS))} 之一")
+                return
+            pos_from, pos_to = params.get('pos_from'), params.get('pos_to')
+            result = heatmap(
+                int(test_id), agg,
+                float(pos_from) if pos_from not in (None, '') else None,
+                float(pos_to) if pos_to not in (None, '') else None,
+                min(int(params.get('max_bins', HEATMAP_MAX_BINS)), HISTORY_MAX_PER_PAGE),
+                level_mm,
+                int(tile) if tile not in (None, '') else None)
+        except ValueError:
+            error_response(self, '热力图参数无效')
+            return
+        except Exception as e:
+            error_response(self, str(e), 500)
+            return
+        if result is None:
+            error_response(self, '该试验暂无数据', 404)
+            return
+
+        if fmt == 'json':
+            result['grid'] = [[None if math.isnan(v) else round(v, 2)
+                               for v in result['grid'][i * result['shape'][1]:(i + 1) * result['shape'][1]]]
+                              for i in range(result['shape'][0])]
+            json_response(self, result)
+            return
+
+        # 二进制：网格行主序 [strip, bin]，元数据放响应头
+        body = encode_heatmap(result.pop('grid'), fmt)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Heatmap-Meta', json.dumps({**result, 'dtype': fmt}))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'X-Heatmap-Meta')
+        self.end_headers()
+        self.wfile.write(body)
+
     # ---- 单试验分析（柱图/直方图/累积分布/钻取曲线） ----
     def _analysis(self, params):
         try:
@@ -68,6 +240,11 @@ class handler(BaseHTTPRequestHandler):
             if not test_id:
                 error_response(self, '缺少试验ID')
                 return
+            try:
+                threshold = get_threshold(params.get('threshold'))
+            except ValueError as e:
+                error_response(self, str(e))
+                return
 
             test = query(
                 """SELECT t.*, p.name as project_name FROM tests t
@@ -77,64 +254,8 @@ class handler(BaseHTTPRequestHandler):
                 error_response(self, '试验不存在', 404)
                 return
 
-            strip_stats = query(
-                """SELECT strip_number,
-                    ROUND(AVG(force_value)::numeric,2) as avg_force,
-                    ROUND(MAX(force_value)::numeric,2) as max_force,
-                    ROUND(MIN(force_value)::numeric,2) as min_force,
-                    ROUND(STDDEV(force_value)::numeric,2) as std_force,
-                    (AVG(force_value) >= %s) as pass_fail,
-                    COUNT(*) as data_points
-                FROM data_points WHERE test_id = %s
-                GROUP BY strip_number ORDER BY strip_number""",
-                (PASS_THRESHOLD, test_id), fetchall=True)
-
-            hist = query(
-                """SELECT width_bucket(force_value, 0, %s, %s) as bucket, COUNT(*) as count
-                   FROM data_points WHERE test_id = %s
-                   GROUP BY bucket ORDER BY bucket""",
-                (HIST_MAX, HIST_BINS, test_id), fetchone=False, fetchall=True)
-
-            # 构造完整直方图 + 累积分布
-            bin_w = HIST_MAX / HIST_BINS
-            counts = [0] * (HIST_BINS + 2)
-            for h in hist:
-                b = int(h['bucket']) if h['bucket'] is not None else 0
-                if 0 <= b < len(counts):
-                    counts[b] += int(h['count'])
-            histogram = []
-            cumulative = []
-            total = sum(counts) or 1
-            running = 0
-            for b in range(1, HIST_BINS + 1):
-                lo = round((b - 1) * bin_w, 1)
-                hi = round(b * bin_w, 1)
-                c = counts[b]
-                running += c
-                histogram.append({'range_min': lo, 'range_max': hi, 'count': c})
-                cumulative.append({'force': hi, 'cum_pct': round(100.0 * running / total, 2)})
-
-            overall = query(
-                """SELECT ROUND(AVG(force_value)::numeric,2) as overall_avg,
-                    ROUND(MAX(force_value)::numeric,2) as overall_max,
-                    ROUND(MIN(force_value)::numeric,2) as overall_min,
-                    ROUND(STDDEV(force_value)::numeric,2) as overall_std,
-                    COUNT(*) as total_points,
-                    COUNT(DISTINCT strip_number) as strips_tested,
-                    ROUND(AVG(CASE WHEN force_value>=%s THEN 1.0 ELSE 0.0 END)*100,2) as pass_rate
-                FROM data_points WHERE test_id = %s""",
-                (PASS_THRESHOLD, test_id), fetchone=True)
-
-            pass_strips = len([s for s in strip_stats if s['pass_fail']])
-            fail_strips = len(strip_stats) - pass_strips
-
-            json_response(self, {
-                'test': test, 'strip_stats': strip_stats,
-                'histogram': histogram, 'cumulative': cumulative,
-                'overall_stats': overall,
-                'pass_pie': {'pass': pass_strips, 'fail': fail_strips},
-                'threshold': PASS_THRESHOLD,
-            })
+            # 逐条带/整体统计与直方图一次往返取回；已完成试验命中进程内缓存
+            json_response(self, {'test': test, **test_analysis(test, threshold)})
         except Exception as e:
             error_response(self, str(e), 500)
 
@@ -142,6 +263,12 @@ class handler(BaseHTTPRequestHandler):
     def _dataset(self, params):
         try:
             project_id = params.get('project_id')
+            try:
+                threshold = get_threshold(params.get('threshold'))
+            except ValueError as e:
+                error_response(self, str(e))
+                return
+            k = threshold_bucket(threshold)
             where = ["t.status = 'completed'"]
             wp = []
             if project_id:
@@ -149,84 +276,168 @@ class handler(BaseHTTPRequestHandler):
                 wp.append(project_id)
             where_sql = " AND ".join(where)
 
+            # 任意阈值的合格点数 = 细直方图后缀和（桶号 >= k+1 位于 fine_hist[k+2:]）；
+            # 阈值不在 0.1 N 网格上（或超出细直方图上限）时与单试验路径一样回退扫描 data_points；
+            # 无汇总行的试验沿用 tests.pass_rate
+            if k is not None:
+                rate_pts = f"(SELECT SUM(x) FROM unnest(r.fine_hist[{k + 2}:]) AS x)"
+                pie_pts, pie_args = "SELECT COALESCE(SUM(x), 0) AS pts FROM unnest(r.fine_hist[%s:]) AS x", [k + 2]
+            else:
+                scan = "FROM data_points d WHERE d.test_id = t.id AND d.force_value >= "
+                rate_pts = f"(SELECT COUNT(*) {scan}{float(threshold)!r})"
+                pie_pts, pie_args = f"SELECT COUNT(*) AS pts {scan}%s", [threshold]
+            pass_rate = f"COALESCE(100.0 * {rate_pts} / NULLIF(r.n, 0), t.pass_rate)"
+
             trend = query(
-                f"""SELECT t.id, t.test_number, t.created_at,
-                        t.max_force, t.pass_rate
-                    FROM tests t WHERE {where_sql}
+                f"""SELECT t.id, t.test_number, t.created_at, t.max_force,
+                        ROUND(({pass_rate})::numeric, 2) as pass_rate
+                    FROM tests t LEFT JOIN test_rollup r ON r.test_id = t.id
+                    WHERE {where_sql}
                     ORDER BY t.created_at ASC""",
                 wp, fetchall=True)
 
             comparison = query(
-                """SELECT p.id, p.name,
+                f"""SELECT p.id, p.name,
                         ROUND(AVG(t.max_force)::numeric,2) as avg_max_force,
-                        ROUND(AVG(t.pass_rate)::numeric,2) as avg_pass_rate,
+                        ROUND(AVG({pass_rate})::numeric,2) as avg_pass_rate,
                         COUNT(t.id) as test_count
                    FROM projects p LEFT JOIN tests t
                         ON t.project_id = p.id AND t.status='completed'
+                   LEFT JOIN test_rollup r ON r.test_id = t.id
                    GROUP BY p.id, p.name ORDER BY p.id""",
                 fetchall=True)
 
+            # 直方图与合格饼图对 test_rollup 汇总行求和（网格阈值下不扫描 data_points）
             hist = query(
-                f"""SELECT width_bucket(d.force_value, 0, %s, %s) as bucket, COUNT(*) as count
-                    FROM data_points d JOIN tests t ON d.test_id = t.id
+                f"""SELECT g.b AS bucket, SUM(r.hist[g.b + 1]) AS count
+                    FROM test_rollup r JOIN tests t ON r.test_id = t.id
+                    CROSS JOIN generate_series(0, %s) AS g(b)
                     WHERE {where_sql}
-                    GROUP BY bucket ORDER BY bucket""",
-                [HIST_MAX, HIST_BINS] + wp, fetchall=True)
-            bin_w = HIST_MAX / HIST_BINS
-            counts = [0] * (HIST_BINS + 2)
-            for h in hist:
-                b = int(h['bucket']) if h['bucket'] is not None else 0
-                if 0 <= b < len(counts):
-                    counts[b] += int(h['count'])
-            histogram = [{'range_min': round((b - 1) * bin_w, 1),
-                          'range_max': round(b * bin_w, 1), 'count': counts[b]}
-                         for b in range(1, HIST_BINS + 1)]
+                    GROUP BY g.b ORDER BY g.b""",
+                [HIST_BINS + 1] + wp, fetchall=True)
+            histogram, _ = build_histogram((h['bucket'], h['count'] or 0) for h in hist)
 
             pass_pie = query(
-                f"""SELECT
-                        SUM(CASE WHEN d.force_value>=%s THEN 1 ELSE 0 END) as pass_pts,
-                        SUM(CASE WHEN d.force_value<%s THEN 1 ELSE 0 END) as fail_pts
-                    FROM data_points d JOIN tests t ON d.test_id = t.id
+                f"""SELECT SUM(s.pts) as pass_pts, SUM(r.n) - SUM(s.pts) as fail_pts
+                    FROM test_rollup r JOIN tests t ON r.test_id = t.id
+                    CROSS JOIN LATERAL ({pie_pts}) s
                     WHERE {where_sql}""",
-                [PASS_THRESHOLD, PASS_THRESHOLD] + wp, fetchone=True)
+                pie_args + wp, fetchone=True)
 
             json_response(self, {
                 'trend': trend, 'comparison': comparison,
                 'histogram': histogram,
                 'pass_pie': {'pass': int(pass_pie['pass_pts'] or 0),
                              'fail': int(pass_pie['fail_pts'] or 0)},
-                'threshold': PASS_THRESHOLD,
+                'threshold': threshold,
             })
         except Exception as e:
             error_response(self, str(e), 500)
 
     def _export(self, params):
+        """CSV 导出：服务端游标分批读取，逐批编码后以分块传输写出，内存占用与试验规模无关。
+
+        format=npz / parquet / arrow 改为列式导出，见 _export_columnar。
+        """
+        fmt = params.get('format', 'csv')
+        if fmt != 'csv':
+            self._export_columnar(params, fmt)
+            return
         try:
             test_id = params.get('test_id')
             if not test_id:
                 error_response(self, '缺少试验ID')
                 return
-            data = query(
+            chunks = iter_query(
                 """SELECT strip_number, position_mm, force_value, speed, timestamp
                    FROM data_points WHERE test_id = %s
                    ORDER BY strip_number ASC, position_mm ASC""",
-                (test_id,), fetchall=True)
-
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(['条带编号', '位置(mm)', '剥离力(N)', '速度(mm/min)', '时间戳'])
-            for row in data:
-                writer.writerow([row['strip_number'], row['position_mm'], row['force_value'],
-                                 row['speed'],
-                                 row['timestamp'].isoformat() if row['timestamp'] else ''])
+                (test_id,))
+            # 先取首批再发响应头：连接/查询错误仍可按 JSON 错误返回
+            first = next(chunks, [])
+        except Exception as e:
+            error_response(self, str(e), 500)
+            return
 
-            csv_content = output.getvalue()
+        output = io.StringIO()
+        writer = csv.writer(output)
+        # HTTP/1.1 请求用分块传输；HTTP/1.0 客户端不识别分块帧，直接写出正文并以关闭连接结束
+        self._chunked = self.request_version == 'HTTP/1.1'
+        try:
+            if self._chunked:
+                self.protocol_version = 'HTTP/1.1'
+            self.close_connection = True
             self.send_response(200)
             self.send_header('Content-Type', 'text/csv; charset=utf-8')
             self.send_header('Content-Disposition', f'attachment; filename=peeling_test_{test_id}.csv')
+            if self._chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            self.wfile.write('\ufeff'.encode('utf-8'))
-            self.wfile.write(csv_content.encode('utf-8'))
+
+            writer.writerow(['条带编号', '位置(mm)', '剥离力(N)', '速度(mm/min)', '时间戳'])
+            self._write_chunk('\ufeff' + output.getvalue())
+            for rows in itertools.chain([first], chunks):
+                output.seek(0)
+                output.truncate()
+                for row in rows:
+                    writer.writerow([row['strip_number'], row['position_mm'], row['force_value'],
+                                     row['speed'],
+                                     row['timestamp'].isoformat() if row['timestamp'] else ''])
+                self._write_chunk(output.getvalue())
+            if self._chunked:
+                self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # 客户端中途断开：关闭生成器即回滚游标事务并归还连接
+        except Exception:
+            # 响应头已发出，无法改写为错误响应：记录异常后不写结束块，客户端据此判定下载不完整
+            traceback.print_exc()
+        finally:
+            chunks.close()
+
+    def _export_columnar(self, params, fmt):
+        """列式导出 [position, strip] 矩阵；给出 project_id 时导出该项目全部已完成试验。"""
+        try:
+            if fmt not in WRITERS:
+                error_response(self, '不支持的导出格式（csv/npz/parquet/arrow）')
+                return
+            test_id = params.get('test_id')
+            project_id = params.get('project_id')
+            if test_id:
+                test_ids = [int(test_id)]
+                name = f'peeling_test_{test_id}'
+            elif project_id:
+                rows = query(
+                    """SELECT id FROM tests WHERE project_id = %s AND status = 'completed'
+                       ORDER BY id""", (project_id,), fetchall=True)
+                test_ids = [r['id'] for r in rows]
+                name = f'peeling_project_{project_id}'
+            else:
+                error_response(self, '缺少试验ID或项目ID')
+                return
+            if not test_ids:
+                error_response(self, '该项目暂无已完成试验', 404)
+                return
+
+            content, ctype, ext = export_bytes(fmt, [(t, load_matrix(t)) for t in test_ids])
+        except ArrowUnavailable as e:
+            error_response(self, str(e), 501)
+            return
         except Exception as e:
             error_response(self, str(e), 500)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Disposition', f'attachment; filename={name}.{ext}')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        if not data:
+            return
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data) if self._chunked else data)
@@ -5,6 +5,8 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api._lib.db import get_connection
 from api._lib.auth import hash_password
+from api._lib.pyramid import PYRAMID_INSERT
+from api._lib.rollup import BACKFILL_ROLLUP_SQL
 import psycopg2.extras
 
 # ---------------------------------------------------------------------------
@@ -75,6 +77,116 @@ CREATE TABLE IF NOT EXISTS data_points (
     created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
 );
 
+-- 逐条带最新值（由回放 reveal 随插入同步维护），实时帧按条带数 O(1) 读取
+CREATE TABLE IF NOT EXISTS strip_latest (
+    test_id INTEGER REFERENCES tests(id) ON DELETE CASCADE,
+    strip_number INTEGER NOT NULL,
+    data_point_id BIGINT NOT NULL,
+    position_mm DECIMAL(10,2) NOT NULL,
+    force_value DECIMAL(10,4) NOT NULL,
+    speed DECIMAL(8,2),
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (test_id, strip_number)
+);
+
+-- 逐条带运行聚合（由回放 reveal 随插入同步累加），停止/分析/报告读取 O(条带数)
+-- pass_count 按默认合格阈值 70N 累计
+CREATE TABLE IF NOT EXISTS strip_stats (
+    test_id INTEGER REFERENCES tests(id) ON DELETE CASCADE,
+    strip_number INTEGER NOT NULL,
+    n BIGINT NOT NULL DEFAULT 0,
+    sum_force DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    min_force DOUBLE PRECISION,
+    max_force DOUBLE PRECISION,
+    pass_count BIGINT NOT NULL DEFAULT 0,
+    max_position DOUBLE PRECISION,
+    PRIMARY KEY (test_id, strip_number)
+);
+
+-- 逐条带多分辨率力值金字塔（试验完成/种子入库时构建），缩放浏览按区间读取
+CREATE TABLE IF NOT EXISTS force_pyramid (
+    test_id INTEGER REFERENCES tests(id) ON DELETE CASCADE,
+    strip_number INTEGER NOT NULL,
+    level_mm INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    min_force DOUBLE PRECISION NOT NULL,
+    max_force DOUBLE PRECISION NOT NULL,
+    mean_force DOUBLE PRECISION NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (test_id, strip_number, level_mm, bucket)
+);
+
+-- 逐试验汇总（试验完成时写入一次）：直方图桶计数 / 矩 / 合格点数，跨试验视图对其求和
+CREATE TABLE IF NOT EXISTS test_rollup (
+    test_id INTEGER PRIMARY KEY REFERENCES tests(id) ON DELETE CASCADE,
+    hist BIGINT[] NOT NULL,
+    fine_hist BIGINT[],
+    n BIGINT NOT NULL DEFAULT 0,
+    sum_force DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    min_force DOUBLE PRECISION,
+    max_force DOUBLE PRECISION,
+    pass_pts BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- 已完成试验分析结果二级缓存（键 endpoint/test_id/threshold，data_version = end_time）
+CREATE TABLE IF NOT EXISTS result_cache (
+    endpoint VARCHAR(32) NOT NULL,
+    test_id INTEGER REFERENCES tests(id) ON DELETE CASCADE,
+    threshold DOUBLE PRECISION NOT NULL,
+    data_version VARCHAR(64) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (endpoint, test_id, threshold)
+);
+CREATE INDEX IF NOT EXISTS idx_result_cache_test ON result_cache(test_id);
+
+CREATE TABLE IF NOT EXISTS report_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    test_id INTEGER REFERENCES tests(id) ON DELETE CASCADE,
+    filename VARCHAR(255) NOT NULL,
+    content BYTEA NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_used TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_report_cache_test ON report_cache(test_id);
+
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    job_key CHAR(64) UNIQUE NOT NULL,
+    scope VARCHAR(16) NOT NULL,
+    params JSONB NOT NULL,
+    tests JSONB NOT NULL,
+    threshold DOUBLE PRECISION NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    size_bytes BIGINT,
+    error TEXT,
+    created_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP WITH TIME ZONE,
+    heartbeat TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS idx_report_jobs_queue ON report_jobs(status, id);
+
+CREATE TABLE IF NOT EXISTS report_job_chunks (
+    job_id BIGINT NOT NULL REFERENCES report_jobs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    data BYTEA NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+
+CREATE TABLE IF NOT EXISTS report_workers (
+    worker_id VARCHAR(128) PRIMARY KEY,
+    heartbeat TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
 CREATE TABLE IF NOT EXISTS settings (
     id SERIAL PRIMARY KEY,
     setting_key VARCHAR(100) UNIQUE NOT NULL,
@@ -96,7 +208,10 @@ CREATE TABLE IF NOT EXISTS audit_log (
 );
 
 CREATE INDEX IF NOT EXISTS idx_data_points_test ON data_points(test_id);
-CREATE INDEX IF NOT EXISTS idx_data_points_test_strip ON data_points(test_id, strip_number);
+-- 历史分页键集索引 (strip_number, position_mm, id)，同时覆盖按条带过滤
+CREATE INDEX IF NOT EXISTS idx_data_points_keyset
+    ON data_points(test_id, strip_number, position_mm, id);
+DROP INDEX IF EXISTS idx_data_points_test_strip;
 CREATE INDEX IF NOT EXISTS idx_tests_project ON tests(project_id);
 CREATE INDEX IF NOT EXISTS idx_tests_status ON tests(status);
 CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log(user_id);
@@ -113,11 +228,39 @@ ALTER TABLE projects ADD COLUMN IF NOT EXISTS strip_width DECIMAL(10,2) DEFAULT
 ALTER TABLE projects ADD COLUMN IF NOT EXISTS layer_thickness DECIMAL(10,4) DEFAULT 1.0;
 ALTER TABLE projects ADD COLUMN IF NOT EXISTS location VARCHAR(200);
 ALTER TABLE projects ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'created';
+ALTER TABLE test_rollup ADD COLUMN IF NOT EXISTS fine_hist BIGINT[];
+ALTER TABLE report_jobs DROP COLUMN IF EXISTS artifact;
+ALTER TABLE report_jobs ALTER COLUMN size_bytes TYPE BIGINT;
+"""
+
+# 由既有 data_points 回填 strip_latest / strip_stats / 已完成试验的 force_pyramid 与 test_rollup（幂等；种子写入后及旧库升级时执行）
+BACKFILL_SQL = """
+INSERT INTO strip_latest
+    (test_id, strip_number, data_point_id, position_mm, force_value, speed, timestamp)
+SELECT DISTINCT ON (test_id, strip_number)
+       test_id, strip_number, id, position_mm, force_value, speed, timestamp
+FROM data_points ORDER BY test_id, strip_number, id DESC
+ON CONFLICT (test_id, strip_number) DO NOTHING;
+
+INSERT INTO strip_stats
+    (test_id, strip_number, n, sum_force, sum_sq, min_force, max_force, pass_count, max_position)
+SELECT test_id, strip_number, COUNT(*), SUM(force_value), SUM(force_value * force_value),
+       MIN(force_value), MAX(force_value),
+       SUM(CASE WHEN force_value >= 70 THEN 1 ELSE 0 END), MAX(position_mm)
+FROM data_points GROUP BY test_id, strip_number
+ON CONFLICT (test_id, strip_number) DO NOTHING;
+
+""" + PYRAMID_INSERT + """
+WHERE test_id IN (SELECT id FROM tests WHERE status = 'completed')
+  AND test_id NOT IN (SELECT DISTINCT test_id FROM force_pyramid)
+GROUP BY test_id, strip_number, lv.level, bucket;
+
+""" + BACKFILL_ROLLUP_SQL + """;
 """
 
 # 销毁式重建（reset=1）：清理旧实现与本实现的全部表后重建。
 DROP_SQL = """
-DROP TABLE IF EXISTS data_points, strip_data, test_results, simulation_state,
+DROP TABLE IF EXISTS report_workers, report_job_chunks, report_jobs, report_cache, test_rollup, result_cache, force_pyramid, strip_stats, strip_latest, data_points, strip_data, test_results, simulation_state,
     audit_log, tests, peeling_tests, settings, system_settings, projects, users CASCADE;
 """
 
@@ -288,6 +431,11 @@ class handler(BaseHTTPRequestHandler):
             if test_count == 0:
                 seed_result = _seed_real_data(conn)
 
+            # 5) 派生表回填（幂等）
+            with conn.cursor() as cur:
+                cur.execute(BACKFILL_SQL)
+                conn.commit()
+
             self._json({'message': '数据库初始化/迁移成功', 'status': 'initialized',
                         'reset': reset, 'seed': seed_result})
         except Exception as e:
@@ -0,0 +1,126 @@
+"""实时力-位数据帧 SSE 推送（Server-Sent Events）。
+
+GET /api/realtime_stream?test_id=<id>
+
+    - 每帧事件 ``event: frame``，``id`` 为帧 cursor；断线后浏览器 EventSource 自动携带
+      ``Last-Event-ID`` 重连，服务端据此只补发其后的增量（cursor 失效则发全量快照）。
+    - 无新帧时每 HEARTBEAT_SECONDS 发送注释行心跳，防止代理断开空闲连接。
+    - 每个客户端一个有界缓冲（FrameBuffer），慢消费者积压时丢弃增量、改发全量重新同步。
+    - 试验结束（非运行中）后发送 ``event: end`` 并关闭；单连接最长 STREAM_MAX_SECONDS，
+      到时关闭由客户端按 ``retry`` 间隔重连续传。
+
+本地运行（任意普通 HTTP 服务器均可承载长连接）：
+    python api/realtime_stream.py 8001
+
+Vercel 等缓冲响应的无服务器平台无法推送：检测到 VERCEL 环境变量时直接返回 503，
+不启动生产者线程，客户端随即回退短轮询（前端 CONFIG.REALTIME_SSE 默认亦为关闭）。
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api._lib.realtime import build_frame, parse_cursor, FrameBuffer
+from api._lib.response import CustomEncoder, error_response, options_response, get_query_params
+
+FRAME_INTERVAL_SECONDS = 0.2    # 帧间隔，与前端 CONFIG.POLLING_INTERVAL 一致
+HEARTBEAT_SECONDS = 15.0
+STREAM_MAX_SECONDS = 280.0
+STREAM_BUFFER_FRAMES = 25       # 每客户端最多积压帧数（约 5s）
+RETRY_MS = 1000
+STREAMING_SUPPORTED = not os.environ.get('VERCEL')
+
+_END = object()       # 试验已结束/不存在：发送 end 事件，客户端不再重连
+_EXPIRED = object()   # 达到单连接时长上限：直接断开，客户端按 retry 携带 Last-Event-ID 重连
+
+
+def _produce(test_id, since_id, buf, stop):
+    """生产者线程：按帧间隔推进/读取并放入客户端缓冲。"""
+    cursor = since_id
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    last = _EXPIRED
+    try:
+        while not stop.is_set() and time.monotonic() < deadline:
+            frame = build_frame(test_id, cursor)
+            if frame is None:
+                last = _END
+                break
+            if buf.put(frame):
+                cursor = frame['cursor']
+            else:
+                cursor = None   # 缓冲溢出：积压已丢弃，下一帧发全量快照
+            if not frame['is_running']:
+                last = _END
+                break
+            stop.wait(FRAME_INTERVAL_SECONDS)
+    except Exception as e:
+        buf.put({'error': str(e)})
+    finally:
+        if not buf.put(last):
+            buf.put(last)
+
+
+class handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_OPTIONS(self):
+        options_response(self)
+
+    def do_GET(self):
+        self.close_connection = True
+        if not STREAMING_SUPPORTED:
+            error_response(self, '当前部署不支持流式推送，请使用短轮询', 503)
+            return
+        params = get_query_params(self)
+        test_id = params.get('test_id')
+        if not test_id:
+            error_response(self, '缺少试验ID')
+            return
+        since_id = parse_cursor(self.headers.get('Last-Event-ID') or params.get('since_id'))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        buf = FrameBuffer(STREAM_BUFFER_FRAMES)
+        stop = threading.Event()
+        producer = threading.Thread(target=_produce, args=(test_id, since_id, buf, stop),
+                                    daemon=True)
+        producer.start()
+        try:
+            self._write(f'retry: {RETRY_MS}\n\n')
+            while True:
+                item = buf.get(HEARTBEAT_SECONDS)
+                if item is None:
+                    self._write(': heartbeat\n\n')
+                elif item is _END:
+                    self._write('event: end\ndata: {}\n\n')
+                    break
+                elif item is _EXPIRED:
+                    break
+                elif 'error' in item:
+                    self._write(f"event: error\ndata: {json.dumps(item, ensure_ascii=False)}\n\n")
+                else:
+                    data = json.dumps(item, cls=CustomEncoder, ensure_ascii=False)
+                    event_id = f"id: {item['cursor']}\n" if item.get('cursor') else ''
+                    self._write(f'{event_id}event: frame\ndata: {data}\n\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stop.set()
+
+    def _write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+        self.wfile.flush()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+    print(f'SSE 推送服务: http://127.0.0.1:{port}/api/realtime_stream?test_id=<id>')
+    ThreadingHTTPServer(('', port), handler).serve_forever()
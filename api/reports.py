@@ -1,56 +1,194 @@
 from http.server import BaseHTTPRequestHandler
 import io
+import json
+import traceback
 import re
 import zipfile
 import datetime
+import itertools
+import threading
 import sys
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api._lib.db import query
 from api._lib.auth import get_user_from_request
-from api._lib.response import error_response, options_response, get_query_params
+from api._lib.response import json_response, error_response, options_response, get_body, get_query_params
+from api._lib.aggregates import PASS_THRESHOLD, get_threshold, test_summaries, test_summary
+from api._lib.result_cache import cached
+from api._lib.report_cache import cached_keys, load_report, report_key, store_report
+from api._lib.report_charts import (AVAILABLE as CHARTS_AVAILABLE, FONT_TAG as CHART_FONT,
+                                    chart_data, chart_data_many, render_charts)
+from api._lib.report_jobs import job_artifact, job_status, submit, worker_alive
 
 from docx import Document
-from docx.shared import Pt, RGBColor
+from docx.shared import Cm, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-PASS_THRESHOLD = 70.0
+
+ZIP_CHUNK_BYTES = 64 * 1024    # 项目 zip 分块传输的单块上限
+TEMPLATE_VERSION = 2           # 报告版式变更时递增，report_cache 随之换键
+# 有无内嵌图、图内文字是否中文的报告分别缓存
+REPORT_TEMPLATE = f"{TEMPLATE_VERSION}{f'+charts-{CHART_FONT}' if CHARTS_AVAILABLE else ''}"
+# 报告渲染进程数（默认 CPU 核数；1 为串行）
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '0')) or os.cpu_count() or 1
+CHART_BATCH = 16               # 图数据批量取数的每批试验数
+
+# 报告所需列（不含 tests.profiles 回放模板，批量取数与进程池传参不携带大字段）
+TEST_SQL = """SELECT t.id, t.project_id, t.test_number, t.sample_name, t.operator, t.peel_speed,
+                  t.status, t.n_strips, t.start_time, t.end_time,
+                  p.name as project_name, p.pipe_diameter, p.layer_width,
+                  p.layer_thickness, p.location
+           FROM tests t LEFT JOIN projects p ON t.project_id = p.id"""
+
+_pool = None
+_pool_lock = threading.Lock()
 
 
 def _safe(name):
     return re.sub(r'[^\w\-]+', '_', str(name))
 
 
-def _build_report(test_id):
-    """读取试验数据，生成 .docx 字节流（论文 5.8 报告结构）。"""
-    test = query(
-        """SELECT t.*, p.name as project_name, p.pipe_diameter, p.layer_width,
-                  p.layer_thickness, p.location
-           FROM tests t LEFT JOIN projects p ON t.project_id = p.id
-           WHERE t.id = %s""", (test_id,), fetchone=True)
+class _ChunkedWriter:
+    """只写文件对象：缓冲满 ZIP_CHUNK_BYTES 即以 HTTP/1.1 分块帧写到 wfile。
+
+    不提供 tell/seek，ZipFile 据此按流模式写出（条目尺寸写入数据描述符），无需回写本地文件头。
+    """
+
+    def __init__(self, wfile, chunk_bytes=ZIP_CHUNK_BYTES):
+        self._wfile = wfile
+        self._chunk_bytes = chunk_bytes
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        if len(self._buf) >= self._chunk_bytes:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buf:
+            self._wfile.write(b'%x\r\n%s\r\n' % (len(self._buf), bytes(self._buf)))
+            self._buf.clear()
+
+    def finish(self):
+        self.flush()
+        self._wfile.write(b'0\r\n\r\n')
+
+
+def fetch_reports(test_ids, threshold=PASS_THRESHOLD):
+    """批量取数：试验信息与 strip_stats 各一次查询 -> [(test, strips, overall)]，按 test_ids 顺序。"""
+    ids = [int(t) for t in test_ids]
+    tests = query(TEST_SQL + " WHERE t.id = ANY(%s)", (ids,), fetchall=True) or []
+    by_id = {int(t['id']): dict(t) for t in tests}
+    ids = [t for t in ids if t in by_id]
+    summaries = test_summaries(ids, threshold)
+    return [(by_id[t], *summaries[t]) for t in ids]
+
+
+def _executor():
+    """进程内共享的渲染进程池；单核或受限环境（无 /dev/shm 等）返回 None，改为串行。"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = False
+            if REPORT_WORKERS > 1:
+                try:
+                    _pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS)
+                except (OSError, NotImplementedError, ImportError):
+                    pass
+        return _pool or None
+
+
+def render_reports(test_ids, threshold=PASS_THRESHOLD):
+    """按 test_ids 顺序逐份产出 (test, 字节流, 文件名)。
+
+    数据一次批量取回，report_cache 命中的报告直接读取；其余在多核时由进程池并行渲染，
+    在途任务不超过 2 × 进程数，已完成但未取走的报告数随之有界。未命中报告的图数据
+    随渲染进度每 CHART_BATCH 份批量取回一次。
+    """
+    jobs = fetch_reports(test_ids, threshold)
+    keys = [report_key(job[0], threshold, REPORT_TEMPLATE) for job in jobs]
+    hits = cached_keys(keys)
+    pool = _executor() if sum(k not in hits for k in keys) > 1 else None
+
+    def start(job, key, charts):
+        if key in hits:
+            return lambda: load_report(key) or render_report(*job, _charts(job), threshold)
+        if pool is None:
+            return lambda: render_report(*job, charts, threshold)
+        # 图数据在主进程取回，绘图与排版在工作进程
+        return pool.submit(render_report, *job, charts, threshold).result
+
+    tasks = _with_charts(jobs, keys, hits)
+    pending = deque((job, key, start(job, key, charts))
+                    for job, key, charts in itertools.islice(tasks, 2 * REPORT_WORKERS if pool else 1))
+    while pending:
+        job, key, result = pending.popleft()
+        nxt = next(tasks, None)
+        if nxt:
+            pending.append((*nxt[:2], start(*nxt)))
+        content, fname = result()
+        if key and key not in hits:
+            store_report(key, job[0]['id'], content, fname)
+        yield job[0], content, fname
+
+
+def _with_charts(jobs, keys, hits):
+    """逐份产出 (job, key, 图数据)；缓存命中的报告不取图数据。"""
+    for i in range(0, len(jobs), CHART_BATCH):
+        batch = list(zip(jobs[i:i + CHART_BATCH], keys[i:i + CHART_BATCH]))
+        charts = chart_data_many([(job[0]['id'], job[1]) for job, key in batch if key not in hits])
+        for job, key in batch:
+            yield job, key, charts.get(int(job[0]['id']))
+
+
+def _charts(job):
+    test, strips, _ = job
+    return chart_data(test['id'], strips)
+
+
+def write_project_zip(fp, tests, threshold=PASS_THRESHOLD, progress=None):
+    """tests 为含 id / project_id 的行；报告生成一份即写入一个 zip 条目。
+
+    跨多个项目时条目按 project_<id>/ 分目录；progress(已写入份数) 供异步任务上报进度。
+    """
+    multi = len({t['project_id'] for t in tests}) > 1
+    with zipfile.ZipFile(fp, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for done, (test, content, fname) in enumerate(
+                render_reports([t['id'] for t in tests], threshold), 1):
+            zf.writestr(f"project_{test['project_id']}/{fname}" if multi else fname, content)
+            if progress:
+                progress(done)
+
+
+def _build_report(test_id, threshold=PASS_THRESHOLD):
+    """读取试验数据，生成 .docx 字节流（论文 5.8 报告结构）；threshold 为合格阈值(N)。"""
+    test = query(TEST_SQL + " WHERE t.id = %s", (test_id,), fetchone=True)
     if not test:
         return None, None
+    # 已完成试验的 .docx 按内容寻址缓存，命中即直接返回
+    key = report_key(test, threshold, REPORT_TEMPLATE)
+    hit = load_report(key) if key else None
+    if hit:
+        return hit
 
-    strips = query(
-        """SELECT strip_number,
-                  ROUND(AVG(force_value)::numeric,2) as avg_force,
-                  ROUND(MAX(force_value)::numeric,2) as max_force,
-                  ROUND(MIN(force_value)::numeric,2) as min_force,
-                  ROUND(STDDEV(force_value)::numeric,2) as std_force,
-                  (AVG(force_value) >= %s) as pass_fail
-           FROM data_points WHERE test_id = %s
-           GROUP BY strip_number ORDER BY strip_number""",
-        (PASS_THRESHOLD, test_id), fetchall=True)
-
-    overall = query(
-        """SELECT ROUND(AVG(force_value)::numeric,2) as avg_force,
-                  ROUND(MAX(force_value)::numeric,2) as max_force,
-                  ROUND(MIN(force_value)::numeric,2) as min_force,
-                  COUNT(*) as total_points,
-                  ROUND(AVG(CASE WHEN force_value>=%s THEN 1.0 ELSE 0.0 END)*100,2) as pass_rate
-           FROM data_points WHERE test_id = %s""",
-        (PASS_THRESHOLD, test_id), fetchone=True)
+    # 逐条带与整体统计取自 strip_stats 运行聚合；已完成试验经 result_cache 缓存
+    strips, overall = cached('report_summary', test, threshold,
+                             lambda: test_summary(int(test_id), threshold))
+    content, fname = render_report(test, strips, overall, chart_data(test['id'], strips), threshold)
+    if key:
+        store_report(key, test['id'], content, fname)
+    return content, fname
 
+
+def render_report(test, strips, overall, charts=None, threshold=PASS_THRESHOLD):
+    """由已取得的数据渲染 .docx -> (字节流, 文件名)；不访问数据库，可在工作进程中执行。
+
+    charts 为 report_charts.chart_data 的结果，None 时报告不含图。
+    """
+    test_id = test['id']
     doc = Document()
     title = doc.add_heading('管道补口防腐层剥离试验报告', level=0)
     title.alignment = WD_ALIGN_PARAGRAPH.CENTER
@@ -78,7 +216,7 @@ def _build_report(test_id):
     p.add_run(f"峰值剥离力：{overall['max_force']} N\n")
     p.add_run(f"最小剥离力：{overall['min_force']} N\n")
     p.add_run(f"力-位采样点总数：{overall['total_points']}\n")
-    p.add_run(f"合格阈值：{PASS_THRESHOLD:.0f} N（≈35 N/cm）\n")
+    p.add_run(f"合格阈值：{threshold:g} N\n")
     p.add_run(f"采样点合格率：{overall['pass_rate']} %")
 
     doc.add_heading('三、各条带剥离力统计', level=1)
@@ -108,6 +246,15 @@ def _build_report(test_id):
         ("整体粘接质量良好。" if rate >= 60 else "存在较多弱粘/缺陷区域，建议复检该补口。"))
     run.bold = True
 
+    figures = render_charts(charts, threshold)
+    if figures:
+        doc.add_heading('五、剥离力曲线与分布图', level=1)
+        for i, (caption, png) in enumerate(figures, 1):
+            doc.add_picture(io.BytesIO(png), width=Cm(16))
+            doc.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
+            cap = doc.add_paragraph(f'图 {i}  {caption}')
+            cap.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
     foot = doc.add_paragraph(
         f"报告生成时间：{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}    "
         "管道补口自动剥离系统 PCS")
@@ -129,13 +276,18 @@ class handler(BaseHTTPRequestHandler):
             params = get_query_params(self)
             action = params.get('action', 'test')
             payload = get_user_from_request(self.headers)
+            try:
+                threshold = get_threshold(params.get('threshold'))
+            except ValueError as e:
+                error_response(self, str(e))
+                return
 
             if action == 'test':
                 test_id = params.get('test_id') or params.get('id')
                 if not test_id:
                     error_response(self, '缺少试验ID')
                     return
-                content, fname = _build_report(test_id)
+                content, fname = _build_report(test_id, threshold)
                 if content is None:
                     error_response(self, '试验不存在', 404)
                     return
@@ -146,33 +298,104 @@ class handler(BaseHTTPRequestHandler):
                                 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
 
             elif action == 'project':
-                project_id = params.get('project_id') or params.get('id')
-                if not project_id:
+                # project_id 可逗号分隔多个项目，合并为一个 zip
+                raw = params.get('project_id') or params.get('id') or ''
+                try:
+                    project_ids = [int(p) for p in raw.split(',') if p.strip()]
+                except ValueError:
+                    error_response(self, '项目ID格式错误')
+                    return
+                if not project_ids:
                     error_response(self, '缺少项目ID')
                     return
                 tests = query(
-                    "SELECT id FROM tests WHERE project_id = %s AND status = 'completed' ORDER BY id",
-                    (project_id,), fetchall=True)
+                    """SELECT id, project_id FROM tests
+                       WHERE project_id = ANY(%s) AND status = 'completed'
+                       ORDER BY project_id, id""",
+                    (project_ids,), fetchall=True)
                 if not tests:
                     error_response(self, '该项目暂无已完成试验', 404)
                     return
-                zbuf = io.BytesIO()
-                with zipfile.ZipFile(zbuf, 'w', zipfile.ZIP_DEFLATED) as zf:
-                    for t in tests:
-                        content, fname = _build_report(t['id'])
-                        if content:
-                            zf.writestr(fname, content)
-                zbuf.seek(0)
                 if payload:
-                    query("INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
-                          (payload['user_id'], 'export_reports_zip', 'project', int(project_id)))
-                self._send_file(zbuf.getvalue(), f'reports_project_{project_id}.zip',
-                                'application/zip')
+                    for pid in project_ids:
+                        query("INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
+                              (payload['user_id'], 'export_reports_zip', 'project', pid))
+                self._send_zip_stream(tests, threshold,
+                                      f"reports_project_{'_'.join(map(str, project_ids))}.zip")
+            elif action == 'worker':
+                json_response(self, {'worker_alive': worker_alive()})
+            elif action == 'job':
+                job = job_status(params.get('job_id') or 0)
+                if not job:
+                    error_response(self, '任务不存在', 404)
+                    return
+                json_response(self, {'job': job})
+
+            elif action == 'job_download':
+                artifact = job_artifact(params.get('job_id') or 0)
+                if not artifact:
+                    error_response(self, '任务不存在或尚未完成', 404)
+                    return
+                chunks, fname, size = artifact
+                self._send_chunks(chunks, size, fname, 'application/zip' if fname.endswith('.zip') else
+                                  'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
             else:
                 error_response(self, f'未知操作: {action}')
         except Exception as e:
             error_response(self, str(e), 500)
 
+    def do_POST(self):
+        """异步导出：提交任务（scope=test/project/range），返回任务 ID 供轮询进度与下载。"""
+        try:
+            params = get_query_params(self)
+            body = get_body(self)
+            action = params.get('action') or body.get('action', 'jobs')
+            if action != 'jobs':
+                error_response(self, f'未知操作: {action}')
+                return
+            if not worker_alive():
+                error_response(self, '无报告任务工作进程，请直接下载', 503)
+                return
+            payload = get_user_from_request(self.headers)
+            try:
+                threshold = get_threshold(body.get('threshold'))
+                job = submit(body.get('scope', 'project'), body, threshold, REPORT_TEMPLATE,
+                             payload['user_id'] if payload else None)
+            except ValueError as e:
+                error_response(self, str(e))
+                return
+            except LookupError as e:
+                error_response(self, str(e), 404)
+                return
+            if payload and job['created']:
+                query("INSERT INTO audit_log (user_id, action, resource_type, resource_id, details) VALUES (%s,%s,%s,%s,%s)",
+                      (payload['user_id'], 'submit_report_job', 'report_job', job['id'],
+                       json.dumps({'scope': job['scope'], 'total': job['total']})))
+            json_response(self, {'job': job}, 202 if job['created'] else 200)
+        except Exception as e:
+            error_response(self, str(e), 500)
+
+    def _send_zip_stream(self, tests, threshold, filename):
+        """分块传输流式 zip：每份报告生成后即写出，首字节不必等待全部报告。"""
+        self.protocol_version = 'HTTP/1.1'   # 分块传输需 HTTP/1.1，写完即关闭连接
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Disposition', f'attachment; filename={filename}')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        out = _ChunkedWriter(self.wfile)
+        try:
+            write_project_zip(out, tests, threshold)
+            out.finish()
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # 客户端中途断开
+        except Exception:
+            # 响应头已发出，无法改写为错误响应：记录异常后不写结束块，客户端据此判定下载不完整
+            traceback.print_exc()
+
     def _send_file(self, content, filename, content_type):
         self.send_response(200)
         self.send_header('Content-Type', content_type)
@@ -181,3 +404,14 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
         self.wfile.write(content)
+
+    def _send_chunks(self, chunks, size, filename, content_type):
+        """已知总长的分块产物：Content-Length 定长响应，逐块写出不整体驻留内存。"""
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Disposition', f'attachment; filename={filename}')
+        self.send_header('Content-Length', str(size))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
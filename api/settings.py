@@ -5,6 +5,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api._lib.db import query, execute
 from api._lib.auth import get_user_from_request, can_modify
+from api._lib.aggregates import reset_configured_threshold, validate_threshold_setting
 from api._lib.response import json_response, error_response, options_response, get_body
 
 
@@ -34,11 +35,19 @@ class handler(BaseHTTPRequestHandler):
             if not updates:
                 error_response(self, '没有要更新的设置')
                 return
+            if 'pass_threshold' in updates:
+                try:
+                    validate_threshold_setting(updates['pass_threshold'])
+                except ValueError as e:
+                    error_response(self, str(e))
+                    return
             for key, value in updates.items():
                 execute(
                     """UPDATE settings SET setting_value=%s, updated_by=%s, updated_at=NOW()
                        WHERE setting_key=%s""",
                     (str(value), payload['user_id'], key))
+            if 'pass_threshold' in updates:
+                reset_configured_threshold()
             query(
                 "INSERT INTO audit_log (user_id, action, resource_type, details) VALUES (%s,%s,%s,%s)",
                 (payload['user_id'], 'update_settings', 'settings', json.dumps(updates)))
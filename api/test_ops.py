@@ -3,10 +3,17 @@ import json
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api._lib.db import query, execute
+from api._lib.db import query, execute, execute_returning, transaction
 from api._lib.auth import get_user_from_request, can_modify
 from api._lib.response import json_response, error_response, options_response, get_body, get_query_params
-from api._lib.simulator import build_replay_template, compute_test_summary
+from api._lib.simulator import (build_replay_template, compute_test_summary,
+                                cache_replay_template, invalidate_replay_template)
+from api._lib.playback import scheduler
+from api._lib.aggregates import get_threshold, test_summary
+from api._lib.result_cache import cached, invalidate as invalidate_results
+from api._lib.report_cache import invalidate as invalidate_reports
+from api._lib.pyramid import build_pyramid
+from api._lib.rollup import build_rollup
 
 
 class handler(BaseHTTPRequestHandler):
@@ -14,13 +21,18 @@ class handler(BaseHTTPRequestHandler):
         options_response(self)
 
     def do_GET(self):
-        """试验详情：含逐条带统计（由 data_points 聚合）与仿真状态。"""
+        """试验详情：含逐条带统计（读取 strip_stats 运行聚合）与仿真状态。"""
         try:
             params = get_query_params(self)
             tid = params.get('id') or params.get('test_id')
             if not tid:
                 error_response(self, '缺少试验ID')
                 return
+            try:
+                threshold = get_threshold(params.get('threshold'))
+            except ValueError as e:
+                error_response(self, str(e))
+                return
 
             test = query(
                 """SELECT t.*, p.name as project_name
@@ -32,18 +44,9 @@ class handler(BaseHTTPRequestHandler):
                 error_response(self, '试验不存在', 404)
                 return
 
-            results = query(
-                """SELECT strip_number,
-                          ROUND(AVG(force_value)::numeric, 2) AS avg_force,
-                          ROUND(MAX(force_value)::numeric, 2) AS max_force,
-                          ROUND(MIN(force_value)::numeric, 2) AS min_force,
-                          ROUND(STDDEV(force_value)::numeric, 2) AS std_force,
-                          ROUND(MAX(position_mm)::numeric, 2) AS total_displacement,
-                          (AVG(force_value) >= 70) AS pass_fail
-                   FROM data_points WHERE test_id = %s
-                   GROUP BY strip_number ORDER BY strip_number""",
-                (tid,), fetchall=True
-            )
+            # 已完成试验的逐条带结果经 result_cache 缓存
+            results = cached('test_results', test, threshold,
+                             lambda: test_summary(int(tid), threshold)[0])
 
             json_response(self, {'test': test, 'results': results,
                                  'simulation': {'is_running': test['is_running'],
@@ -98,7 +101,8 @@ class handler(BaseHTTPRequestHandler):
                 error_response(self, '缺少试验ID')
                 return
 
-            test = query("SELECT * FROM tests WHERE id = %s", (test_id,), fetchone=True)
+            test = query("SELECT id, project_id, is_running, peel_speed FROM tests WHERE id = %s",
+                         (test_id,), fetchone=True)
             if not test:
                 error_response(self, '试验不存在', 404)
                 return
@@ -118,44 +122,63 @@ class handler(BaseHTTPRequestHandler):
                 n_strips = template['n_strips']
                 total_mm = template['max_pos']
 
-                execute("DELETE FROM data_points WHERE test_id = %s", (test_id,))
-                execute(
-                    """UPDATE tests SET status='running', is_running=TRUE,
-                       start_time=NOW(), end_time=NULL, current_position=0,
-                       n_strips=%s, total_positions=%s, peel_speed=%s, profiles=%s,
-                       max_force=NULL, pass_rate=NULL WHERE id=%s""",
-                    (n_strips, int(total_mm), speed, json.dumps(template), test_id)
-                )
-                execute("UPDATE projects SET status='in_progress', updated_at=NOW() WHERE id=%s",
-                        (test['project_id'],))
-                query(
-                    "INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
-                    (payload['user_id'], 'start_test', 'test', int(test_id))
-                )
+                invalidate_replay_template(test_id)
+                with transaction():
+                    execute("DELETE FROM data_points WHERE test_id = %s", (test_id,))
+                    execute("DELETE FROM strip_latest WHERE test_id = %s", (test_id,))
+                    execute("DELETE FROM strip_stats WHERE test_id = %s", (test_id,))
+                    execute("DELETE FROM force_pyramid WHERE test_id = %s", (test_id,))
+                    execute("DELETE FROM test_rollup WHERE test_id = %s", (test_id,))
+                    invalidate_results(test_id)
+                    invalidate_reports(test_id)
+                    started = execute_returning(
+                        """UPDATE tests SET status='running', is_running=TRUE,
+                           start_time=NOW(), end_time=NULL, current_position=0,
+                           n_strips=%s, total_positions=%s, peel_speed=%s, profiles=%s,
+                           max_force=NULL, pass_rate=NULL WHERE id=%s RETURNING start_time""",
+                        (n_strips, int(total_mm), speed, json.dumps(template), test_id)
+                    )
+                    execute("UPDATE projects SET status='in_progress', updated_at=NOW() WHERE id=%s",
+                            (test['project_id'],))
+                    query(
+                        "INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
+                        (payload['user_id'], 'start_test', 'test', int(test_id))
+                    )
+                cache_replay_template(test_id, started['start_time'], template)
+                # 回放由调度器按墙钟推进，无需依赖客户端轮询
+                scheduler.ensure(test_id)
                 json_response(self, {'message': '试验已启动（真实数据回放）', 'status': 'running',
                                      'n_strips': n_strips, 'total_mm': total_mm,
                                      'source_test_id': template.get('source_test_id')})
 
             elif action == 'stop':
-                execute(
-                    """UPDATE tests SET status='completed', is_running=FALSE, end_time=NOW()
-                       WHERE id=%s""", (test_id,))
-                summary = compute_test_summary(int(test_id))
-                query(
-                    "INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
-                    (payload['user_id'], 'stop_test', 'test', int(test_id))
-                )
+                scheduler.stop(test_id)
+                with transaction():
+                    execute(
+                        """UPDATE tests SET status='completed', is_running=FALSE, end_time=NOW()
+                           WHERE id=%s""", (test_id,))
+                    build_pyramid(int(test_id))
+                    build_rollup(int(test_id))
+                    summary = compute_test_summary(int(test_id))
+                    query(
+                        "INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
+                        (payload['user_id'], 'stop_test', 'test', int(test_id))
+                    )
+                invalidate_replay_template(test_id)
                 json_response(self, {'message': '试验已停止', 'status': 'completed',
                                      'summary': summary})
 
             elif action == 'abort':
-                execute(
-                    """UPDATE tests SET status='aborted', is_running=FALSE, end_time=NOW()
-                       WHERE id=%s""", (test_id,))
-                query(
-                    "INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
-                    (payload['user_id'], 'abort_test', 'test', int(test_id))
-                )
+                scheduler.stop(test_id)
+                with transaction():
+                    execute(
+                        """UPDATE tests SET status='aborted', is_running=FALSE, end_time=NOW()
+                           WHERE id=%s""", (test_id,))
+                    query(
+                        "INSERT INTO audit_log (user_id, action, resource_type, resource_id) VALUES (%s,%s,%s,%s)",
+                        (payload['user_id'], 'abort_test', 'test', int(test_id))
+                    )
+                invalidate_replay_template(test_id)
                 json_response(self, {'message': '试验已中止（急停）', 'status': 'aborted'})
             else:
                 error_response(self, f'未知操作: {action}')
@@ -284,7 +284,7 @@ const Charts = {
                 markLine: {
                     silent: true, symbol: 'none',
                     data: [{ yAxis: CONFIG.PASS_THRESHOLD, lineStyle: { color: '#ff3366', type: 'dashed' },
-                             label: { formatter: '阈值 70N', color: '#ff3366' } },
+                             label: { formatter: `阈值 ${CONFIG.PASS_THRESHOLD}N`, color: '#ff3366' } },
                            { yAxis: CONFIG.GOOD_BOND_PLATFORM, lineStyle: { color: '#00ff88', type: 'dashed' },
                              label: { formatter: '平台 96N', color: '#00ff88' } }]
                 }
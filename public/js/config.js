@@ -1,6 +1,7 @@
 const CONFIG = {
     API_BASE: '/api',
     POLLING_INTERVAL: 200,        // 实时刷新 200ms（论文 3.2.2 / 5.4）
+    REALTIME_SSE: false,          // SSE 推送（需普通 HTTP 服务器部署 api/realtime_stream.py；Vercel 缓冲响应，保持关闭）
     STRIP_COUNT: 30,              // 大屏最多展示 30 条带
     PIPE_DIAMETER: 1016,          // 管道直径 mm
     LAYER_WIDTH: 600,             // 防腐层宽度 mm
@@ -0,0 +1,65 @@
+// 实时数据增量合并：realtime_poll 首帧返回全量快照，其后携带 cursor 仅取新揭示的点
+const RealtimeFeed = {
+    HISTORY_LIMIT: 600,
+    FIRST_FRAME_TIMEOUT: 3000,
+
+    create(testId) {
+        return { testId, cursor: null, history: [], latest: {} };
+    },
+
+    pollUrl(feed) {
+        let url = `/realtime_poll?test_id=${feed.testId}`;
+        if (feed.cursor) url += `&since_id=${feed.cursor}`;
+        return url;
+    },
+
+    // 合并一帧响应，返回与全量协议等价的 latest_data / recent_history（按 id 降序）
+    merge(feed, data) {
+        if (!data) return data;
+        if (!data.delta) {
+            feed.history = data.recent_history || [];
+            feed.latest = {};
+            feed.cursor = data.cursor || null;
+        } else {
+            // 轮询请求可能重叠或乱序返回：只接收比已有数据更新的点
+            const top = feed.history.length ? feed.history[0].id : 0;
+            const fresh = (data.recent_history || []).filter(d => d.id > top);
+            feed.history = fresh.concat(feed.history).slice(0, this.HISTORY_LIMIT);
+            feed.cursor = Math.max(feed.cursor || 0, data.cursor || 0) || null;
+        }
+        (data.latest_data || []).forEach(d => {
+            const prev = feed.latest[d.strip_number];
+            if (!prev || d.id >= prev.id) feed.latest[d.strip_number] = d;
+        });
+        return {
+            ...data,
+            latest_data: Object.values(feed.latest).sort((a, b) => a.strip_number - b.strip_number),
+            recent_history: feed.history,
+        };
+    },
+
+    // SSE 推送：一条长连接替代逐帧请求；首帧超时（如平台缓冲响应）或出错则回退短轮询
+    stream(feed, onFrame, onFallback) {
+        if (!CONFIG.REALTIME_SSE || typeof EventSource === 'undefined') {
+            onFallback();
+            return null;
+        }
+        let url = `${CONFIG.API_BASE}/realtime_stream?test_id=${feed.testId}`;
+        if (feed.cursor) url += `&since_id=${feed.cursor}`;
+        const es = new EventSource(url);
+        let received = false;
+        const fallback = () => {
+            clearTimeout(timer);
+            es.close();
+            onFallback();
+        };
+        const timer = setTimeout(() => { if (!received) fallback(); }, this.FIRST_FRAME_TIMEOUT);
+        es.addEventListener('frame', e => {
+            received = true;
+            onFrame(this.merge(feed, JSON.parse(e.data)));
+        });
+        es.addEventListener('end', () => { clearTimeout(timer); es.close(); });
+        es.onerror = () => { if (!received) fallback(); };
+        return es;
+    },
+};
@@ -0,0 +1,84 @@
+"""analysis 数据集 CSV 读取耗时基准：比较逐单元格解析（csv + float）与 numpy 向量化解析。
+
+用法：
+    python tests/bench_load_sample.py [--repeat 10] [--root 数据目录]
+
+数据目录存在时（默认 analysis.dataset.DATA_DIR，或 --root）遍历全部 CSV；
+否则按 P1016R-02F 规模（82 条带 × 2800 行，行尾逗号）构造合成文件。
+两条路径的结果逐文件比对，必须完全一致。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from analysis import dataset
+
+
+def synthetic(tmp, n_files=4, n_strips=82, n_rows=2800, seed=1):
+    rnd = random.Random(seed)
+    paths = []
+    for i in range(n_files):
+        path = os.path.join(tmp, f'P1016R-02F-{i + 1}.csv')
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            for _ in range(n_rows):
+                row = [f'{rnd.gauss(96, 5) if rnd.random() < 0.7 else rnd.gauss(25, 5):.2f}'
+                       for _ in range(n_strips)]
+                f.write(','.join(row) + ',\r\n')
+        paths.append(path)
+    return paths
+
+
+def legacy(path):
+    with open(path, 'rb') as f:
+        return dataset._parse_cells(f.read().decode('utf-8-sig'))
+
+
+def timed(fn, paths, repeat):
+    costs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for p in paths:
+            fn(p)
+        costs.append((time.perf_counter() - t0) * 1000 / len(paths))
+    return statistics.median(costs), min(costs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', type=int, default=10)
+    ap.add_argument('--root', default=dataset.DATA_DIR)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if os.path.isdir(args.root):
+            paths = [os.path.join(args.root, n) for n in sorted(os.listdir(args.root))
+                     if n.lower().endswith('.csv')]
+            source = args.root
+        else:
+            paths = synthetic(tmp)
+            source = '合成数据（82 条带 × 2800 行）'
+
+        fast = sum(dataset._parse_fast(open(p, 'rb').read().decode('utf-8-sig')) is not None
+                   for p in paths)
+        mismatched = [p for p in paths
+                      if not np.array_equal(dataset.load_sample(p), legacy(p), equal_nan=True)]
+        print(f"{source}：{len(paths)} 个文件，向量化路径 {fast} 个，重复 {args.repeat} 次（毫秒/文件）")
+        for name, fn in [('逐单元格解析', legacy), ('load_sample', dataset.load_sample)]:
+            med, best = timed(fn, paths, args.repeat)
+            print(f"  {name:<16} 中位 {med:8.1f}   最快 {best:8.1f}")
+        if mismatched:
+            sys.exit(f'结果不一致：{mismatched}')
+
+
+if __name__ == '__main__':
+    main()
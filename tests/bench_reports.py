@@ -0,0 +1,90 @@
+"""Word 报告渲染耗时基准（无需数据库）：比较不含图 / 内嵌三幅图（复用 Figure）/ 每次新建 Figure。
+
+用法：
+    python tests/bench_reports.py [--repeat 20] [--strips 82] [--stroke 2800]
+
+以 P1016R-02F 规模（82 条带、约 2.8 m 行程）构造降采样图数据：曲线 ≤ CURVE_POINTS 桶，
+热力图 ≤ HEATMAP_BINS 列，直方图 2 N 分桶，与 report_charts.chart_data 取回的数据同形。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import reports
+from api._lib import report_charts
+
+
+def synthetic(n_strips, stroke_mm, seed=1):
+    rnd = random.Random(seed)
+    level = 4
+    n_curve = min(report_charts.CURVE_POINTS, int(stroke_mm // level))
+    n_cols = min(report_charts.HEATMAP_BINS, int(stroke_mm // 16))
+    strips = [{'strip_number': i, 'avg_force': 60 + rnd.random() * 40, 'max_force': 110.0,
+               'min_force': 5.0, 'std_force': 12.0, 'pass_fail': True} for i in range(1, n_strips + 1)]
+    hist = [0] * 100
+    for _ in range(20000):
+        v = rnd.gauss(96, 5) if rnd.random() < 0.7 else rnd.gauss(25, 5)
+        hist[min(99, max(0, int(v / report_charts.HIST_BIN_N)))] += 1
+    charts = {
+        'strip_number': 30,
+        'curve': [(level * i, 50 + rnd.random() * 20, 75 + rnd.random() * 10, 90 + rnd.random() * 10)
+                  for i in range(n_curve)],
+        'heatmap': {'grid': [20 + 80 * rnd.random() for _ in range(n_strips * n_cols)],
+                    'shape': [n_strips, n_cols], 'pos_from': 0, 'pos_to': n_cols * 16,
+                    'strips': list(range(1, n_strips + 1))},
+        'hist': hist,
+    }
+    test = {'id': 1, 'test_number': 'BENCH-001', 'sample_name': 'P1016R-02F', 'operator': 'bench',
+            'peel_speed': 10, 'status': 'completed', 'n_strips': n_strips, 'project_name': 'bench',
+            'pipe_diameter': 1016, 'layer_width': 600, 'layer_thickness': 1.0, 'location': '-'}
+    overall = {'avg_force': 77.8, 'max_force': 110.0, 'min_force': 5.0,
+               'total_points': n_strips * stroke_mm, 'pass_rate': 66.7}
+    return test, strips, overall, charts
+
+
+def timed(fn, repeat):
+    fn()    # 预热：导入、字体解析、首个 Figure 创建
+    costs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        costs.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(costs), min(costs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--strips', type=int, default=82)
+    ap.add_argument('--stroke', type=int, default=2800)
+    args = ap.parse_args()
+    if not report_charts.AVAILABLE:
+        sys.exit('需要 matplotlib：pip install matplotlib')
+
+    test, strips, overall, charts = synthetic(args.strips, args.stroke)
+
+    def cold():
+        report_charts._figures.clear()    # 每次重建 Figure / 画布 / 样式，模拟不复用
+        reports.render_report(test, strips, overall, charts)
+
+    cases = [
+        ('不含图', lambda: reports.render_report(test, strips, overall, None)),
+        ('三幅图 · 复用 Figure', lambda: reports.render_report(test, strips, overall, charts)),
+        ('三幅图 · 每次新建 Figure', cold),
+        ('仅绘图 · 复用 Figure', lambda: report_charts.render_charts(charts, 70.0)),
+    ]
+    print(f"{args.strips} 条带 / {args.stroke} mm，重复 {args.repeat} 次（毫秒/份）")
+    for name, fn in cases:
+        med, best = timed(fn, args.repeat)
+        print(f"  {name:<24} 中位 {med:8.1f}   最快 {best:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -156,18 +156,28 @@ class Runner:
         # TC-07 实时轮询
         try:
             frames = 0
+            deltas = 0
             last = None
+            cursor = None
             for _ in range(6):
-                r, _ = self.req('GET', f"/api/realtime_poll?test_id={d.get('tid')}")
+                path = f"/api/realtime_poll?test_id={d.get('tid')}"
+                if cursor:
+                    path += f"&since_id={cursor}"
+                r, _ = self.req('GET', path)
                 if r.status_code == 200:
                     j = r.json()
                     last = j
-                    if j.get('latest_data'):
+                    if j.get('latest_data') or j.get('delta'):
                         frames += 1
+                    if j.get('delta'):
+                        deltas += 1
+                    cursor = j.get('cursor')
                 time.sleep(0.25)
-            ok = frames >= 3 and last and last.get('stats', {}).get('max_force', 0) >= 0
+            ok = (frames >= 3 and deltas >= 1 and last
+                  and last.get('stats', {}).get('max_force', 0) >= 0)
             self.record("TC-07", CASES[6][1], ok,
-                        f"有效数据帧={frames}/6 进度={last.get('progress') if last else '-'}%")
+                        f"有效数据帧={frames}/6 增量帧={deltas} "
+                        f"进度={last.get('progress') if last else '-'}%")
         except Exception as e:
             self.record("TC-07", CASES[6][1], False, str(e))
 
@@ -219,8 +229,19 @@ class Runner:
             r, _ = self.req('GET', f"/api/data?action=history&test_id={tid}&strip_number=1&per_page=500")
             j = r.json()
             ok = r.status_code == 200 and len(j.get('data', [])) > 0
+            pages = 1
+            if ok and j.get('has_more'):
+                # 键集续页：下一页首行排序键必须严格大于上一页末行
+                r2, _ = self.req('GET', f"/api/data?action=history&test_id={tid}&strip_number=1"
+                                        f"&per_page=500&cursor={j['next_cursor']}")
+                j2 = r2.json()
+                a, b = j['data'][-1], (j2.get('data') or [None])[0]
+                ok = r2.status_code == 200 and b is not None and (
+                    (float(b['position_mm']), b['id']) > (float(a['position_mm']), a['id']))
+                pages = 2
             self.record("TC-10", CASES[9][1], ok,
-                        f"history={r.status_code} points={len(j.get('data', []))}")
+                        f"history={r.status_code} points={len(j.get('data', []))} "
+                        f"total={j.get('total')} pages={pages}")
         except Exception as e:
             self.record("TC-10", CASES[9][1], False, str(e))
 
@@ -3,9 +3,12 @@
 运行：python tests/offline_unit.py
 """
 import io
+import json
 import os
+import pickle
 import sys
 import zipfile
+from contextlib import contextmanager
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -75,7 +78,12 @@ class _FakeConn:
         pass
 
 
-simulator.get_connection = lambda: _FakeConn()
+@contextmanager
+def _fake_transaction():
+    yield _FakeConn()
+
+
+simulator.transaction = _fake_transaction
 simulator.psycopg2.extras.execute_values = lambda cur, sql, rows: captured.update(rows=rows)
 
 template = {'replay': {'1': [[0.0, 10.0, 10], [5.0, 90.0, 10], [10.0, 95.0, 10]],
@@ -90,6 +98,732 @@ n2 = simulator.reveal(7, template, 5.0, 5.0)
 check("reveal 空区间不写入", n2 == 0)
 check("playback_step>0", simulator.playback_step(2786) > 0)
 
+unsorted = {'replay': {'3': [[10.0, 70.0, 10], [2.5, 60.0, 10], [5.0, 65.0]]}, 'max_pos': 10.0}
+captured.clear()
+simulator.reveal(7, unsorted, 2.5, 10.0)
+check("reveal 二分窗口(左开右闭)且容忍乱序/缺速度列",
+      [(r[2], r[3], r[4]) for r in captured.get('rows', [])] == [(5.0, 65.0, 10.0), (10.0, 70.0, 10.0)])
+check("列式索引按位置升序", list(simulator.index_replay_template(unsorted)[3][0]) == [2.5, 5.0, 10.0])
+
+# 1b') 回放模板缓存：按 (test_id, start_time) 命中，重启/停止后失效，LRU 淘汰
+profile_reads = []
+
+
+def fake_profile_query(sql, params=None, fetchone=False, fetchall=False):
+    profile_reads.append(params[0])
+    return {'profiles': '{"replay": {"1": [[1.0, 90.0, 10]]}, "max_pos": 1.0}', 'start_time': 'T1'}
+
+
+simulator.query = fake_profile_query
+t1 = simulator.get_replay_template(5, 'T1')
+t1b = simulator.get_replay_template(5, 'T1')
+check("模板缓存命中不再读库", t1 is t1b and profile_reads == [5], f"reads={profile_reads}")
+simulator.invalidate_replay_template(5)
+simulator.get_replay_template(5, 'T1')
+check("失效后重新读取模板", profile_reads == [5, 5])
+simulator.cache_replay_template(6, 'T2', template)
+check("启动预热后直接命中", simulator.get_replay_template(6, 'T2') is template and len(profile_reads) == 2)
+for i in range(simulator.TEMPLATE_CACHE_SIZE):
+    simulator.cache_replay_template(100 + i, 'T', template)
+simulator.get_replay_template(6, 'T2')
+check("LRU 淘汰最久未用模板", len(profile_reads) == 3)
+simulator.query = fake_sim_query
+
+
+# 1c) 连接池：复用、容量上限、空闲淘汰、断线重连
+from api._lib import db
+
+
+class _PoolConn:
+    opened = 0
+
+    def __init__(self):
+        _PoolConn.opened += 1
+        self.closed = 0
+
+    def get_transaction_status(self):
+        return 0
+
+    def close(self):
+        self.closed = 1
+
+
+pool = db.ConnectionPool(connect=_PoolConn, max_size=2, idle_timeout=60,
+                         check_after=60, wait_timeout=0.05)
+c1 = pool.getconn()
+pool.putconn(c1)
+c2 = pool.getconn()
+check("连接池复用已归还连接", c1 is c2 and _PoolConn.opened == 1)
+c3 = pool.getconn()
+try:
+    pool.getconn()
+    check("连接池容量上限", False)
+except Exception:
+    check("连接池容量上限", True)
+c2.close()
+pool.putconn(c2)
+pool.putconn(c3)
+c4 = pool.getconn()
+check("断开的连接被丢弃", c4 is c3)
+c5 = pool.getconn()
+check("断线后重连新连接", c5 is not c2 and not c5.closed and _PoolConn.opened == 3)
+pool.putconn(c4)
+pool.putconn(c5)
+pool.idle_timeout = -1
+c6 = pool.getconn()
+check("空闲超时连接被淘汰", c4.closed and c5.closed and c6 not in (c4, c5))
+pool.putconn(c6)
+pool.closeall()
+
+# 1d) 工作单元：事务内多条语句共用一条连接、一次提交；异常整体回滚
+class _TxCur:
+    rowcount = 1
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append(sql)
+
+    def fetchone(self):
+        return {'id': 1}
+
+
+class _TxConn(_PoolConn):
+    def __init__(self):
+        super().__init__()
+        self.statements, self.commits, self.rollbacks = [], 0, 0
+
+    def cursor(self, cursor_factory=None):
+        return _TxCur(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+_PoolConn.opened = 0
+db._pool = db.ConnectionPool(connect=_TxConn, max_size=2)
+with db.transaction() as tx_conn:
+    db.execute("DELETE FROM data_points WHERE test_id = %s", (1,))
+    db.execute("UPDATE tests SET status='running' WHERE id = %s", (1,))
+    with db.transaction():
+        db.query("INSERT INTO audit_log (user_id) VALUES (%s)", (1,))
+check("事务内共用一条连接", _PoolConn.opened == 1 and len(tx_conn.statements) == 3)
+check("事务一次提交", tx_conn.commits == 1, f"commits={tx_conn.commits}")
+try:
+    with db.transaction() as tx_conn:
+        db.execute("UPDATE tests SET status='completed' WHERE id = %s", (1,))
+        raise RuntimeError('boom')
+except RuntimeError:
+    pass
+check("事务异常回滚不提交", tx_conn.commits == 1 and tx_conn.rollbacks >= 1)
+db.execute("UPDATE tests SET status='aborted' WHERE id = %s", (1,))
+check("事务外语句逐条提交", tx_conn.commits == 2)
+db._pool.closeall()
+
+
+class _StreamCur(_TxCur):
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.batches = [[{'id': 1}], [{'id': 2}]]
+
+    def fetchmany(self, n):
+        return self.batches.pop(0) if self.batches else []
+
+
+class _StreamConn(_TxConn):
+    def cursor(self, name=None, cursor_factory=None):
+        return _StreamCur(self) if name else _TxCur(self)
+
+
+_PoolConn.opened = 0
+db._pool = db.ConnectionPool(connect=_StreamConn, max_size=3)
+s1, s2 = db.iter_query("SELECT 1"), db.iter_query("SELECT 2")
+check("两个流并行各取一批", next(s1) == [{'id': 1}] and next(s2) == [{'id': 1}])
+db.execute("UPDATE tests SET status='aborted' WHERE id = %s", (1,))
+check("流打开期间其它语句不并入流的事务", getattr(db._local, 'conn', None) is None
+      and _PoolConn.opened == 3, f"opened={_PoolConn.opened}")
+s1.close()
+check("流读完提交、中途关闭不提交并归还连接", list(s2) == [[{'id': 2}]]
+      and sorted(c.commits for c, _ in db._pool._idle) == [0, 1, 1] and db._pool._size == 3)
+db._pool.closeall()
+
+
+# 1e') 回放调度：按墙钟与剥离速度推进，重复推进幂等，结束后退出
+from api._lib import playback
+
+check("墙钟目标位置(标准速度)", abs(playback.target_position(100, 10, playback.PLAYBACK_SECONDS / 2) - 50) < 1e-6)
+check("墙钟目标位置随剥离速度缩放", abs(playback.target_position(100, 20, playback.PLAYBACK_SECONDS / 4) - 50) < 1e-6)
+check("墙钟目标位置不超过全程", playback.target_position(100, 10, 1e6) == 100)
+
+pb_state = {'current_position': 0.0, 'is_running': True, 'elapsed': playback.PLAYBACK_SECONDS / 2}
+pb_reveals, pb_updates = [], []
+
+
+def fake_pb_query(sql, params=None, fetchone=False, fetchall=False):
+    return {'id': 9, 'total_positions': 100, 'peel_speed': 10, 'start_time': 'T', **pb_state}
+
+
+def fake_pb_execute(sql, params=None):
+    pb_updates.append(' '.join(sql.split()))
+    if 'current_position' in sql:
+        pb_state['current_position'] = params[0]
+    elif 'is_running=FALSE' in sql:
+        pb_state['is_running'] = False
+    return 1
+
+
+pb_tx = {'open': False}
+
+
+@contextmanager
+def pb_transaction():
+    pb_tx['open'] = True
+    try:
+        yield _FakeConn()
+    finally:
+        pb_tx['open'] = False
+
+
+playback.transaction = pb_transaction
+playback.query = fake_pb_query
+playback.execute = fake_pb_execute
+playback.get_replay_template = lambda tid, st: template
+playback.reveal = lambda tid, tpl, a, b: pb_reveals.append((a, b))
+playback.compute_test_summary = lambda tid: None
+pb_pyramids = []
+playback.build_pyramid = lambda tid: pb_pyramids.append((tid, pb_tx['open']))
+playback.build_rollup = lambda tid: pb_pyramids.append((tid, pb_tx['open']))
+check("推进至墙钟目标", playback.advance(9) is True and pb_reveals == [(0.0, 50.0)], f"{pb_reveals}")
+playback.advance(9)
+check("重复推进不重复揭示", pb_reveals == [(0.0, 50.0)])
+pb_state['current_position'] = 100.0
+check("到达全程后结束试验", playback.advance(9) is False and not pb_state['is_running'])
+check("完成时在行锁事务外构建力值金字塔与试验汇总", pb_pyramids == [(9, False), (9, False)], str(pb_pyramids))
+pb_sql = []
+playback.query = lambda sql, params=None, fetchone=False, fetchall=False: \
+    pb_sql.append(' '.join(sql.split())) or ({'is_running': True} if 'SKIP LOCKED' not in sql else None)
+check("行被占用时跳过本次推进", playback.advance(9) is True and 'FOR UPDATE SKIP LOCKED' in pb_sql[0]
+      and len(pb_sql) == 2, str(pb_sql))
+pb_sql.clear()
+playback.catch_up(9)
+check("常驻进程平台请求路径不推进", pb_sql == [])
+playback.INLINE_PLAYBACK = True
+playback.catch_up(9)
+playback.INLINE_PLAYBACK = False
+check("冻结实例平台请求路径补齐推进", len(pb_sql) == 2)
+playback.query = fake_pb_query
+off = playback.PlaybackScheduler(tick=0.01, enabled=False)
+off.ensure(9)
+check("冻结实例平台不启动 tick 线程", off.running() == [])
+
+sched = playback.PlaybackScheduler(tick=0.01)
+pb_state.update(current_position=0.0, is_running=True, elapsed=playback.PLAYBACK_SECONDS)
+sched.ensure(9)
+sched.ensure(9)
+check("每试验至多一个 tick 循环", sched.running() == [9])
+import time as _time
+for _ in range(200):
+    if not sched.running():
+        break
+    _time.sleep(0.01)
+check("试验结束后 tick 循环退出", sched.running() == [] and not pb_state['is_running'])
+
+
+# 1e) SSE 推送：有界缓冲溢出重新同步、Last-Event-ID 续传、心跳与结束事件
+from api._lib.realtime import FrameBuffer
+
+fb = FrameBuffer(2)
+check("有界缓冲写入", fb.put(1) and fb.put(2))
+check("缓冲溢出丢弃积压并告知重新同步", fb.put(3) is False and fb.get(0.01) is None)
+
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import api.realtime_stream as rs
+
+stream_calls = []
+
+
+def fake_build_frame(test_id, since_id=None):
+    stream_calls.append(since_id)
+    n = len(stream_calls)
+    return {'cursor': 100 + n, 'is_running': n < 3, 'delta': since_id is not None,
+            'latest_data': [], 'recent_history': []}
+
+
+rs.build_frame = fake_build_frame
+rs.FRAME_INTERVAL_SECONDS = 0.01
+srv = ThreadingHTTPServer(('127.0.0.1', 0), rs.handler)
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+req = urllib.request.Request(f'http://127.0.0.1:{srv.server_address[1]}/api/realtime_stream?test_id=1',
+                             headers={'Last-Event-ID': '42'})
+with urllib.request.urlopen(req, timeout=5) as resp:
+    ctype = resp.headers.get('Content-Type', '')
+    sse = resp.read().decode('utf-8')
+srv.shutdown()
+check("SSE 响应类型 text/event-stream", ctype.startswith('text/event-stream'), ctype)
+check("Last-Event-ID 续传为增量起点", stream_calls == [42, 101, 102], f"calls={stream_calls}")
+check("SSE 帧携带 id=cursor", 'id: 101\nevent: frame' in sse and 'id: 103\nevent: frame' in sse)
+check("试验结束发送 end 事件", sse.rstrip().endswith('event: end\ndata: {}'))
+
+rs.STREAMING_SUPPORTED = False
+stream_calls.clear()
+srv = ThreadingHTTPServer(('127.0.0.1', 0), rs.handler)
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+try:
+    urllib.request.urlopen(f'http://127.0.0.1:{srv.server_address[1]}/api/realtime_stream?test_id=1',
+                           timeout=5)
+    sse_status = 200
+except urllib.error.HTTPError as e:
+    sse_status = e.code
+srv.shutdown()
+rs.STREAMING_SUPPORTED = True
+check("缓冲响应平台拒绝 SSE 且不启动生产者", sse_status == 503 and stream_calls == [], str(sse_status))
+
+
+# 1f) 运行聚合：strip_stats 累加量还原的统计与逐点计算一致
+import statistics
+import api._lib.aggregates as aggregates
+
+agg_points = {1: [(10.0, 80.0), (20.0, 75.5), (30.0, 62.0)], 2: [(10.0, 40.0), (25.0, 71.0)]}
+agg_rows = [{'strip_number': k, 'n': len(v), 'sum_force': sum(f for _, f in v),
+             'sum_sq': sum(f * f for _, f in v), 'min_force': min(f for _, f in v),
+             'max_force': max(f for _, f in v), 'pass_count': sum(f >= 70 for _, f in v),
+             'max_position': max(p for p, _ in v)} for k, v in agg_points.items()]
+aggregates.query = lambda sql, params=None, fetchone=False, fetchall=False: \
+    {'pass_pts': 4} if 'pass_pts' in sql else agg_rows
+agg_strips, agg_overall = aggregates.test_summary(7)
+all_forces = [f for v in agg_points.values() for _, f in v]
+check("条带均值/标准差与逐点一致",
+      agg_strips[0]['avg_force'] == round(statistics.mean([80.0, 75.5, 62.0]), 2)
+      and agg_strips[0]['std_force'] == round(statistics.stdev([80.0, 75.5, 62.0]), 2),
+      str(agg_strips[0]))
+check("条带判定与位移", agg_strips[0]['pass_fail'] and not agg_strips[1]['pass_fail']
+      and agg_strips[1]['total_displacement'] == 25.0)
+check("整体统计与逐点一致",
+      agg_overall['avg_force'] == round(statistics.mean(all_forces), 2)
+      and agg_overall['std_force'] == round(statistics.stdev(all_forces), 2)
+      and agg_overall['max_force'] == 80.0 and agg_overall['min_force'] == 40.0
+      and agg_overall['total_points'] == 5 and agg_overall['pass_rate'] == 60.0,
+      str(agg_overall))
+check("自定义阈值影响条带判定与采样点合格率", aggregates.test_summary(7, 60.0)[0][1]['pass_fail'] is False
+      and aggregates.test_summary(7, 55.0)[0][1]['pass_fail'] is True
+      and aggregates.test_summary(7, 60.0)[1]['pass_rate'] == 80.0)
+
+
+# 1g) 历史数据键集分页：游标往返、续页条件、非法游标
+from decimal import Decimal
+import api.data as data_api
+from api._lib.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+tok = encode_cursor([3, Decimal('120.50'), 987654321])
+check("游标不透明且可往返", '=' not in tok and decode_cursor(tok, 3) == [3, '120.50', 987654321])
+try:
+    decode_cursor('not-a-cursor', 3)
+    check("非法游标被拒绝", False)
+except InvalidCursor:
+    check("非法游标被拒绝", True)
+
+hist_sql, hist_out = [], []
+hist_rows = [{'id': i, 'strip_number': 1, 'position_mm': Decimal(f'{i}.00'),
+              'force_value': 80, 'speed': 10, 'timestamp': None} for i in range(1, 5)]
+
+
+def hist_query(sql, params=None, fetchone=False, fetchall=False):
+    hist_sql.append((' '.join(sql.split()), list(params)))
+    if 'strip_stats' in sql or 'COUNT(*)' in sql:
+        return {'total': 4}
+    return hist_rows[:params[-1]]
+
+
+data_api.query = hist_query
+data_api.json_response = lambda h, body, status=200: hist_out.append((status, body))
+data_api.error_response = lambda h, msg, status=400: hist_out.append((status, msg))
+hh = data_api.handler.__new__(data_api.handler)
+hh._history({'test_id': '5', 'strip_number': '1', 'per_page': '3'})
+page1 = hist_out[-1][1]
+check("首页多取一行判断续页", page1['has_more'] and len(page1['data']) == 3
+      and hist_sql[0][1][-1] == 4 and 'OFFSET' not in hist_sql[0][0])
+check("首页附带 strip_stats 估计总数", page1.get('total') == 4 and 'strip_stats' in hist_sql[-1][0])
+hist_sql.clear()
+hh._history({'test_id': '5', 'strip_number': '1', 'per_page': '3', 'cursor': page1['next_cursor']})
+check("续页按 (strip, pos, id) 键集过滤且不再计数",
+      len(hist_sql) == 1 and '(strip_number, position_mm, id) > (%s, %s, %s)' in hist_sql[0][0]
+      and hist_sql[0][1][2:5] == [1, Decimal('3.00'), 3] and 'total' not in hist_out[-1][1])
+hh._history({'test_id': '5', 'cursor': 'bad'})
+check("非法游标返回 400", hist_out[-1][0] == 400)
+hist_sql.clear()
+hh._history({'test_id': '5', 'strip_number': '1', 'per_page': '3', 'page': '2'})
+check("旧 page 参数按 OFFSET 跳页并回传 page 与精确总数", hist_out[-1][1]['page'] == 2
+      and 'OFFSET %s' in hist_sql[0][0] and hist_sql[0][1][-2:] == [4, 3]
+      and 'COUNT(*)' in hist_sql[-1][0])
+hh._history({'test_id': '5', 'page': '0'})
+check("非法页码返回 400", hist_out[-1][0] == 400)
+for bad in ('abc', '1.5', '0', '999999'):
+    hist_sql.clear()
+    hh._history({'test_id': '5', 'strip_number': '1', 'downsample': 'lttb', 'points': bad})
+    check(f"非法降采样点数 {bad} 返回 400", hist_out[-1][0] == 400 and not hist_sql, str(hist_out[-1]))
+
+
+# 1h) CSV 流式导出：服务端游标分批读取，分块传输逐批写出
+export_state = {'batches': 0, 'closed': False}
+
+
+def fake_iter_query(sql, params=None, chunk_size=None):
+    try:
+        for b in range(3):
+            export_state['batches'] += 1
+            yield [{'strip_number': b + 1, 'position_mm': Decimal(f'{i}.00'), 'force_value': 75,
+                    'speed': 10, 'timestamp': None} for i in range(4)]
+    finally:
+        export_state['closed'] = True
+
+
+data_api.iter_query = fake_iter_query
+srv = ThreadingHTTPServer(('127.0.0.1', 0), data_api.handler)
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+with urllib.request.urlopen(f'http://127.0.0.1:{srv.server_address[1]}/api/data?action=export&test_id=5',
+                            timeout=5) as resp:
+    te = resp.headers.get('Transfer-Encoding', '')
+    csv_text = resp.read().decode('utf-8')
+srv.shutdown()
+csv_lines = csv_text.strip().splitlines()
+check("导出使用分块传输", te == 'chunked', te)
+check("导出含 BOM 表头与全部批次", csv_text.startswith('\ufeff条带编号') and len(csv_lines) == 13
+      and csv_lines[-1].startswith('3,3.00,75'), f"lines={len(csv_lines)}")
+check("游标生成器读完即关闭", export_state == {'batches': 3, 'closed': True}, str(export_state))
+
+import socket
+srv = ThreadingHTTPServer(('127.0.0.1', 0), data_api.handler)
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+with socket.create_connection(('127.0.0.1', srv.server_address[1]), timeout=5) as sock:
+    sock.sendall(b'GET /api/data?action=export&test_id=5 HTTP/1.0\r\n\r\n')
+    raw10 = b''
+    while True:
+        part = sock.recv(65536)
+        if not part:
+            break
+        raw10 += part
+srv.shutdown()
+head10, _, body10 = raw10.partition(b'\r\n\r\n')
+check("HTTP/1.0 请求不用分块传输、关闭连接结束", b'chunked' not in head10.lower()
+      and body10.decode('utf-8').startswith('\ufeff条带编号') and len(body10.decode('utf-8').strip().splitlines()) == 13)
+
+
+def failing_iter_query(sql, params=None, chunk_size=None):
+    yield [{'strip_number': 1, 'position_mm': 1, 'force_value': 75, 'speed': 10, 'timestamp': None}]
+    raise RuntimeError('db gone')
+
+
+data_api.iter_query = failing_iter_query
+eh = data_api.handler.__new__(data_api.handler)
+eh.wfile, eh.request_version = io.BytesIO(), 'HTTP/1.1'
+eh.send_response = eh.send_header = lambda *a: None
+eh.end_headers = lambda: None
+export_err = io.StringIO()
+import contextlib
+with contextlib.redirect_stderr(export_err):
+    eh._export({'test_id': '5'})
+data_api.iter_query = fake_iter_query
+check("导出中途数据库错误记录异常且不写结束块", 'db gone' in export_err.getvalue()
+      and not eh.wfile.getvalue().endswith(b'0\r\n\r\n')
+      and b'1,1,75' in eh.wfile.getvalue())
+
+
+# 1i) 列式导出：[position, strip] 矩阵（npz 免 numpy 写出；parquet/arrow 依赖可选 pyarrow）
+import numpy as np
+import api._lib.columnar as columnar
+
+col_points = [(1, '0.00', 90.0), (1, '1.00', 91.5), (2, '0.00', 60.0), (2, '1.00', 62.0),
+              (2, '2.00', 64.0), (3, '1.00', 80.0)]
+columnar.iter_query = lambda sql, params=None, chunk_size=None: iter(
+    [[{'strip_number': s_, 'position_mm': Decimal(p_), 'force_value': f_}
+      for s_, p_, f_ in col_points if params[0] == 9 or s_ < 3]])
+mat = columnar.load_matrix(9)
+npz_bytes, npz_type, _ = columnar.export_bytes('npz', [(9, mat)])
+with np.load(io.BytesIO(npz_bytes)) as z:
+    force = z['force']
+    check("npz 矩阵形状 [position, strip]", force.shape == (3, 3) and list(z['strip_number']) == [1, 2, 3]
+          and list(z['position_mm']) == [0.0, 1.0, 2.0], str(force.shape))
+    check("npz 数值对齐且缺失为 NaN", force[1, 0] == 91.5 and force[2, 1] == 64.0
+          and np.isnan(force[0, 2]) and np.isnan(force[2, 0]))
+multi = columnar.export_bytes('npz', [(9, mat), (4, columnar.load_matrix(4))])[0]
+with np.load(io.BytesIO(multi)) as z:
+    check("项目级 npz 按试验分组", list(z['test_ids']) == [9, 4] and z['test_4_force'].shape == (3, 2))
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pq.read_table(io.BytesIO(columnar.export_bytes('parquet', [(9, mat)])[0]))
+    check("parquet 宽表列", table.column_names == ['position_mm', 'strip_1', 'strip_2', 'strip_3']
+          and table.column('strip_3').to_pylist() == [None, 80.0, None])
+    with pa.ipc.open_file(io.BytesIO(columnar.export_bytes('arrow', [(9, mat), (4, mat)])[0])) as rd:
+        check("arrow 项目级含 test_id 列", rd.read_all().column('test_id').to_pylist() == [9] * 3 + [4] * 3)
+except ImportError:
+    print("  [SKIP] 未安装 pyarrow，跳过 parquet/arrow 校验")
+
+
+# 1j) 钻取曲线降采样：点数受控、首尾与缺陷低谷/峰值保留
+import math as _math
+from api._lib.downsample import downsample, lttb, minmax
+
+ds_x = [float(i) for i in range(20000)]
+ds_y = [90.0 + 3.0 * _math.sin(i / 50.0) for i in range(20000)]
+ds_y[12345] = 4.0       # 缺陷低谷
+ds_y[777] = 140.0       # 峰值
+t0 = _time.perf_counter()
+ds_lttb = lttb(ds_x, ds_y, 800)
+ds_cost = _time.perf_counter() - t0
+ds_mm = minmax(ds_x, ds_y, 800)
+check("LTTB 点数精确且首尾保留", len(ds_lttb) == 800 and ds_lttb[0] == 0 and ds_lttb[-1] == 19999
+      and ds_lttb == sorted(ds_lttb), f"{ds_cost * 1000:.1f} ms")
+check("LTTB 保留低谷与峰值", 12345 in ds_lttb and 777 in ds_lttb)
+check("min/max 包络保留极值且不超目标点数", 12345 in ds_mm and 777 in ds_mm and len(ds_mm) <= 800
+      and ds_mm == sorted(ds_mm), f"points={len(ds_mm)}")
+check("点数不足时原样返回", downsample([{'position_mm': 1, 'force_value': 2}] * 5, 'lttb', 800)
+      == [{'position_mm': 1, 'force_value': 2}] * 5)
+
+
+# 1k) 多分辨率金字塔：按区间选层，只读区间内的桶，未构建时即时聚合
+import api._lib.pyramid as pyramid
+
+check("全程选粗层、局部选细层", pyramid.choose_level(2800, 800) == 4 and pyramid.choose_level(500, 800) == 1
+      and pyramid.choose_level(1e7, 800) == pyramid.LEVELS_MM[-1])
+pyr_sql = []
+
+
+def pyr_query(sql, params=None, fetchone=False, fetchall=False):
+    s_ = ' '.join(sql.split())
+    pyr_sql.append((s_, params))
+    if 'strip_stats' in s_:
+        return {'max_position': 2800.0}
+    if 'FROM force_pyramid' in s_:
+        return [] if pyr_live else [{'bucket': b, 'min_force': 10, 'max_force': 99, 'mean_force': 80, 'n': 16}
+                                    for b in range(params[3], params[4] + 1)]
+    return [{'bucket': 25, 'min_force': 5, 'max_force': 90, 'mean_force': 70, 'n': 4}]
+
+
+pyramid.query = pyr_query
+pyr_live = False
+full = pyramid.pyramid_range(3, 7, max_points=100)
+check("全程 100 点取 64mm 层", full['level_mm'] == 64 and len(full['buckets']) <= 45
+      and full['extent'] == [0.0, 2800.0] and full['source'] == 'pyramid', str(full['level_mm']))
+zoom = pyramid.pyramid_range(3, 7, 100.0, 160.0, 100)
+check("缩放区间取 1mm 层且仅读区间桶", zoom['level_mm'] == 1 and pyr_sql[-1][1][3:5] == (100, 160)
+      and zoom['buckets'][0]['position_mm'] == 100)
+pyr_live = True
+live = pyramid.pyramid_range(3, 7, 100.0, 160.0, 20)
+check("未构建金字塔时即时聚合", live['source'] == 'live' and live['level_mm'] == 4
+      and 'FROM data_points' in pyr_sql[-1][0] and live['buckets'][0]['position_mm'] == 100)
+pyr_query_built = pyr_query
+pyramid.query = lambda sql, params=None, fetchone=False, fetchall=False: \
+    {'?column?': 1} if 'LIMIT 1' in sql else pyr_query_built(sql, params, fetchone, fetchall)
+pyr_sql.clear()
+gap = pyramid.pyramid_range(3, 7, 100.0, 160.0, 20)
+pyramid.query = pyr_query
+check("已构建金字塔的空区间不回退扫描", gap['source'] == 'pyramid' and gap['buckets'] == []
+      and not any('data_points' in q for q, _ in pyr_sql))
+
+
+# 1l) 热力图网格：由金字塔桶组装 [strip, bin]，瓦片按固定层级分块，二进制紧凑编码
+import struct as _struct
+import api._lib.heatmap as heatmap_mod
+
+hm_sql = []
+
+
+def hm_query(sql, params=None, fetchone=False, fetchall=False):
+    s_ = ' '.join(sql.split())
+    hm_sql.append((s_, params))
+    if 'FROM strip_stats' in s_:
+        return [{'strip_number': n, 'max_position': 2800.0} for n in (1, 2, 3)]
+    if 'FROM force_pyramid' in s_ and 'bucket BETWEEN' in s_:
+        lvl, b_lo = params[1], params[2]
+        return [{'strip_number': 2, 'bucket': b_lo + 1, 'v': 42.0},
+                {'strip_number': 3, 'bucket': b_lo, 'v': 1000.0}]
+    return None
+
+
+heatmap_mod.query = hm_query
+hm = heatmap_mod.heatmap(5, 'min', max_bins=100)
+check("概览网格形状与选层", hm['shape'] == [3, 44] and hm['level_mm'] == 64 and len(hm['grid']) == 3 * 44
+      and 'min_force' in hm_sql[-1][0], f"shape={hm['shape']} level={hm['level_mm']}")
+check("网格按 [strip, bin] 填值、缺失为 NaN", hm['grid'][1 * 44 + 1] == 42.0 and hm['grid'][2 * 44] == 1000.0
+      and _math.isnan(hm['grid'][0]))
+tile = heatmap_mod.heatmap(5, 'mean', level_mm=4, tile=2)
+check("瓦片按固定层级分块", tile['pos_from'] == 2 * heatmap_mod.TILE_BINS * 4 and tile['shape'] == [3, 256]
+      and tile['tile_count'] == 3 and hm_sql[-1][1][2] == 512)
+try:
+    heatmap_mod.heatmap(5, 'mean', level_mm=5, tile=0)
+    check("非法瓦片层级被拒绝", False)
+except ValueError as e:
+    check("非法瓦片层级被拒绝并列出可选层级", '1/4/16/64/256/1024' in str(e), str(e))
+hist_out.clear()
+hh._heatmap({'test_id': '5', 'tile': '0', 'level_mm': '5'})
+check("热力图非法 level_mm 返回 400", hist_out[-1][0] == 400 and '1/4/16' in hist_out[-1][1], str(hist_out[-1]))
+f32 = heatmap_mod.encode(hm['grid'], 'f32')
+u16 = _struct.unpack(f'<{len(hm["grid"])}H', heatmap_mod.encode(hm['grid'], 'u16'))
+check("f32/u16 二进制编码", len(f32) == 4 * 132 and u16[0] == heatmap_mod.U16_MISSING
+      and u16[2 * 44] == heatmap_mod.U16_MAX and abs(u16[45] / heatmap_mod.U16_MAX * 1000 - 42.0) < 0.02)
+
+
+# 1m) 单试验分析：一次往返取回条带累加量与直方图，已完成试验经两级结果缓存
+import json
+import api._lib.analysis as analysis_mod
+import api._lib.result_cache as result_cache
+
+rc_table, rc_sql = {}, []
+
+
+def rc_query(sql, params=None, fetchone=False, fetchall=False):
+    rc_sql.append('SELECT')
+    hit = rc_table.get(params[:3])
+    return {'payload': json.loads(hit[1])} if hit and hit[0] == params[3] else None
+
+
+def rc_execute(sql, params=None):
+    if sql.lstrip().startswith('INSERT'):
+        rc_table[params[:3]] = (params[3], params[4])
+    else:
+        for k in [k for k in rc_table if k[1] == params[0]]:
+            del rc_table[k]
+    return 1
+
+
+result_cache.query = rc_query
+result_cache.execute = rc_execute
+
+an_calls = []
+
+
+def an_query(sql, params=None, fetchone=False, fetchall=False):
+    an_calls.append(' '.join(sql.split()))
+    return {'strips': agg_rows, 'hist': [[15, 2], [17, 3], [0, 1], [25, 4]]}
+
+
+analysis_mod.query = an_query
+an = analysis_mod.test_analysis({'id': 7, 'status': 'running', 'end_time': None})
+check("单语句取回统计与直方图", len(an_calls) == 1 and 'strip_stats' in an_calls[0]
+      and 'width_bucket' in an_calls[0] and an['overall_stats']['total_points'] == 5)
+check("直方图与累积分布", an['histogram'][14]['count'] == 2 and an['histogram'][16]['count'] == 3
+      and an['cumulative'][-1]['cum_pct'] == 50.0 and an['pass_pie'] == {'pass': 1, 'fail': 1})
+done = {'id': 7, 'status': 'completed', 'end_time': 'T1'}
+analysis_mod.test_analysis(done)
+analysis_mod.test_analysis(done)
+check("已完成试验命中一级缓存", len(an_calls) == 2 and len(rc_sql) == 1, f"calls={len(an_calls)}")
+result_cache._local.clear()     # 模拟另一实例：一级未命中，二级命中且不再计算
+cold = analysis_mod.test_analysis(done)
+check("二级缓存命中不访问 data_points", len(an_calls) == 2 and len(rc_sql) == 2
+      and cold['overall_stats'] == an['overall_stats'])
+analysis_mod.test_analysis({**done, 'end_time': 'T2'})
+analysis_mod.test_analysis({'id': 7, 'status': 'running', 'end_time': None})
+check("重新完成或运行中不走缓存", len(an_calls) == 4)
+result_cache.invalidate(7)
+analysis_mod.test_analysis({**done, 'end_time': 'T2'})
+check("重启试验清除两级缓存后重新计算", len(an_calls) == 5 and list(rc_table) == [('analysis', 7, 70.0)])
+
+
+# 1n) 跨试验数据集视图：直方图与合格饼图对 test_rollup 汇总行求和
+ds_sql = []
+ds_params = []
+
+
+def ds_query(sql, params=None, fetchone=False, fetchall=False):
+    s_ = ' '.join(sql.split())
+    ds_sql.append(s_)
+    ds_params.append(params)
+    if 'generate_series' in s_:
+        return [{'bucket': b, 'count': 10 * b} for b in range(26)]
+    if 'pass_pts' in s_:
+        return {'pass_pts': 900, 'fail_pts': 100}
+    return []
+
+
+data_api.query = ds_query
+hh._dataset({'project_id': '2', 'threshold': '65.5'})
+ds_body = hist_out[-1][1]
+check("数据集视图不扫描 data_points", not any('data_points' in q for q in ds_sql)
+      and sum('test_rollup' in q for q in ds_sql) == 4)
+check("数据集按请求阈值取细直方图后缀和", ds_body['threshold'] == 65.5
+      and ds_params[-1] == [657, '2'] and 'fine_hist[657:]' in ds_sql[0], str(ds_params[-1]))
+check("汇总直方图与合格饼图", ds_body['histogram'][0]['count'] == 10 and len(ds_body['histogram']) == 24
+      and ds_body['pass_pie'] == {'pass': 900, 'fail': 100})
+ds_sql.clear()
+ds_params.clear()
+hh._dataset({'threshold': '65.25'})
+check("非网格阈值回退逐试验扫描而非 400", hist_out[-1][0] == 200 and hist_out[-1][1]['threshold'] == 65.25
+      and 'd.force_value >= 65.25' in ds_sql[0] and ds_params[-1] == [65.25]
+      and 'fine_hist' not in ds_sql[-1], str(hist_out[-1][0]))
+
+
+# 1o) 可配置合格阈值：请求参数 > 系统设置，细直方图后缀和 / 回退扫描
+aggregates.reset_configured_threshold()
+aggregates.query = lambda sql, params=None, fetchone=False, fetchall=False: {'setting_value': '65'}
+check("系统设置阈值生效", aggregates.get_threshold() == 65.0 and aggregates.get_threshold('72.5') == 72.5)
+aggregates.query = lambda sql, params=None, fetchone=False, fetchall=False: {'setting_value': '80'}
+check("设置阈值进程内缓存", aggregates.get_threshold() == 65.0)
+aggregates.reset_configured_threshold()
+check("更新设置后重新读取", aggregates.get_threshold() == 80.0)
+for bad in ('0', '-5', '1e9', 'abc'):
+    try:
+        aggregates.get_threshold(bad)
+        check(f"非法阈值 {bad} 被拒绝", False)
+    except ValueError:
+        pass
+for bad in ('65.25', '250', '0', 'abc', None):
+    try:
+        aggregates.validate_threshold_setting(bad)
+        check(f"非法阈值设置 {bad} 被拒绝", False)
+    except ValueError:
+        pass
+check("合法阈值设置", aggregates.validate_threshold_setting('65.5') == 65.5
+      and aggregates.validate_threshold_setting(200) == 200.0)
+check("阈值桶号", aggregates.threshold_bucket(70.0) == 700 and aggregates.threshold_bucket(65.5) == 655
+      and aggregates.threshold_bucket(65.55) is None and aggregates.threshold_bucket(500.0) is None)
+
+pp_sql = []
+
+
+def pp_query(sql, params=None, fetchone=False, fetchall=False):
+    pp_sql.append((' '.join(sql.split()), params))
+    if 'test_rollup' in sql:
+        return {'pass_pts': 123} if params[1] == 1 else None
+    return {'pass_pts': 45}
+
+
+aggregates.query = pp_query
+check("合格点数取自细直方图后缀和", aggregates.pass_points(1, 65.5) == 123
+      and pp_sql[-1][1] == (657, 1) and 'data_points' not in pp_sql[-1][0])
+check("无汇总行回退扫描", aggregates.pass_points(2, 65.5) == 45 and 'data_points' in pp_sql[-1][0])
+check("非网格阈值直接扫描", aggregates.pass_points(1, 65.55) == 45 and len(pp_sql) == 4)
+check("默认阈值沿用 pass_count", aggregates.test_pass_points(1, 70) is None and len(pp_sql) == 4)
+
+
+def ts_query(sql, params=None, fetchone=False, fetchall=False):
+    if 'strip_stats' in sql:
+        return [dict(r, test_id=t) for t in (5, 6) for r in agg_rows]
+    if 'test_rollup' in sql:
+        return [{'test_id': 5, 'pass_pts': 2}] if fetchall else None
+    return {'pass_pts': 1}
+
+
+aggregates.query = ts_query
+ts_default = aggregates.test_summaries([5, 6])
+ts_custom = aggregates.test_summaries([5, 6], 65.5)
+check("批量汇总与单试验一致", ts_default[5] == ts_default[6] == (agg_strips, agg_overall))
+check("批量合格点数：汇总行 + 缺失回退", ts_custom[5][1]['pass_rate'] == 40.0
+      and ts_custom[6][1]['pass_rate'] == 20.0, str(ts_custom[6][1]))
+
 
 # 2) Word 报告生成（monkeypatch 数据库）
 import api.reports as reports
@@ -121,6 +855,8 @@ def fake_query(sql, params=None, fetchone=False, fetchall=False):
 
 
 reports.query = fake_query
+reports.test_summary = lambda tid, threshold=None: (FAKE_STRIPS, FAKE_OVERALL)
+reports.chart_data = lambda tid, strips: None
 content, fname = reports._build_report(1)
 check("生成 .docx 字节流", content is not None and len(content) > 2000, f"bytes={len(content) if content else 0}")
 check("docx 为合法 zip(OOXML)", content[:2] == b'PK')
@@ -135,6 +871,440 @@ except Exception as e:
     check("docx 可被重新解析", False, str(e))
 
 
+# 2b) 项目报告 zip：分块传输流式写出，逐份生成即发送
+zip_built = []
+
+
+def zip_render(test_ids, threshold=70.0):
+    for tid in test_ids:
+        zip_built.append(tid)
+        yield {'id': tid}, content, f'report_UT-{tid}.docx'
+
+
+reports.query = lambda sql, params=None, fetchone=False, fetchall=False: \
+    [{'id': 11, 'project_id': 2}, {'id': 12, 'project_id': 2}, {'id': 13, 'project_id': 2}] \
+    if 'project_id' in sql else None
+reports.render_reports = zip_render
+srv = ThreadingHTTPServer(('127.0.0.1', 0), reports.handler)
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+with urllib.request.urlopen(f'http://127.0.0.1:{srv.server_address[1]}/api/reports'
+                            f'?action=project&project_id=2&threshold=70', timeout=5) as resp:
+    zip_te = resp.headers.get('Transfer-Encoding', '')
+    zip_len = resp.headers.get('Content-Length')
+    zip_bytes = resp.read()
+srv.shutdown()
+with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+    zip_names = zf.namelist()
+    zip_ok = zf.testzip() is None and zf.read('report_UT-12.docx') == content
+check("项目 zip 分块传输且无 Content-Length", zip_te == 'chunked' and zip_len is None, zip_te)
+check("流式 zip 可解压且含全部报告", zip_ok and zip_built == [11, 12, 13]
+      and zip_names == ['report_UT-11.docx', 'report_UT-12.docx', 'report_UT-13.docx'], str(zip_names))
+
+chunk_out = io.BytesIO()
+cw = reports._ChunkedWriter(chunk_out, chunk_bytes=4)
+cw.write(b'ab')
+check("分块缓冲未满不写出", chunk_out.getvalue() == b'')
+cw.write(b'cdef')
+cw.finish()
+check("分块帧格式", chunk_out.getvalue() == b'6\r\nabcdef\r\n0\r\n\r\n')
+
+
+
+def fake_stream_handler(module):
+    h = module.handler.__new__(module.handler)
+    h.wfile, h.request_version = io.BytesIO(), 'HTTP/1.1'
+    h.send_response = h.send_header = lambda *a: None
+    h.end_headers = lambda: None
+    return h
+
+
+zh = fake_stream_handler(reports)
+saved_wpz = reports.write_project_zip
+reports.write_project_zip = lambda out, tests, threshold: (out.write(b'PK'), out.flush(),
+                                                           (_ for _ in ()).throw(RuntimeError('docx boom')))
+zip_err = io.StringIO()
+with contextlib.redirect_stderr(zip_err):
+    zh._send_zip_stream([{'id': 1}], 70.0, 'r.zip')
+reports.write_project_zip = saved_wpz
+check("zip 中途失败记录异常且不写结束块", 'docx boom' in zip_err.getvalue() and 'Traceback' in zip_err.getvalue()
+      and not zh.wfile.getvalue().endswith(b'0\r\n\r\n'))
+
+
+# 2c) 批量取数 + 进程池并行渲染
+import importlib
+importlib.reload(reports)
+reports.chart_data = lambda tid, strips: None
+reports.chart_data_many = lambda items: {}
+rr_sql = []
+
+
+def rr_query(sql, params=None, fetchone=False, fetchall=False):
+    rr_sql.append(' '.join(sql.split()))
+    return [dict(FAKE_TEST, id=i, test_number=f'UT-{i:03d}', project_id=1 + i % 2)
+            for i in params[0] if i != 99]
+
+
+reports.query = rr_query
+reports.test_summaries = lambda ids, threshold=70.0: {i: (FAKE_STRIPS, FAKE_OVERALL) for i in ids}
+rr_jobs = reports.fetch_reports([3, 99, 1, 2])
+check("批量取数一次查询且保持顺序", len(rr_sql) == 1 and 'ANY' in rr_sql[0]
+      and [j[0]['id'] for j in rr_jobs] == [3, 1, 2])
+check("批量取数不读取回放模板 profiles", 't.*' not in rr_sql[0] and 'profiles' not in rr_sql[0])
+reports.REPORT_WORKERS = 2
+rr_parallel = list(reports.render_reports([1, 2, 3, 4, 5]))
+check("进程池已启用", reports._executor() is not None)
+reports._executor().shutdown()
+reports._pool, reports.REPORT_WORKERS = False, 1
+rr_serial = list(reports.render_reports([1, 2, 3, 4, 5]))
+check("并行渲染与串行结果一致（顺序/文件名）",
+      [(t['id'], f) for t, _, f in rr_parallel] == [(t['id'], f) for t, _, f in rr_serial]
+      and all(c[:2] == b'PK' and len(c) > 2000 for _, c, _ in rr_parallel),
+      str([f for _, _, f in rr_parallel]))
+rr_zip = io.BytesIO()
+reports.write_project_zip(rr_zip, [{'id': 1, 'project_id': 2}, {'id': 2, 'project_id': 1}])
+with zipfile.ZipFile(rr_zip) as zf:
+    check("多项目 zip 按项目分目录", zf.namelist() == ['project_2/report_UT-001.docx',
+                                                'project_1/report_UT-002.docx'], str(zf.namelist()))
+
+
+# 2d) 报告内容寻址缓存：键随数据版本/阈值/模板变化，命中跳过渲染
+import datetime as _dt
+import api._lib.report_cache as report_cache
+
+done_test = dict(FAKE_TEST, end_time=_dt.datetime(2026, 1, 2, 3, 4, 5))
+k1 = report_cache.report_key(done_test, 70.0, 1)
+check("未完成试验不缓存", report_cache.report_key(FAKE_TEST, 70.0, 1) is None)
+check("键随阈值/模板/数据版本/信息变化", len({
+    k1, report_cache.report_key(done_test, 65.0, 1), report_cache.report_key(done_test, 70.0, 2),
+    report_cache.report_key(dict(done_test, end_time=_dt.datetime(2026, 1, 3)), 70.0, 1),
+    report_cache.report_key(dict(done_test, operator='X'), 70.0, 1)}) == 5
+    and k1 == report_cache.report_key(dict(done_test), 70, 1))
+check("键只取报告所列信息列（不序列化 profiles）",
+      k1 == report_cache.report_key(dict(done_test, profiles={'strips': [[1.0] * 1000]}), 70.0, 1))
+
+rc_store = {}
+rc_sql = []
+
+
+def rc_query(sql, params=None, fetchone=False, fetchall=False):
+    s_ = ' '.join(sql.split())
+    rc_sql.append(s_)
+    if 'UPDATE report_cache' in s_:
+        hit = rc_store.get(params[0])
+        return {'content': memoryview(hit[0]), 'filename': hit[1]} if hit else None
+    if 'FROM report_cache' in s_:
+        return [{'cache_key': k} for k in params[0] if k in rc_store]
+    return None
+
+
+def rc_execute(sql, params=None):
+    s_ = ' '.join(sql.split())
+    rc_sql.append(s_)
+    if s_.startswith('INSERT INTO report_cache'):
+        rc_store[params[0]] = (bytes(params[3]), params[2])
+
+
+report_cache.query, report_cache.execute = rc_query, rc_execute
+rc_renders = []
+real_render = reports.render_report
+
+
+def counting_render(test, strips, overall, charts=None, threshold=70.0):
+    rc_renders.append(test['id'])
+    return real_render(test, strips, overall, charts, threshold)
+
+
+reports.render_report = counting_render
+reports.query = lambda sql, params=None, fetchone=False, fetchall=False: \
+    done_test if fetchone else [dict(done_test, id=i) for i in params[0]]
+reports.cached = lambda endpoint, test, threshold, compute: compute()
+reports.test_summary = lambda tid, threshold=None: (FAKE_STRIPS, FAKE_OVERALL)
+first, _ = reports._build_report(1)
+again, _ = reports._build_report(1)
+check("单份报告二次下载命中缓存", rc_renders == [1] and again == first)
+check("写入后按累计字节数淘汰", any('SUM(size_bytes) OVER' in q for q in rc_sql))
+rc_renders.clear()
+rc_out = list(reports.render_reports([1, 2, 3]))
+check("项目导出复用已缓存报告", rc_renders == [2, 3] and rc_out[0][1] == first
+      and [t['id'] for t, _, _ in rc_out] == [1, 2, 3])
+rc_renders.clear()
+list(reports.render_reports([1, 2, 3]))
+check("再次导出全部命中", rc_renders == [])
+
+
+# 2e) 报告内嵌图：降采样数据取数 + 复用预设样式 Figure 绘图
+import api._lib.report_charts as report_charts
+
+if report_charts.AVAILABLE:
+    fine = [0] * (report_charts.FINE_HIST_BINS + 2)
+    fine[0], fine[1], fine[20], fine[21], fine[2001] = 1, 2, 3, 4, 5
+    report_charts.query = lambda sql, params=None, fetchone=False, fetchall=False: {'fine_hist': fine}
+    hc = report_charts._hist_counts(1)
+    check("细直方图合并为 2 N 分桶（含越界）", len(hc) == 100 and hc[0] == 6 and hc[1] == 4
+          and hc[-1] == 5 and sum(hc) == 15, str(hc[:3]))
+    report_charts.pyramid_range = lambda tid, strip, max_points=None: {
+        'level_mm': 4, 'buckets': [{'position_mm': 4 * i, 'min_force': 60.0 + i % 7, 'mean_force': 80.0,
+                                    'max_force': 95.0 - i % 5, 'n': 4} for i in range(150)]}
+    report_charts.heatmap = lambda tid, agg, max_bins=None: {
+        'grid': [float('nan') if (i * 7) % 11 == 0 else 40.0 + i % 60 for i in range(3 * 150)],
+        'shape': [3, 150], 'pos_from': 0, 'pos_to': 600, 'strips': [1, 2, 3]}
+    cd = report_charts.chart_data(1, FAKE_STRIPS)
+    check("图数据取最弱条带且可 pickle", cd['strip_number'] == 2 and len(cd['curve']) == 150
+          and len(pickle.dumps(cd)) > 0)
+    charts_a = report_charts.render_charts(cd, 70.0)
+    figs_a = {k: id(v[0]) for k, v in report_charts._figures.items()}
+    charts_b = report_charts.render_charts(cd, 65.0)
+    check("三幅 PNG", [c[1][:4] for c in charts_a] == [b'\x89PNG'] * 3, str([c[0] for c in charts_a]))
+    check("Figure 复用而非重建", figs_a == {k: id(v[0]) for k, v in report_charts._figures.items()}
+          and len(figs_a) == 3 and charts_a[2][1] != charts_b[2][1])
+    chart_doc, _ = reports.render_report(FAKE_TEST, FAKE_STRIPS, FAKE_OVERALL, cd, 70.0)
+    check("报告内嵌三幅图", len(Document(io.BytesIO(chart_doc)).inline_shapes) == 3)
+    check("字体可用性计入模板版本", reports.REPORT_TEMPLATE.endswith('+charts-' + report_charts.FONT_TAG)
+          and report_charts.L is report_charts.LABELS[report_charts.FONT_TAG], reports.REPORT_TEMPLATE)
+    titles = [t.get_text() for f, _ in report_charts._figures.values() for t in f.findobj(
+        lambda o: hasattr(o, 'get_text'))]
+    check("无中文字体时图内文字为英文", report_charts.CJK_FONT is not None
+          or all(t.isascii() for t in titles), str([t for t in titles if not t.isascii()][:3]))
+
+    # 批量取数与逐份取数同形；试验 1 已构建金字塔与汇总，试验 2 未构建（回退逐份即时聚合）
+    import api._lib.heatmap as heatmap_mod
+    import api._lib.pyramid as pyramid_mod
+    importlib.reload(report_charts)
+    cm_stroke = {1: {1: 900.0, 2: 1000.0, 3: 950.0}, 2: {1: 300.0, 2: 320.0}}
+    cm_sql = []
+
+    def cm_buckets(tid, strip, level, b_hi):
+        if tid != 1:
+            return []
+        return [{'test_id': tid, 'strip_number': strip, 'bucket': b, 'v': 50.0 + strip + b % 10,
+                 'mean_force': 50.0 + strip + b % 10, 'min_force': 45.0 + strip, 'max_force': 65.0 + strip,
+                 'n': level} for b in range(min(b_hi, int(cm_stroke[tid][strip] // level)) + 1)]
+
+    def cm_query(sql, params=None, fetchone=False, fetchall=False):
+        s_ = ' '.join(sql.split())
+        cm_sql.append((s_, params))
+        if 'FROM strip_stats' in s_:
+            if 'ANY' in s_:
+                return [{'test_id': t, 'strip_number': k, 'max_position': v}
+                        for t in params[0] for k, v in cm_stroke[t].items()]
+            ext = cm_stroke[params[0]]
+            if 'strip_number = %s' in s_:
+                return {'max_position': ext.get(params[1])}
+            return [{'strip_number': k, 'max_position': v} for k, v in ext.items()]
+        if 'unnest' in s_ and 'strip_number = q.strip_number' in s_:
+            return [r for t, k, lv, hi in zip(*params) for r in cm_buckets(t, k, lv, hi)]
+        if 'unnest' in s_:
+            return [r for t, lv, hi in zip(*params) for k in cm_stroke[t] for r in cm_buckets(t, k, lv, hi)]
+        if 'SELECT 1 FROM force_pyramid' in s_:
+            return {'?column?': 1} if params[0] == 1 else None
+        if 'FROM force_pyramid' in s_ and 'strip_number = %s' in s_:
+            return cm_buckets(params[0], params[1], params[2], params[4])
+        if 'FROM force_pyramid' in s_:
+            return [r for k in cm_stroke[params[0]] for r in cm_buckets(params[0], k, params[1], params[3])]
+        if 'FROM test_rollup' in s_:
+            fine = [3] * (report_charts.FINE_HIST_BINS + 2)
+            return [{'test_id': 1, 'fine_hist': fine}] if 'ANY' in s_ else (
+                {'fine_hist': fine} if params[0] == 1 else None)
+        return []
+
+    report_charts.query = pyramid_mod.query = heatmap_mod.query = cm_query
+    cm_items = [(1, FAKE_STRIPS), (2, FAKE_STRIPS[:2])]
+    cm_single = {t: report_charts.chart_data(t, strips) for t, strips in cm_items}
+    cm_sql.clear()
+    cm_many = report_charts.chart_data_many(cm_items)
+
+    def cm_norm(d):
+        return pickle.dumps({**d, 'heatmap': dict(d['heatmap'], grid=[
+            None if v != v else v for v in d['heatmap']['grid']])})
+
+    check("批量图数据与逐份取数一致", cm_many.keys() == cm_single.keys()
+          and all(cm_norm(cm_many[t]) == cm_norm(cm_single[t]) for t in cm_many)
+          and len(cm_many[1]['curve']) > 100 and cm_many[1]['heatmap']['shape'][0] == 3)
+    cm_batch = [q for q, _ in cm_sql if 'ANY' in q or 'unnest' in q]
+    cm_rest = [q for q, _ in cm_sql if q not in cm_batch]
+    cm_sql.clear()
+    report_charts.chart_data(2, FAKE_STRIPS[:2])
+    check("批量取数 4 次查询，仅未构建金字塔的试验逐份查询", len(cm_batch) == 4
+          and cm_rest == [q for q, _ in cm_sql], f"{len(cm_batch)} + {len(cm_rest)}")
+else:
+    check("未安装 matplotlib 时报告不含图", report_charts.render_charts({'curve': []}, 70.0) == [])
+    check("未安装 matplotlib 时不取图数据", report_charts.chart_data_many([(1, FAKE_STRIPS)]) == {})
+
+
+# 2f) 报告异步任务：范围解析、去重键、领取构建与进度
+import api._lib.report_jobs as report_jobs
+
+rj_sql = []
+rj_tests = [{'id': 4, 'project_id': 1, 'status': 'completed', 'end_time': _dt.datetime(2026, 3, 1)},
+            {'id': 7, 'project_id': 2, 'status': 'completed', 'end_time': _dt.datetime(2026, 3, 2)}]
+
+
+def rj_query(sql, params=None, fetchone=False, fetchall=False):
+    rj_sql.append((' '.join(sql.split()), params))
+    if 'FROM tests t' in sql:
+        return rj_tests
+    if 'INSERT INTO report_jobs' in sql:
+        return {'id': 1, 'scope': params[1], 'status': 'queued', 'done': 0, 'total': params[5],
+                'filename': params[6], 'created': True}
+    return None
+
+
+report_jobs.query = rj_query
+_, fn = report_jobs.resolve_tests('range', {'date_from': '2026-03-01', 'date_to': '2026-03-02',
+                                            'project_id': '1,2'})
+check("日期区间含结束日且可按项目过滤", fn == 'reports_20260301_20260302.zip'
+      and rj_sql[-1][1] == [_dt.date(2026, 3, 1), _dt.date(2026, 3, 3), [1, 2]]
+      and "status = 'completed'" in rj_sql[-1][0])
+for scope, bad in (('range', {'date_from': '2026/3/1'}), ('project', {}), ('nope', {}),
+                   ('range', {'date_from': '2026-03-02', 'date_to': '2026-03-01'})):
+    try:
+        report_jobs.resolve_tests(scope, bad)
+        check(f"非法导出参数 {scope} {bad} 被拒绝", False)
+    except ValueError:
+        pass
+rk = report_jobs.job_key(rj_tests, 70.0, '2', 'zip')
+check("任务键随阈值/产物类型/数据版本变化且可复现",
+      rk == report_jobs.job_key([dict(t) for t in rj_tests], 70, '2', 'zip')
+      and len({rk, report_jobs.job_key(rj_tests, 65.0, '2', 'zip'),
+               report_jobs.job_key(rj_tests, 70.0, '2', 'docx'),
+               report_jobs.job_key([rj_tests[0], dict(rj_tests[1], end_time=_dt.datetime(2026, 4, 1))],
+                                   70.0, '2', 'zip')}) == 4)
+rj_exec = []
+report_jobs.execute = lambda sql, params=None: rj_exec.append((' '.join(sql.split()), params))
+rj_job = report_jobs.submit('project', {'project_id': '1,2', 'threshold': 70}, 70.0, '2', user_id=3)
+check("提交前将排队超时任务标记失败", "status = 'failed'" in rj_exec[-1][0]
+      and "status = 'queued' AND created_at <" in rj_exec[-1][0]
+      and rj_exec[-1][1] == (report_jobs.JOB_QUEUE_TTL_SECONDS,))
+ins = [q for q in rj_sql if 'INSERT INTO report_jobs' in q[0]][-1]
+check("提交任务：ON CONFLICT 去重、失败任务重新排队", rj_job['total'] == 2
+      and 'ON CONFLICT (job_key)' in ins[0] and "WHEN report_jobs.status = 'failed' THEN 'queued'" in ins[0]
+      and ins[1][0] == rk and json.loads(ins[1][3]) == [{'id': 4, 'project_id': 1}, {'id': 7, 'project_id': 2}]
+      and 'threshold' not in json.loads(ins[1][2]))
+rj_tests_saved, rj_tests = rj_tests, []
+try:
+    report_jobs.submit('project', {'project_id': '9'}, 70.0, '2')
+    check("无已完成试验时提交失败", False)
+except LookupError:
+    pass
+rj_tests = rj_tests_saved
+
+rj_exec.clear()
+rj_tx = []
+
+
+@contextlib.contextmanager
+def rj_transaction():
+    rj_tx.append(len(rj_exec))
+    yield
+    rj_tx.append(len(rj_exec))
+
+
+report_jobs.transaction = rj_transaction
+report_jobs.JOB_CHUNK_BYTES = 100
+reports.render_reports = lambda ids, threshold=70.0: iter(
+    [({'id': i, 'project_id': 1 + i % 2}, b'docx-%d' % i * 40, f'report_{i}.docx') for i in ids])
+ok = report_jobs.run_job({'id': 5, 'scope': 'project', 'threshold': 70.0, 'filename': 'r.zip',
+                          'tests': [{'id': 4, 'project_id': 1}, {'id': 7, 'project_id': 2}]})
+progress = [p[1][0] for p in rj_exec if p[0].startswith('UPDATE report_jobs SET done')]
+final = rj_exec[-1]
+rj_chunks = [p for q, p in rj_exec if q.startswith('INSERT INTO report_job_chunks')]
+rj_blob = b''.join(p[2] for p in rj_chunks)
+with zipfile.ZipFile(io.BytesIO(rj_blob)) as zf:
+    check("任务构建 zip 并逐份上报进度", ok and progress == [1, 2] and "status = 'done'" in final[0]
+          and zf.namelist() == ['project_1/report_4.docx', 'project_2/report_7.docx']
+          and final[1] == (len(rj_blob), 'r.zip', 5), str(progress))
+check("产物分块写入且与完成状态同一事务", len(rj_chunks) > 2
+      and [p[:2] for p in rj_chunks] == [(5, i) for i in range(len(rj_chunks))]
+      and all(len(p[2]) <= 100 for p in rj_chunks)
+      and rj_exec[rj_tx[0]][0].startswith('DELETE FROM report_job_chunks') and rj_tx[1] == len(rj_exec))
+report_jobs.JOB_CHUNK_BYTES = 4 * 1024 * 1024
+
+rj_store = {(5, i): p[2] for i, p in enumerate(rj_chunks)}
+
+
+def rj_artifact_query(sql, params=None, fetchone=False, fetchall=False):
+    if 'FROM report_jobs' in sql:
+        return {'filename': 'r.zip', 'size_bytes': len(rj_blob)} if params == (5,) else None
+    data = rj_store.get(params)
+    return {'data': memoryview(data)} if data else None
+
+
+report_jobs.query = rj_artifact_query
+rj_art = report_jobs.job_artifact('5')
+check("产物逐块读出", report_jobs.job_artifact(6) is None and rj_art[1:] == ('r.zip', len(rj_blob))
+      and b''.join(rj_art[0]) == rj_blob)
+reports.render_reports = lambda ids, threshold=70.0: iter([(_ for _ in ()).throw(RuntimeError('boom'))])
+ok = report_jobs.run_job({'id': 6, 'scope': 'project', 'threshold': 70.0, 'filename': 'r.zip',
+                          'tests': [{'id': 4, 'project_id': 1}]})
+check("构建失败记录错误", not ok and "status = 'failed'" in rj_exec[-1][0] and rj_exec[-1][1] == ('boom', 6))
+
+rj_exec.clear()
+report_jobs._beat()
+check("非工作进程不写心跳", rj_exec == [])
+report_jobs._worker['id'] = 'host:1'
+report_jobs._beat(force=True)
+report_jobs._beat()
+report_jobs._worker.update(id=None, beat=0.0)
+check("工作进程心跳节流写入", len(rj_exec) == 1 and 'INSERT INTO report_workers' in rj_exec[0][0])
+report_jobs.query = lambda sql, params=None, fetchone=False, fetchall=False: \
+    {'alive': 'report_workers' in sql and params == (report_jobs.WORKER_STALE_SECONDS,)}
+check("按心跳判断工作进程存活", report_jobs.worker_alive() is True)
+
+reports.worker_alive = lambda: False
+srv = ThreadingHTTPServer(('127.0.0.1', 0), reports.handler)
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+try:
+    urllib.request.urlopen(urllib.request.Request(
+        f'http://127.0.0.1:{srv.server_address[1]}/api/reports?action=jobs',
+        data=b'{"scope": "project", "project_id": "1"}', method='POST'), timeout=5)
+    job_post_status = 200
+except urllib.error.HTTPError as e:
+    job_post_status = e.code
+srv.shutdown()
+check("无存活工作进程时拒绝提交任务", job_post_status == 503, str(job_post_status))
+
+
+
+# 3) analysis 数据集 CSV 读取：纯数值文件走 numpy 向量化路径，结果与逐单元格解析一致
+import tempfile
+
+import numpy as np
+
+from analysis import dataset as ds_mod
+
+csv_cases = {
+    '规整': '1.5,2,3\n4,5,6.25\n',
+    '行尾空单元格与空行': '\ufeff1,2,\r\n3,4,\r\n\r\n,,\n5,6\n',
+    '行宽不齐截断到最短行': '1,2,3\n4,5\n6,7,8,9\n',
+    'nan/inf/科学计数': 'nan,inf\n-1e3,+2\n',
+    '单列': '5\n6\n7\n',
+}
+fallback_cases = {
+    '表头': 'a,b\n1,2\n',
+    '引号': '"1",2\n3,4\n',
+    '中间空单元格': '1,,3\n4,5,6\n',
+    '空白单元格': '1, ,3\n4,5,6\n',
+    '下划线数字': '1_0,2\n3,4\n',
+}
+with tempfile.TemporaryDirectory() as tmp:
+    results = {}
+    for name, text in {**csv_cases, **fallback_cases}.items():
+        path = os.path.join(tmp, 'sample.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        results[name] = ds_mod.load_sample(path)
+for name, text in csv_cases.items():
+    fast = ds_mod._parse_fast(text.lstrip('\ufeff'))
+    legacy = ds_mod._parse_cells(text.lstrip('\ufeff'))
+    check(f"向量化解析与逐单元格一致：{name}", fast is not None and fast.shape == legacy.shape
+          and np.array_equal(fast, legacy, equal_nan=True)
+          and np.array_equal(results[name], legacy, equal_nan=True), str(legacy.shape))
+for name, text in fallback_cases.items():
+    check(f"非纯数值文件回退逐单元格解析：{name}", ds_mod._parse_fast(text) is None
+          and np.array_equal(results[name], ds_mod._parse_cells(text), equal_nan=True))
+check("行宽不齐按最短行截断", results['行宽不齐截断到最短行'].tolist() == [[1, 2], [4, 5], [6, 7]])
+check("空文件返回 0×0", ds_mod._parse_fast('\n\n').shape == (0, 0))
+
 print("\n" + "=" * 50)
 if failures:
     print("离线单元测试失败:", failures)